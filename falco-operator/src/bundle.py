@@ -0,0 +1,130 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Custom config bundle module.
+
+With the leader distribution of the custom config repository, only the leader unit fetches the
+repository. It packs the custom rules and config files into a compressed bundle, addressed by the
+digest of its content, and publishes it to the other units through the peer relation. The other
+units verify the bundle against its digest before unpacking it.
+"""
+
+import base64
+import binascii
+import gzip
+import hashlib
+import io
+import logging
+import shutil
+import tarfile
+import tempfile
+from pathlib import Path
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Largest compressed bundle published through the peer relation data
+MAX_BUNDLE_SIZE = 1024 * 1024
+
+# File recording the digest of the bundle unpacked in a directory
+DIGEST_FILE_NAME = ".bundle-digest"
+
+
+class BundleError(Exception):
+    """Exception raised when a bundle cannot be packed or unpacked."""
+
+
+class CustomConfigBundle(BaseModel):
+    """The pydantic model for a custom config bundle.
+
+    Attributes:
+        digest: The SHA-256 hex digest of the compressed bundle.
+        data: The base64 encoded gzip compressed tarball.
+    """
+
+    digest: str
+    data: str
+
+
+def pack(source: Path, keys: tuple[str, ...]) -> CustomConfigBundle:
+    """Pack the custom settings directories of a checkout into a bundle.
+
+    The tarball is reproducible: its members are sorted and carry no owner nor timestamp, so the
+    same files always give the same digest.
+
+    Args:
+        source (Path): The directory holding the custom settings
+        keys (tuple[str, ...]): The custom settings directory names
+
+    Returns:
+        The bundle.
+
+    Raises:
+        BundleError: If the bundle is larger than the peer relation data allows
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for key in keys:
+            directory = source / key
+            if not directory.is_dir():
+                continue
+            for path in sorted(directory.rglob("*")):
+                if path.is_symlink() or not (path.is_file() or path.is_dir()):
+                    continue
+                info = tar.gettarinfo(str(path), arcname=str(path.relative_to(source)))
+                info.uid = info.gid = 0
+                info.uname = info.gname = ""
+                info.mtime = 0
+                info.mode = 0o755 if path.is_dir() else 0o644
+                if path.is_file():
+                    with path.open("rb") as file:
+                        tar.addfile(info, file)
+                else:
+                    tar.addfile(info)
+    data = gzip.compress(buffer.getvalue(), mtime=0)
+    if len(data) > MAX_BUNDLE_SIZE:
+        raise BundleError(f"Bundle of {len(data)} bytes is larger than {MAX_BUNDLE_SIZE} bytes")
+    return CustomConfigBundle(
+        digest=hashlib.sha256(data).hexdigest(), data=base64.b64encode(data).decode()
+    )
+
+
+def unpack(bundle: CustomConfigBundle, destination: Path) -> bool:
+    """Verify a bundle and unpack it into a directory, replacing its content.
+
+    Args:
+        bundle (CustomConfigBundle): The bundle
+        destination (Path): The directory to unpack the bundle into
+
+    Returns:
+        True if the bundle has been unpacked, False if it already was.
+
+    Raises:
+        BundleError: If the bundle does not match its digest or is not a valid tarball
+    """
+    digest_file = destination / DIGEST_FILE_NAME
+    if digest_file.is_file() and digest_file.read_text(encoding="utf-8") == bundle.digest:
+        logger.debug("Bundle %s already unpacked", bundle.digest)
+        return False
+
+    try:
+        data = base64.b64decode(bundle.data, validate=True)
+    except binascii.Error as e:
+        raise BundleError("Bundle is not base64 encoded") from e
+    if hashlib.sha256(data).hexdigest() != bundle.digest:
+        raise BundleError(f"Bundle does not match its digest {bundle.digest}")
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=destination.parent, prefix=f".{destination.name}."))
+    try:
+        with tarfile.open(fileobj=io.BytesIO(gzip.decompress(data)), mode="r") as tar:
+            tar.extractall(staging, filter="data")
+        (staging / DIGEST_FILE_NAME).write_text(bundle.digest, encoding="utf-8")
+    except (OSError, EOFError, tarfile.TarError) as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise BundleError("Bundle is not a valid tarball") from e
+    shutil.rmtree(destination, ignore_errors=True)
+    staging.rename(destination)
+    logger.info("Bundle %s unpacked", bundle.digest)
+    return True
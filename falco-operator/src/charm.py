@@ -5,28 +5,54 @@
 
 """Falco subordinate charm."""
 
+import json
 import logging
 import typing
 
 import ops
 from charms.grafana_agent.v0.cos_agent import COSAgentProvider
-from pfe.interfaces.falcosidekick_http_endpoint import HttpEndpointRequirer
+from cosl import JujuTopology
+from pfe.interfaces.falcosidekick_http_endpoint import HttpEndpointRequirer, HttpEndpointTopology
 
 from config import InvalidCharmConfigError
+from metrics import METRICS_FILE_NAME, HookMetrics
+from outputs import OutputsMonitor
+from ownership import MachineOwnership
+from rollout import COMPLETE, PASSIVE, PROGRESSING, RolloutMonitor, advance
 from service import (
+    CharmMetricsService,
+    FalcoAppliedState,
     FalcoConfigFile,
     FalcoConfigurationError,
     FalcoCustomSetting,
     FalcoLayout,
+    FalcoOverrideConfigFile,
+    FalcoRulesCostError,
+    FalcoRulesValidationError,
+    FalcoRulesValidator,
     FalcoService,
     FalcoServiceFile,
 )
-from state import CharmBaseWithState, CharmState
+from state import (
+    BUNDLE_DATA_KEY,
+    BUNDLE_DIGEST_KEY,
+    PEER_RELATION_NAME,
+    ROLLOUT_HEALTH_KEY,
+    ROLLOUT_KEY,
+    ROLLOUT_REVISION_KEY,
+    CharmBaseWithState,
+    CharmState,
+)
+from tuning import EngineTuner
 
 logger = logging.getLogger(__name__)
 
 METRICS_PORT = 8765
+CHARM_METRICS_PORT = 8766
 HTTP_ENDPOINT_RELATION_NAME = "http-endpoint"
+OUTPUTS_SATURATED_MESSAGE = "Falco outputs saturated"
+PASSIVE_MESSAGE = "Passive, Falco owned by"
+ROLLOUT_MESSAGE = "Custom config rollout"
 
 
 class Falco(CharmBaseWithState):
@@ -50,15 +76,33 @@ class Falco(CharmBaseWithState):
             self,
             metrics_endpoints=[
                 {"path": "/metrics", "port": METRICS_PORT},
+                {"path": f"/{METRICS_FILE_NAME}", "port": CHARM_METRICS_PORT},
             ],
         )
 
         self.falco_layout = FalcoLayout(base_dir=self.charm_dir / "falco")
-        self.falco_service_file = FalcoServiceFile(self.falco_layout, self)
+        self.hook_metrics = HookMetrics(self.falco_layout.state_dir)
+        self.charm_metrics_service = CharmMetricsService(self.hook_metrics, CHARM_METRICS_PORT)
+        self.falco_service_file = FalcoServiceFile(self.falco_layout)
         self.managed_falco_config = FalcoConfigFile(self.falco_layout)
-        self.custom_falco_setting = FalcoCustomSetting(self.falco_layout)
+        self.managed_falco_override_config = FalcoOverrideConfigFile(self.falco_layout, self)
+        self.custom_falco_setting = FalcoCustomSetting(
+            self.falco_layout, FalcoRulesValidator(self.falco_layout), self.hook_metrics
+        )
+        self.falco_applied_state = FalcoAppliedState(self.falco_layout)
+        self.engine_tuner = EngineTuner(self.falco_layout.state_dir, METRICS_PORT)
+        self.outputs_monitor = OutputsMonitor(self.falco_layout.state_dir, METRICS_PORT)
+        self.rollout_monitor = RolloutMonitor(self.falco_layout.state_dir, METRICS_PORT)
+        self.machine_ownership = MachineOwnership(self.unit.name, self.charm_dir)
         self.falco_service = FalcoService(
-            self.managed_falco_config, self.falco_service_file, self.custom_falco_setting
+            self.managed_falco_config,
+            self.managed_falco_override_config,
+            self.falco_service_file,
+            self.custom_falco_setting,
+            self.falco_applied_state,
+            self.hook_metrics,
+            self.charm_metrics_service,
+            self.engine_tuner,
         )
 
         self.framework.observe(self.on.remove, self._on_remove)
@@ -67,6 +111,12 @@ class Falco(CharmBaseWithState):
 
         self.framework.observe(self.on.config_changed, self.reconcile)
         self.framework.observe(self.on.secret_changed, self.reconcile)
+        self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(self.on.leader_elected, self.reconcile)
+        self.framework.observe(self.on.analyze_rules_action, self._on_analyze_rules_action)
+
+        # The leader publishes the custom config bundle to the other units through the peers
+        self.framework.observe(self.on[PEER_RELATION_NAME].relation_changed, self.reconcile)
 
         # Observe http-endpoint relation evnents to trigger reconciliation
         self.framework.observe(
@@ -80,26 +130,127 @@ class Falco(CharmBaseWithState):
     def state(self) -> CharmState:
         """The charm state."""
         if self._state is None:
-            self._state = CharmState.from_charm(self, self.http_endpoint_requirer)
+            self._state = CharmState.from_charm(
+                self, self.http_endpoint_requirer, self.machine_ownership.contributions()
+            )
         return self._state
 
     def _on_remove(self, _: ops.RemoveEvent) -> None:
-        """Handle remove event."""
-        self.unit.status = ops.MaintenanceStatus("Removing Falco service")
-        self.falco_service.remove()
+        """Handle remove event.
+
+        Passive units leave the Falco service to its owner, which removes it and then releases it
+        for a passive unit of the machine to take it over.
+        """
+        with self.machine_ownership.lock():
+            self.machine_ownership.withdraw()
+            if self.machine_ownership.owner() not in (None, self.unit.name):
+                return
+            self.unit.status = ops.MaintenanceStatus("Removing Falco service")
+            self.falco_service.remove()
+            self.machine_ownership.release()
 
     def _on_install_or_upgrade(self, _: ops.InstallEvent | ops.UpgradeCharmEvent) -> None:
         """Handle install or upgrade charm event."""
-        self.unit.status = ops.MaintenanceStatus("Installing Falco service")
-        self.falco_service.install()
+        with self.machine_ownership.lock():
+            if not self.machine_ownership.claim():
+                self._set_passive()
+                return
+            self.unit.status = ops.MaintenanceStatus("Installing Falco service")
+            self.falco_service.install()
+
+    def _on_update_status(self, event: ops.UpdateStatusEvent) -> None:
+        """Handle update status event.
+
+        Sample the Falco drop counters, and reconcile when the ring buffer size preset is stepped.
+        Sample the Falco health of the staged rollout, and reconcile when the leader widens or
+        rolls back the rollout. Then sample the Falco outputs queue drops, and warn while the
+        output path is saturated. A passive unit reconciles instead, to take the Falco service
+        over once its owner is gone. The owner also reconciles when the falco units of the machine
+        changed since it configured Falco.
+        """
+        if self.machine_ownership.owner() != self.unit.name:
+            self.reconcile(event)
+            return
+
+        stepped = self.engine_tuner.step()
+        if self._monitor_rollout() or stepped or self.machine_ownership.stale():
+            self.reconcile(event)
+
+        dropped = self.outputs_monitor.sample()
+        if dropped and isinstance(self.unit.status, ops.ActiveStatus):
+            logger.warning("Falco dropped %d alerts with its outputs queue full", dropped)
+            self.unit.status = ops.WaitingStatus(
+                f"{OUTPUTS_SATURATED_MESSAGE}, {dropped} alerts dropped"
+            )
+        elif not dropped and self.unit.status.message.startswith(OUTPUTS_SATURATED_MESSAGE):
+            self.unit.status = ops.ActiveStatus()
+
+    def _on_analyze_rules_action(self, event: ops.ActionEvent) -> None:
+        """Handle analyze-rules action.
+
+        Estimate the evaluation cost of the active custom rules, the most costly first.
+        """
+        if self.machine_ownership.owner() != self.unit.name:
+            event.fail(f"{PASSIVE_MESSAGE} {self.machine_ownership.owner()}")
+            return
+        costs = self.custom_falco_setting.rules_cost(self.falco_layout.rules_dir)
+        event.set_results(
+            {
+                "max-cost": max((cost.cost or 0 for cost in costs), default=0),
+                "rules": json.dumps([cost.model_dump() for cost in costs], indent=2),
+            }
+        )
 
     def reconcile(self, _: ops.EventBase) -> None:
+        """Reconcile the charm state, timing its phases.
+
+        Only the owner of the Falco service of the machine configures it. A unit takes the
+        ownership over, and installs the Falco service, when no live unit owns it.
+        """
+        with self.machine_ownership.lock():
+            self.machine_ownership.contribute(JujuTopology.from_charm(self).as_dict())
+            owner = self.machine_ownership.owner()
+            if not self.machine_ownership.claim():
+                self._set_passive()
+                try:
+                    self._publish_custom_config_bundle(fetch=True)
+                    self._drive_rollout(fetch=True)
+                    self._report_rollout_health()
+                except (InvalidCharmConfigError, FalcoConfigurationError):
+                    self.unit.status = ops.BlockedStatus("Failed publishing custom config")
+                return
+            if owner != self.unit.name:
+                self.falco_service.install()
+            try:
+                with self.hook_metrics.span("reconcile"):
+                    self._reconcile()
+            finally:
+                self.hook_metrics.export(self.falco_applied_state.counters)
+
+    def _set_passive(self) -> None:
+        """Set the status of a passive unit, naming the owner of the Falco service."""
+        self.unit.status = ops.ActiveStatus(f"{PASSIVE_MESSAGE} {self.machine_ownership.owner()}")
+
+    def _reconcile(self) -> None:
         """Reconcile the charm state."""
         try:
             self.falco_service.configure(self.state)
+            self.machine_ownership.applied(self.state.machine_units)
+            self._publish_custom_config_bundle()
+            if self._drive_rollout():
+                # The rollout may now reach the leader itself
+                self._state = None
+                self.falco_service.configure(self.state)
+            self._report_rollout_health()
         except InvalidCharmConfigError:
             self.unit.status = ops.BlockedStatus("Invalid charm config")
             return
+        except FalcoRulesValidationError as e:
+            self.unit.status = ops.BlockedStatus(f"Invalid rules file {e.file_name}")
+            return
+        except FalcoRulesCostError as e:
+            self.unit.status = ops.BlockedStatus(f"Rule {e.rule} too costly, estimated {e.cost}")
+            return
         except FalcoConfigurationError:
             self.unit.status = ops.BlockedStatus("Failed configuring Falco")
             return
@@ -107,7 +258,123 @@ class Falco(CharmBaseWithState):
         if not self.falco_service.check_active():
             raise RuntimeError("Falco service is not running")
 
-        self.unit.status = ops.ActiveStatus()
+        self._publish_topology()
+
+        self.unit.status = self._rollout_status()
+
+    def _publish_custom_config_bundle(self, fetch: bool = False) -> None:
+        """Publish the custom config bundle to the other units, on the leader distributing it.
+
+        Args:
+            fetch: Whether to fetch the repository first, as Falco was not configured.
+        """
+        relation = self.model.get_relation(PEER_RELATION_NAME)
+        if relation is None or not self.state.publish_custom_config_bundle:
+            return
+        data = relation.data[self.app]
+        if self.state.custom_config_repo is None:
+            for key in (BUNDLE_DIGEST_KEY, BUNDLE_DATA_KEY):
+                data.pop(key, None)
+            return
+        bundle = self.falco_service.custom_config_bundle(self.state, fetch=fetch)
+        if data.get(BUNDLE_DIGEST_KEY) != bundle.digest:
+            logger.info("Publishing the custom config bundle %s", bundle.digest)
+            data.update({BUNDLE_DIGEST_KEY: bundle.digest, BUNDLE_DATA_KEY: bundle.data})
+
+    def _drive_rollout(self, fetch: bool = False) -> bool:
+        """Advance the staged rollout from the health reports of the units, on the leader.
+
+        Args:
+            fetch: Whether to fetch the repository first, as Falco was not configured.
+
+        Returns:
+            Whether the rollout was started, widened, completed or rolled back.
+        """
+        relation = self.model.get_relation(PEER_RELATION_NAME)
+        if relation is None or not self.unit.is_leader():
+            return False
+        data = relation.data[self.app]
+        plan = self.state.custom_config_rollout
+        revision = None
+        if plan is not None:
+            revision = self.falco_service.custom_config_revision(self.state, fetch=fetch)
+        if plan is None or revision is None:
+            data.pop(ROLLOUT_KEY, None)
+            return False
+        reports = {
+            unit.name: (
+                relation.data[unit].get(ROLLOUT_REVISION_KEY, ""),
+                relation.data[unit].get(ROLLOUT_HEALTH_KEY, ""),
+            )
+            for unit in {self.unit, *relation.units}
+        }
+        rollout = advance(plan, revision, reports)
+        if rollout == plan.rollout:
+            return False
+        data[ROLLOUT_KEY] = rollout.model_dump_json()
+        return True
+
+    def _report_rollout_health(self) -> None:
+        """Report the revision active on the unit and its health to the leader."""
+        relation = self.model.get_relation(PEER_RELATION_NAME)
+        plan = self.state.custom_config_rollout
+        if relation is None or plan is None:
+            return
+        if self.machine_ownership.owner() != self.unit.name:
+            revision, health = "", PASSIVE
+        else:
+            revision = self.custom_falco_setting.current_revision() or ""
+            health = self.rollout_monitor.health(revision, plan)
+        relation.data[self.unit].update(
+            {ROLLOUT_REVISION_KEY: revision, ROLLOUT_HEALTH_KEY: health}
+        )
+
+    def _monitor_rollout(self) -> bool:
+        """Sample the Falco health of the active revision, report it, and drive the rollout.
+
+        Returns:
+            Whether the leader changed the rollout, and the unit must reconcile.
+        """
+        try:
+            plan = self.state.custom_config_rollout
+        except InvalidCharmConfigError:
+            return False
+        if plan is None:
+            return False
+        self.rollout_monitor.sample(self.custom_falco_setting.current_revision() or "")
+        self._report_rollout_health()
+        return self._drive_rollout()
+
+    def _rollout_status(self) -> ops.StatusBase:
+        """Get the status of the unit, showing the staged rollout progress on the leader.
+
+        Returns:
+            The unit status.
+        """
+        plan = self.state.custom_config_rollout
+        rollout = plan.rollout if plan is not None else None
+        if rollout is None or not self.unit.is_leader() or rollout.status == COMPLETE:
+            return ops.ActiveStatus()
+        if rollout.status == PROGRESSING:
+            return ops.ActiveStatus(
+                f"{ROLLOUT_MESSAGE} at {plan.steps[rollout.step]}% of the units"
+            )
+        return ops.BlockedStatus(
+            f"{ROLLOUT_MESSAGE} rolled back, revision {rollout.revision[:12]}"
+        )
+
+    def _publish_topology(self) -> None:
+        """Publish the Juju topology to falcosidekick when the events do not carry it."""
+        topology = None
+        if not self.state.event_topology:
+            juju_topology = JujuTopology.from_charm(self)
+            topology = HttpEndpointTopology(
+                model=juju_topology.model,
+                model_uuid=juju_topology.model_uuid,
+                application=juju_topology.application,
+                charm_name=juju_topology.charm_name,
+            )
+        self.http_endpoint_requirer.publish_topology(topology)
 
 
 if __name__ == "__main__":  # pragma: nocover
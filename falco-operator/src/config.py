@@ -4,12 +4,40 @@
 """Charm config option module."""
 
 import logging
-from typing import Optional
+from typing import Literal, Optional
 
 from ops import Secret
-from pydantic import AnyUrl, BaseModel, ConfigDict, field_validator
+from pydantic import AnyUrl, BaseModel, ConfigDict, Field, field_validator, model_validator
 
 SUPPORTED_SCHEMES = "git+ssh"
+DEFAULT_HOST_KEY_REFRESH_INTERVAL = 86400
+
+# Falco metrics counter families, each enabled by the `metrics.<family>_enabled` setting
+METRICS_COUNTERS = (
+    "rules_counters",
+    "resource_utilization",
+    "state_counters",
+    "kernel_event_counters",
+    "kernel_event_counters_per_cpu",
+    "libbpf_stats",
+    "plugins_metrics",
+    "jemalloc_stats",
+)
+DEFAULT_METRICS_COUNTERS = (
+    "rules_counters",
+    "resource_utilization",
+    "state_counters",
+    "kernel_event_counters",
+    "libbpf_stats",
+    "plugins_metrics",
+)
+DEFAULT_METRICS_INTERVAL = "1h"
+# Falco output sinks, each enabled by the `<sink>_output.enabled` setting
+OUTPUT_SINKS = ("http", "syslog", "stdout")
+# Falco plugins bundled with the charm, in load order
+FALCO_PLUGINS = ("json", "k8saudit", "container")
+# Falco durations, such as 1h, 15m or 1m30s
+METRICS_INTERVAL_PATTERN = r"^([0-9]+(ms|s|m|h|d|w|y))+$"
 logger = logging.getLogger(__name__)
 
 
@@ -25,6 +53,33 @@ class CharmConfig(BaseModel):
     Attributes:
         custom_config_ssh_key (Secret): Optional SSH key for custom configuration repository.
         custom_config_repository (AnyUrl): Optional URL to a custom configuration repository.
+        custom_config_repo_host_key (str): Optional pinned SSH host key of the repository host.
+        custom_config_repo_host_key_refresh_interval (int): Seconds before rescanning the host key.
+        buf_size_preset (int): Optional override of the derived ring buffer size preset.
+        cpus_for_each_buffer (int): Optional override of the derived CPUs sharing a ring buffer.
+        thread_table_size (int): Optional override of the derived thread table size.
+        snaplen (int): Optional override of the derived snaplen.
+        buf_size_preset_min (int): Lowest ring buffer size preset the charm applies.
+        buf_size_preset_max (int): Highest ring buffer size preset the charm applies.
+        derive_base_syscalls (bool): Whether to capture only the syscalls the rules need.
+        metrics_interval (str): Interval of the Falco metrics snapshots.
+        metrics_counters (str): Comma separated Falco metrics counter families to enable.
+        metrics_mode (str): Whether the metrics are also emitted as rule outputs.
+        outputs (str): Comma separated Falco output sinks to enable.
+        payload_profile (str): Which properties the Falco JSON events carry.
+        topology_enrichment (str): Where the Juju topology is attached to the Falco events.
+        outputs_queue_capacity (int): Alerts the Falco outputs queue holds, 0 for no limit.
+        min_priority (str): Lowest priority of the Falco rules loaded and alerting.
+        http_output_keep_alive (bool): Whether the http output reuses its connection.
+        http_output_compress_uploads (bool): Whether the http output negotiates compression.
+        plugins (str): Comma separated Falco plugins to load, or auto to detect them.
+        custom_config_distribution (str): Whether each unit or the leader fetches the repository.
+        custom_config_rollout (str): Whether a new revision is applied to all units or in steps.
+        custom_config_rollout_steps (str): Comma separated percentages of the units by step.
+        custom_config_rollout_soak_interval (int): Seconds each step is observed before widening.
+        custom_config_rollout_max_cpu_increase (float): Relative CPU usage increase regressing.
+        custom_config_rollout_max_drop_increase (float): Drop ratio increase regressing.
+        rules_max_cost (int): Highest estimated cost of a custom rule, 0 for no limit.
     """
 
     # Pydantic model config
@@ -33,6 +88,39 @@ class CharmConfig(BaseModel):
     # Charm Configs
     custom_config_repository: Optional[AnyUrl] = None
     custom_config_repo_ssh_key: Optional[Secret] = None
+    custom_config_repo_host_key: Optional[str] = None
+    custom_config_repo_host_key_refresh_interval: int = Field(
+        default=DEFAULT_HOST_KEY_REFRESH_INTERVAL, ge=0
+    )
+    buf_size_preset: Optional[int] = Field(default=None, ge=1, le=10)
+    cpus_for_each_buffer: Optional[int] = Field(default=None, ge=0)
+    thread_table_size: Optional[int] = Field(default=None, gt=0)
+    snaplen: Optional[int] = Field(default=None, gt=0)
+    buf_size_preset_min: int = Field(default=1, ge=1, le=10)
+    buf_size_preset_max: int = Field(default=10, ge=1, le=10)
+    derive_base_syscalls: bool = False
+    metrics_interval: str = Field(
+        default=DEFAULT_METRICS_INTERVAL, pattern=METRICS_INTERVAL_PATTERN
+    )
+    metrics_counters: str = ",".join(DEFAULT_METRICS_COUNTERS)
+    metrics_mode: Literal["output-rule", "scrape-first"] = "output-rule"
+    outputs: str = "http,syslog"
+    payload_profile: Literal["full", "fields-only", "minimal"] = "full"
+    topology_enrichment: Literal["event", "relation"] = "event"
+    outputs_queue_capacity: int = Field(default=0, ge=0)
+    min_priority: Literal[
+        "emergency", "alert", "critical", "error", "warning", "notice", "informational", "debug"
+    ] = "debug"
+    http_output_keep_alive: bool = False
+    http_output_compress_uploads: bool = False
+    plugins: str = ",".join(FALCO_PLUGINS)
+    custom_config_distribution: Literal["unit", "leader"] = "unit"
+    custom_config_rollout: Literal["all", "staged"] = "all"
+    custom_config_rollout_steps: str = "10,50,100"
+    custom_config_rollout_soak_interval: int = Field(default=1800, ge=0)
+    custom_config_rollout_max_cpu_increase: float = Field(default=0.5, ge=0)
+    custom_config_rollout_max_drop_increase: float = Field(default=0.001, ge=0, le=1)
+    rules_max_cost: int = Field(default=0, ge=0)
 
     @field_validator("custom_config_repository")
     @classmethod
@@ -62,3 +150,114 @@ class CharmConfig(BaseModel):
             raise InvalidCharmConfigError(err_msg)
 
         return repo
+
+    @field_validator("metrics_counters")
+    @classmethod
+    def validate_metrics_counters(cls, counters: str) -> str:
+        """Validate the Falco metrics counter families.
+
+        Args:
+            counters: The comma separated counter families.
+
+        Returns:
+            The validated counter families.
+
+        Raises:
+            ValueError: If a counter family is unknown.
+        """
+        unknown = set(comma_separated(counters)) - set(METRICS_COUNTERS)
+        if unknown:
+            raise ValueError(f"Unknown metrics counters {', '.join(sorted(unknown))}")
+        return counters
+
+    @field_validator("outputs")
+    @classmethod
+    def validate_outputs(cls, outputs: str) -> str:
+        """Validate the Falco output sinks.
+
+        Args:
+            outputs: The comma separated output sinks.
+
+        Returns:
+            The validated output sinks.
+
+        Raises:
+            ValueError: If no output sink is set or an output sink is unknown.
+        """
+        if not comma_separated(outputs):
+            raise ValueError("No output sink set")
+        unknown = set(comma_separated(outputs)) - set(OUTPUT_SINKS)
+        if unknown:
+            raise ValueError(f"Unknown output sinks {', '.join(sorted(unknown))}")
+        return outputs
+
+    @field_validator("plugins")
+    @classmethod
+    def validate_plugins(cls, plugins: str) -> str:
+        """Validate the Falco plugins.
+
+        Args:
+            plugins: The comma separated plugins, or auto.
+
+        Returns:
+            The validated plugins.
+
+        Raises:
+            ValueError: If a plugin is unknown.
+        """
+        if plugins.strip() == "auto":
+            return "auto"
+        unknown = set(comma_separated(plugins)) - set(FALCO_PLUGINS)
+        if unknown:
+            raise ValueError(f"Unknown plugins {', '.join(sorted(unknown))}")
+        return plugins
+
+    @field_validator("custom_config_rollout_steps")
+    @classmethod
+    def validate_custom_config_rollout_steps(cls, steps: str) -> str:
+        """Validate the staged rollout steps.
+
+        Args:
+            steps: The comma separated percentages of the units, by step.
+
+        Returns:
+            The validated steps.
+
+        Raises:
+            ValueError: If a step is not a percentage, or the steps do not grow up to 100.
+        """
+        try:
+            percentages = [int(step) for step in comma_separated(steps)]
+        except ValueError as e:
+            raise ValueError("Rollout steps are not percentages") from e
+        if not percentages or percentages[-1] != 100:
+            raise ValueError("Last rollout step is not 100")
+        if percentages[0] < 1 or sorted(set(percentages)) != percentages:
+            raise ValueError("Rollout steps do not grow from 1 to 100")
+        return steps
+
+    @model_validator(mode="after")
+    def validate_buf_size_preset_bounds(self) -> "CharmConfig":
+        """Validate the ring buffer size preset bounds.
+
+        Returns:
+            The validated config.
+
+        Raises:
+            ValueError: If the lowest preset is above the highest one.
+        """
+        if self.buf_size_preset_min > self.buf_size_preset_max:
+            raise ValueError("buf_size_preset_min is above buf_size_preset_max")
+        return self
+
+
+def comma_separated(value: str) -> list[str]:
+    """Split a comma separated config option value.
+
+    Args:
+        value: The comma separated names.
+
+    Returns:
+        The names, without blanks.
+    """
+    return [name.strip() for name in value.split(",") if name.strip()]
@@ -0,0 +1,152 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Charm hook metrics module.
+
+The charm times the phases of its hooks with spans, and accumulates the durations in histograms
+persisted across hooks. The histograms are exported in the Prometheus text format to a file
+served to the COS agent.
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from sync import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the hook phase duration histogram buckets
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+METRICS_FILE_NAME = "metrics.txt"
+
+
+class HookMetrics:
+    """Charm hook phase timings.
+
+    Without a state directory, the spans are timed but not exported.
+    """
+
+    file_name: str = "hook-metrics.json"
+
+    def __init__(self, state_dir: Optional[Path] = None) -> None:
+        """Initialize the hook metrics.
+
+        Args:
+            state_dir (Optional[Path]): The directory holding the persisted histograms and the
+                exported metrics
+        """
+        self.state_dir = state_dir
+        self.durations: list[tuple[str, float]] = []
+
+    @property
+    def metrics_dir(self) -> Optional[Path]:
+        """Get the directory holding the exported metrics file."""
+        return self.state_dir / "metrics" if self.state_dir else None
+
+    @contextmanager
+    def span(self, phase: str) -> Iterator[None]:
+        """Time a hook phase.
+
+        The duration is recorded even if the phase raises an exception.
+
+        Args:
+            phase (str): The phase name
+
+        Yields:
+            None
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            self.durations.append((phase, duration))
+            logger.debug("Phase %s took %.3fs", phase, duration)
+
+    def export(self, counters: Optional[dict[str, int]] = None) -> None:
+        """Add the recorded durations to the persisted histograms, and export them.
+
+        Failing to export the metrics is logged, and does not fail the hook.
+
+        Args:
+            counters (Optional[dict[str, int]]): Reconciliation outcome counters to export
+        """
+        if self.state_dir is None or self.metrics_dir is None:
+            return
+        histograms = self._load()
+        for phase, duration in self.durations:
+            histogram = histograms.setdefault(
+                phase, {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0}
+            )
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += duration
+            histogram["count"] += 1
+        self.durations = []
+        try:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(self.state_dir / self.file_name, json.dumps(histograms).encode())
+            self.metrics_dir.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(
+                self.metrics_dir / METRICS_FILE_NAME,
+                _render(histograms, counters or {}).encode(),
+            )
+        except OSError:
+            logger.exception("Failed to export the charm hook metrics")
+
+    def _load(self) -> dict[str, dict]:
+        """Load the persisted histograms.
+
+        Returns:
+            The histograms keyed by phase.
+        """
+        if self.state_dir is None:
+            return {}
+        try:
+            histograms = json.loads((self.state_dir / self.file_name).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        # Drop the histograms recorded with other buckets
+        return {
+            phase: histogram
+            for phase, histogram in histograms.items()
+            if len(histogram.get("buckets", [])) == len(DURATION_BUCKETS)
+        }
+
+
+def _render(histograms: dict[str, dict], counters: dict[str, int]) -> str:
+    """Render the metrics in the Prometheus text format.
+
+    Args:
+        histograms (dict[str, dict]): The hook phase duration histograms keyed by phase
+        counters (dict[str, int]): The reconciliation outcome counters
+
+    Returns:
+        The metrics in the Prometheus text exposition format.
+    """
+    name = "falco_charm_hook_phase_duration_seconds"
+    lines = [
+        f"# HELP {name} Duration of the Falco charm hook phases.",
+        f"# TYPE {name} histogram",
+    ]
+    for phase, histogram in sorted(histograms.items()):
+        for bound, count in zip(DURATION_BUCKETS, histogram["buckets"], strict=True):
+            lines.append(f'{name}_bucket{{phase="{phase}",le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{phase="{phase}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'{name}_sum{{phase="{phase}"}} {histogram["sum"]}')
+        lines.append(f'{name}_count{{phase="{phase}"}} {histogram["count"]}')
+
+    name = "falco_charm_reconcile_total"
+    lines += [
+        f"# HELP {name} Falco charm reconciliations by outcome.",
+        f"# TYPE {name} counter",
+    ]
+    for outcome, count in sorted(counters.items()):
+        lines.append(f'{name}{{outcome="{outcome}"}} {count}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,66 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Falco outputs monitoring module.
+
+Falco queues the alerts between the rules engine and the output sinks. When a sink is slow, such
+as falcosidekick restarting, the queue grows up to its capacity and Falco then drops the alerts.
+The charm samples the Falco counter of the dropped alerts to report the saturation of the output
+path.
+"""
+
+import json
+import logging
+from pathlib import Path
+
+from sync import write_file_atomic
+from tuning import scrape_counters
+
+logger = logging.getLogger(__name__)
+
+# Falco counter of the alerts dropped because the outputs queue is full
+OUTPUTS_DROPS_METRIC = "falcosecurity_falco_outputs_queue_num_drops_total"
+
+
+class OutputsMonitor:
+    """Falco outputs queue monitor.
+
+    The drops are counted between two samples, the last one being recorded in the charm state
+    directory.
+    """
+
+    file_name: str = "outputs-queue.json"
+
+    def __init__(self, state_dir: Path, metrics_port: int) -> None:
+        """Initialize the outputs monitor.
+
+        Args:
+            state_dir (Path): The directory holding the last sample
+            metrics_port (int): The local port of the Falco webserver serving the metrics
+        """
+        self.path = state_dir / self.file_name
+        self.metrics_port = metrics_port
+
+    def sample(self) -> int:
+        """Sample the Falco outputs queue drops counter.
+
+        Returns:
+            The number of alerts dropped since the previous sample, 0 if unknown.
+        """
+        counters = scrape_counters(self.metrics_port, (OUTPUTS_DROPS_METRIC,))
+        if OUTPUTS_DROPS_METRIC not in counters:
+            return 0
+        drops = int(counters[OUTPUTS_DROPS_METRIC])
+        try:
+            previous = json.loads(self.path.read_text(encoding="utf-8"))["drops"]
+        except (OSError, ValueError, KeyError):
+            previous = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(self.path, json.dumps({"drops": drops}).encode())
+        except OSError:
+            logger.exception("Failed to record the Falco outputs queue drops")
+        if previous is None:
+            return 0
+        # The counter restarts with Falco
+        return drops - previous if drops >= previous else drops
@@ -0,0 +1,206 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Falco machine ownership module.
+
+A machine hosting several principals runs a falco unit for each of them. Only one of these units,
+the owner, runs the Falco service and its kernel probe; the other units are passive. The owner is
+recorded in a marker file of a machine-wide directory, changed under an exclusive lock, and a
+passive unit takes the ownership over once the owner is gone. Every unit contributes its Juju
+topology labels, so the owner can tell the units the events are for.
+
+The marker also records the digest of the contributions the owner applied, so the owner applies
+them again on its next update-status once another unit changed them.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from sync import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+# Machine-wide directory shared by the falco units of the machine
+MACHINE_DIR = Path("/var/lib/falco-charm")
+
+
+class MachineOwnership:
+    """Falco service ownership among the falco units of a machine.
+
+    The marker and the contributions name the charm directory of their unit, so the ones of units
+    removed without running their remove hook are ignored.
+    """
+
+    lock_file_name: str = "owner.lock"
+    marker_file_name: str = "owner.json"
+    units_dir_name: str = "units"
+
+    def __init__(self, unit_name: str, charm_dir: Path) -> None:
+        """Initialize the machine ownership.
+
+        Args:
+            unit_name (str): The name of the unit
+            charm_dir (Path): The charm directory of the unit
+        """
+        self.unit_name = unit_name
+        self.charm_dir = charm_dir
+        self.base_dir = MACHINE_DIR
+        self.marker = self.base_dir / self.marker_file_name
+        self.units_dir = self.base_dir / self.units_dir_name
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Hold the machine-wide lock, so a single unit changes the ownership at a time.
+
+        Yields:
+            Nothing, the lock being held until the context exits.
+        """
+        self.base_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with open(self.base_dir / self.lock_file_name, "a", encoding="utf-8") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def owner(self) -> Optional[str]:
+        """Get the unit owning the Falco service of the machine.
+
+        Returns:
+            The name of the owner unit, or None if there is no live owner.
+        """
+        record = _read_record(self.marker)
+        if record is None:
+            return None
+        return record["unit"]
+
+    def claim(self) -> bool:
+        """Claim the Falco service of the machine, unless another unit owns it.
+
+        Returns:
+            Whether the unit owns the Falco service.
+        """
+        owner = self.owner()
+        if owner == self.unit_name:
+            return True
+        if owner is not None:
+            return False
+        logger.info("Unit %s takes the ownership of the Falco service", self.unit_name)
+        self.applied(self.contributions())
+        return True
+
+    def applied(self, contributions: dict[str, dict[str, str]]) -> None:
+        """Record the contributions the owner applied to the Falco service.
+
+        Args:
+            contributions (dict[str, dict[str, str]]): The Juju topology labels, by unit name
+        """
+        self._write(
+            self.marker,
+            {
+                "unit": self.unit_name,
+                "charm_dir": str(self.charm_dir),
+                "contributions": _digest(contributions),
+            },
+        )
+
+    def stale(self) -> bool:
+        """Check whether the contributions changed since the owner applied them.
+
+        Returns:
+            Whether the owner has to apply the contributions again.
+        """
+        record = _read_record(self.marker)
+        return record is not None and record.get("contributions") != _digest(self.contributions())
+
+    def release(self) -> None:
+        """Release the Falco service of the machine, if the unit owns it."""
+        if self.owner() == self.unit_name:
+            logger.info("Unit %s releases the ownership of the Falco service", self.unit_name)
+            self.marker.unlink(missing_ok=True)
+
+    def contribute(self, labels: dict[str, str]) -> None:
+        """Contribute the Juju topology labels of the unit.
+
+        Args:
+            labels (dict[str, str]): The Juju topology labels of the unit
+        """
+        self._write(
+            self.units_dir / self._unit_file_name(self.unit_name),
+            {"unit": self.unit_name, "charm_dir": str(self.charm_dir), "labels": labels},
+        )
+
+    def withdraw(self) -> None:
+        """Withdraw the contribution of the unit."""
+        (self.units_dir / self._unit_file_name(self.unit_name)).unlink(missing_ok=True)
+
+    def contributions(self) -> dict[str, dict[str, str]]:
+        """Get the Juju topology labels contributed by the live units of the machine.
+
+        Returns:
+            The Juju topology labels, by unit name.
+        """
+        if not self.units_dir.is_dir():
+            return {}
+        records = (_read_record(path) for path in sorted(self.units_dir.glob("*.json")))
+        return {record["unit"]: record.get("labels", {}) for record in records if record}
+
+    @staticmethod
+    def _unit_file_name(unit_name: str) -> str:
+        """Get the name of the contribution file of a unit.
+
+        Args:
+            unit_name (str): The name of the unit
+
+        Returns:
+            The file name.
+        """
+        return f"{unit_name.replace('/', '-')}.json"
+
+    @staticmethod
+    def _write(path: Path, record: dict) -> None:
+        """Write a record atomically.
+
+        Args:
+            path (Path): The record file
+            record (dict): The record
+        """
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        write_file_atomic(path, json.dumps(record, sort_keys=True).encode(), mode=0o600)
+
+
+def _digest(contributions: dict[str, dict[str, str]]) -> str:
+    """Get the digest of the contributions.
+
+    Args:
+        contributions (dict[str, dict[str, str]]): The Juju topology labels, by unit name
+
+    Returns:
+        The hex digest.
+    """
+    return hashlib.sha256(json.dumps(contributions, sort_keys=True).encode()).hexdigest()
+
+
+def _read_record(path: Path) -> Optional[dict]:
+    """Read the record of a live unit.
+
+    Args:
+        path (Path): The record file
+
+    Returns:
+        The record, or None if it is missing, unreadable or the one of a removed unit.
+    """
+    try:
+        record = json.loads(path.read_text(encoding="utf-8"))
+        unit, charm_dir = record["unit"], record["charm_dir"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if not Path(charm_dir).is_dir():
+        logger.info("Ignoring the record of the removed unit %s", unit)
+        return None
+    return record
@@ -0,0 +1,302 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Staged rollout module.
+
+With the staged rollout of the custom config repository, a new revision of the custom rules and
+configs is first applied to a canary share of the units, chosen by unit number, then to larger
+shares in steps. The leader records the rollout in the peer relation application data. Each unit
+compares the Falco CPU usage and drop ratio sampled since it applied the revision with the ones
+sampled before, and reports its health in the peer relation unit data. The leader widens the
+rollout once all the units of the step are healthy, and rolls it back when one of them regressed.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import time
+from pathlib import Path
+from typing import Literal, Optional
+
+from pydantic import BaseModel
+
+from sync import write_file_atomic
+from tuning import DROPS_METRIC, EVENTS_METRIC, scrape_counters
+
+logger = logging.getLogger(__name__)
+
+# Falco gauge of the CPU usage of its process
+CPU_METRIC = "falcosecurity_falco_cpu_usage_ratio"
+
+# Rollout statuses, recorded by the leader
+PROGRESSING = "progressing"
+COMPLETE = "complete"
+ROLLED_BACK = "rolled-back"
+
+# Unit health reports. A passive unit does not run Falco, so it never holds a rollout back.
+PENDING = "pending"
+HEALTHY = "healthy"
+REGRESSED = "regressed"
+PASSIVE = "passive"
+
+
+class Rollout(BaseModel):
+    """The pydantic model for a staged rollout, as recorded by the leader.
+
+    Attributes:
+        revision: The digest of the custom settings rolled out.
+        step: The index of the current rollout step.
+        status: Whether the rollout is progressing, complete or rolled back.
+    """
+
+    revision: str
+    step: int = 0
+    status: Literal["progressing", "complete", "rolled-back"] = "progressing"
+
+
+class RolloutPlan(BaseModel):
+    """The pydantic model for the staged rollout settings of a unit.
+
+    Attributes:
+        unit: The name of the unit.
+        units: The names of the falco units of the application, by unit number.
+        steps: The percentages of the units applying a new revision, by step.
+        soak_interval: Seconds a unit observes a new revision before reporting it healthy.
+        max_cpu_increase: Relative Falco CPU usage increase regressing a revision.
+        max_drop_increase: Drop ratio increase regressing a revision.
+        rollout: The rollout recorded by the leader, if any.
+    """
+
+    unit: str
+    units: list[str]
+    steps: list[int] = [10, 50, 100]
+    soak_interval: int = 1800
+    max_cpu_increase: float = 0.5
+    max_drop_increase: float = 0.001
+    rollout: Optional[Rollout] = None
+
+    def first_step(self, unit: str) -> int:
+        """Get the first rollout step applying a new revision to a unit.
+
+        Each step applies the revision to the given percentage of the units with the lowest
+        numbers, rounded up, so the first step applies it to one unit at least.
+
+        Args:
+            unit (str): The name of the unit
+
+        Returns:
+            The index of the step.
+        """
+        rank = self.units.index(unit)
+        for step, percentage in enumerate(self.steps):
+            if rank < max(1, math.ceil(len(self.units) * percentage / 100)):
+                return step
+        return len(self.steps) - 1
+
+    def admits(self, revision: str) -> bool:
+        """Check whether the rollout has reached the unit for a revision.
+
+        Args:
+            revision (str): The digest of the custom settings
+
+        Returns:
+            Whether the unit may apply the revision.
+        """
+        rollout = self.rollout
+        if rollout is None or rollout.revision != revision:
+            return False
+        if rollout.status == COMPLETE:
+            return True
+        return rollout.status == PROGRESSING and self.first_step(self.unit) <= rollout.step
+
+
+def advance(plan: RolloutPlan, revision: str, reports: dict[str, tuple[str, str]]) -> Rollout:
+    """Advance the rollout of a revision from the health reports of the units.
+
+    A new revision starts a new rollout. The rollout is rolled back as soon as a unit of the
+    current step reports a regression, and moves to the next step, or completes on the last one,
+    once all the units of the current step report the revision healthy.
+
+    Args:
+        plan (RolloutPlan): The staged rollout settings of the leader
+        revision (str): The digest of the custom settings fetched by the leader
+        reports (dict[str, tuple[str, str]]): The revision and health reported, by unit name
+
+    Returns:
+        The updated rollout.
+    """
+    rollout = plan.rollout
+    if rollout is None or rollout.revision != revision:
+        logger.info("Starting the rollout of the custom settings revision %s", revision)
+        return Rollout(revision=revision)
+    if rollout.status != PROGRESSING:
+        return rollout
+
+    health = [
+        reports.get(unit, ("", PENDING))
+        for unit in plan.units
+        if plan.first_step(unit) <= rollout.step
+    ]
+    if any(report == (revision, REGRESSED) for report in health):
+        logger.warning("Rolling back the custom settings revision %s", revision)
+        return rollout.model_copy(update={"status": ROLLED_BACK})
+    if all(report == (revision, HEALTHY) or report[1] == PASSIVE for report in health):
+        if rollout.step + 1 >= len(plan.steps):
+            logger.info("Rollout of the custom settings revision %s complete", revision)
+            return rollout.model_copy(update={"status": COMPLETE})
+        logger.info(
+            "Widening the rollout of the custom settings revision %s to %d%% of the units",
+            revision,
+            plan.steps[rollout.step + 1],
+        )
+        return rollout.model_copy(update={"step": rollout.step + 1})
+    return rollout
+
+
+def source_revision(source: Path, keys: tuple[str, ...]) -> str:
+    """Get the revision of the custom settings of a checkout or an unpacked bundle.
+
+    The revision only depends on the names and contents of the regular files, so the checkout of
+    the leader and the bundle it packed from it have the same revision.
+
+    Args:
+        source (Path): The directory holding the custom settings
+        keys (tuple[str, ...]): The custom settings directory names
+
+    Returns:
+        The hex digest of the custom settings.
+    """
+    digest = hashlib.sha256()
+    for key in keys:
+        directory = source / key
+        if not directory.is_dir():
+            continue
+        for path in sorted(directory.rglob("*")):
+            if path.is_symlink() or not path.is_file():
+                continue
+            digest.update(f"{path.relative_to(source)}\0".encode())
+            digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()
+
+
+class RolloutMonitor:
+    """Falco health monitor of the staged rollout.
+
+    The Falco CPU usage and event counters are sampled while a revision is active. When another
+    revision becomes active, the samples of the previous one become the baseline it is compared
+    with. The samples are recorded in the charm state directory.
+    """
+
+    file_name: str = "rollout.json"
+
+    def __init__(self, state_dir: Path, metrics_port: int) -> None:
+        """Initialize the rollout monitor.
+
+        Args:
+            state_dir (Path): The directory holding the samples
+            metrics_port (int): The local port of the Falco webserver serving the metrics
+        """
+        self.path = state_dir / self.file_name
+        self.metrics_port = metrics_port
+
+    def sample(self, revision: str) -> None:
+        """Sample the Falco CPU usage and event counters for the active revision.
+
+        Args:
+            revision (str): The digest of the active custom settings
+        """
+        record = self._load()
+        if record.get("revision") != revision:
+            logger.info("Monitoring the Falco health of the custom settings revision %s", revision)
+            record = {
+                "revision": revision,
+                "since": time.time(),
+                "baseline": record.get("current"),
+                "current": _empty_stats(),
+                "last": record.get("last"),
+            }
+
+        counters = scrape_counters(self.metrics_port, (CPU_METRIC, EVENTS_METRIC, DROPS_METRIC))
+        stats = record["current"]
+        if CPU_METRIC in counters:
+            stats["cpu"] += counters[CPU_METRIC]
+            stats["samples"] += 1
+        if EVENTS_METRIC in counters and DROPS_METRIC in counters:
+            last = record.get("last")
+            # The counters restart with Falco, so only their increments are accumulated
+            if last and counters[EVENTS_METRIC] >= last["events"]:
+                stats["events"] += counters[EVENTS_METRIC] - last["events"]
+                stats["drops"] += max(counters[DROPS_METRIC] - last["drops"], 0)
+            record["last"] = {"events": counters[EVENTS_METRIC], "drops": counters[DROPS_METRIC]}
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(self.path, json.dumps(record, indent=2).encode())
+        except OSError:
+            logger.exception("Failed to record the Falco health samples")
+
+    def health(self, revision: str, plan: RolloutPlan) -> str:
+        """Get the health of the active revision, compared with the previous one.
+
+        The revision is pending until it has been sampled for the soak interval. It regressed
+        when the Falco CPU usage grew by more than the allowed share, or the drop ratio by more
+        than the allowed ratio.
+
+        Args:
+            revision (str): The digest of the active custom settings
+            plan (RolloutPlan): The staged rollout settings
+
+        Returns:
+            The health of the revision: pending, healthy or regressed.
+        """
+        record = self._load()
+        if record.get("revision") != revision:
+            return PENDING
+        stats, baseline = record["current"], record.get("baseline") or _empty_stats()
+        if time.time() - record["since"] < plan.soak_interval or not stats["samples"]:
+            return PENDING
+
+        cpu = stats["cpu"] / stats["samples"]
+        if baseline["samples"]:
+            baseline_cpu = baseline["cpu"] / baseline["samples"]
+            if cpu > baseline_cpu * (1 + plan.max_cpu_increase):
+                logger.warning(
+                    "Falco CPU usage grew from %.4f to %.4f with revision %s",
+                    baseline_cpu,
+                    cpu,
+                    revision,
+                )
+                return REGRESSED
+        if stats["events"]:
+            drop_ratio = stats["drops"] / stats["events"]
+            baseline_ratio = baseline["drops"] / baseline["events"] if baseline["events"] else 0
+            if drop_ratio > baseline_ratio + plan.max_drop_increase:
+                logger.warning(
+                    "Falco drop ratio grew from %.6f to %.6f with revision %s",
+                    baseline_ratio,
+                    drop_ratio,
+                    revision,
+                )
+                return REGRESSED
+        return HEALTHY
+
+    def _load(self) -> dict:
+        """Load the samples.
+
+        Returns:
+            The samples record, or an empty record if it does not exist or is unreadable.
+        """
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+
+def _empty_stats() -> dict:
+    """Get the accumulated samples of a revision not sampled yet.
+
+    Returns:
+        The sum of the CPU usage samples, their number, and the events and drops counted.
+    """
+    return {"cpu": 0.0, "samples": 0, "events": 0.0, "drops": 0.0}
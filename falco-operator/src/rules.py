@@ -0,0 +1,650 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Falco rules analysis module.
+
+The charm derives the minimal set of syscalls the loaded rules need from the event types their
+conditions match on, so Falco can be configured to capture only those syscalls. The analysis is
+conservative: a rule whose condition does not restrict the event types, or cannot be parsed, needs
+all the syscalls.
+
+The charm also estimates the evaluation cost of the custom rules: the cost of the comparisons of
+their conditions, macros included, times the number of event types Falco evaluates them for.
+"""
+
+import logging
+import re
+from pathlib import Path
+from typing import Iterator, Optional
+
+import yaml
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Source of the rules matching on syscalls, the default one
+SYSCALL_SOURCE = "syscall"
+
+# Event types rules can match on that are not syscalls
+NON_SYSCALL_EVENTS = frozenset(
+    {"asyncevent", "container", "pluginevent", "procexit", "signaldeliver", "switch"}
+)
+
+# Relative cost of a comparison by operator, the other operators costing 1
+OPERATOR_COSTS = {
+    "startswith": 2,
+    "bstartswith": 2,
+    "endswith": 2,
+    "contains": 4,
+    "bcontains": 4,
+    "icontains": 6,
+    "pmatch": 4,
+    "glob": 8,
+    "iglob": 10,
+    "regex": 25,
+}
+# Operators scanning the whole value of the field, flagged by the cost analysis
+EXPENSIVE_OPERATORS = frozenset({"contains", "bcontains", "icontains", "glob", "iglob", "regex"})
+# Extra cost of a transformer applied to a field
+TRANSFORMER_COST = 2
+# Items of the values of a comparison adding 1 to its cost
+LIST_ITEMS_COST = 50
+# Lists with more items are flagged by the cost analysis
+LARGE_LIST_ITEMS = 200
+# Event types a syscall rule that does not restrict them is evaluated for, about the number of
+# event types Falco captures
+UNRESTRICTED_EVENT_TYPES = 300
+
+# Operators, the longest first so that they are matched greedily
+_OPERATORS = (
+    "bstartswith",
+    "intersects",
+    "startswith",
+    "icontains",
+    "bcontains",
+    "endswith",
+    "contains",
+    "pmatch",
+    "exists",
+    "iglob",
+    "regex",
+    "glob",
+    "in",
+    "<=",
+    ">=",
+    "!=",
+    "==",
+    "=",
+    "<",
+    ">",
+)
+_LIST_OPERATORS = frozenset({"in", "intersects", "pmatch"})
+_TRANSFORMERS = frozenset({"tolower", "toupper", "b64", "basename", "len", "val"})
+
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+        |(?P<symbol><=|>=|!=|==|[()=<>,])
+        |(?P<word>[^\s()=<>!,"']+(?:\[[^\]]*\])?)
+    )""",
+    re.VERBOSE,
+)
+
+# The event types of a condition, None when it does not restrict them
+EventTypes = Optional[frozenset[str]]
+# Parsed condition: ("and" | "or", [conditions]), ("not", condition), ("cmp", field, op, values)
+# or ("macro", name)
+Condition = tuple
+
+
+class RulesParseError(Exception):
+    """Exception raised when a rule condition cannot be parsed."""
+
+
+class RuleCost(BaseModel):
+    """The estimated evaluation cost of a rule.
+
+    Attributes:
+        rule: The rule name.
+        cost: The cost of its condition times its event types, None if it cannot be parsed.
+        event_types: The number of event types the rule is evaluated for, None for all of them.
+        findings: The costly constructs of the condition.
+    """
+
+    rule: str
+    cost: Optional[int] = None
+    event_types: Optional[int] = None
+    findings: list[str] = []
+
+
+def rules_files(path: Path) -> list[Path]:
+    """List the rules files of a path the way Falco loads them.
+
+    Falco loads a rules file as is, and the regular files of a rules directory, whatever their
+    extension, in name order, without descending into its subdirectories.
+
+    Args:
+        path (Path): The rules file or directory
+
+    Returns:
+        The rules files, in loading order.
+    """
+    if not path.is_dir():
+        return [path]
+    return sorted(file for file in path.iterdir() if file.is_file())
+
+
+def derive_base_syscalls(paths: list[Path]) -> Optional[list[str]]:
+    """Derive the syscalls the enabled rules of the syscall source need.
+
+    Args:
+        paths (list[Path]): The rules files and directories, in loading order
+
+    Returns:
+        The sorted syscall names, or None if the rules need all the syscalls or there are no
+        syscall rules.
+    """
+    ruleset = Ruleset()
+    for path in paths:
+        for file in rules_files(path):
+            ruleset.load(file)
+
+    needed: set[str] = set()
+    rules = 0
+    for name, rule in ruleset.rules.items():
+        if not rule.get("enabled", True) or rule.get("source", SYSCALL_SOURCE) != SYSCALL_SOURCE:
+            continue
+        rules += 1
+        try:
+            event_types = ruleset.event_types(parse_condition(rule.get("condition", "")))
+        except RulesParseError as e:
+            logger.warning("Capturing all syscalls, failed to analyze rule %r: %s", name, e)
+            return None
+        if event_types is None:
+            logger.info("Capturing all syscalls, rule %r does not restrict event types", name)
+            return None
+        needed |= event_types
+    if not rules:
+        return None
+    return sorted(needed - NON_SYSCALL_EVENTS)
+
+
+def analyze_rules_cost(default_paths: list[Path], custom_paths: list[Path]) -> list[RuleCost]:
+    """Estimate the evaluation cost of the enabled rules added or changed by the custom rules.
+
+    The default rules are loaded first, so the custom rules can use their lists and macros.
+
+    Args:
+        default_paths (list[Path]): The default rules files and directories, in loading order
+        custom_paths (list[Path]): The custom rules files and directories, in loading order
+
+    Returns:
+        The rule costs, the most costly first.
+    """
+    ruleset = Ruleset()
+    for path in default_paths:
+        for file in rules_files(path):
+            ruleset.load(file)
+    default_rules = dict(ruleset.rules)
+    for path in custom_paths:
+        for file in rules_files(path):
+            ruleset.load(file)
+
+    costs = []
+    for name, rule in ruleset.rules.items():
+        if default_rules.get(name) == rule or not rule.get("enabled", True):
+            continue
+        findings: list[str] = []
+        try:
+            condition = parse_condition(rule.get("condition", ""))
+            cost = ruleset.cost(condition, findings)
+            event_types = ruleset.event_types(condition)
+        except RulesParseError as e:
+            costs.append(RuleCost(rule=name, findings=[f"condition not analyzed: {e}"]))
+            continue
+        if rule.get("source", SYSCALL_SOURCE) != SYSCALL_SOURCE:
+            event_types = frozenset({rule["source"]})
+        elif event_types is None:
+            findings.insert(0, "no event type restriction, evaluated for every event")
+        weight = UNRESTRICTED_EVENT_TYPES if event_types is None else max(len(event_types), 1)
+        costs.append(
+            RuleCost(
+                rule=name,
+                cost=round(cost * weight),
+                event_types=None if event_types is None else len(event_types),
+                findings=list(dict.fromkeys(findings)),
+            )
+        )
+    return sorted(costs, key=lambda rule_cost: -(rule_cost.cost or 0))
+
+
+class Ruleset:
+    """The lists, macros and rules of Falco rules files, with appends and overrides applied."""
+
+    def __init__(self) -> None:
+        """Initialize an empty ruleset."""
+        self.lists: dict[str, list[str]] = {}
+        self.macros: dict[str, str] = {}
+        self.rules: dict[str, dict] = {}
+        self._macro_event_types: dict[str, EventTypes] = {}
+        self._macro_costs: dict[str, tuple[float, list[str]]] = {}
+
+    def load(self, file: Path) -> None:
+        """Load a rules file.
+
+        Files that cannot be read or parsed are skipped, the validation of the rules reports them.
+
+        Args:
+            file (Path): The rules file
+        """
+        try:
+            items = yaml.safe_load(file.read_text(encoding="utf-8")) or []
+        except (OSError, UnicodeDecodeError, yaml.YAMLError):
+            logger.warning("Skipping unreadable rules file %s", file)
+            return
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            if "list" in item:
+                self._load_list(item)
+            elif "macro" in item:
+                self._load_macro(item)
+            elif "rule" in item:
+                self._load_rule(item)
+
+    def _load_list(self, item: dict) -> None:
+        """Load a list item.
+
+        Args:
+            item (dict): The list item
+        """
+        items = [str(value) for value in item.get("items") or []]
+        name = str(item["list"])
+        if _appends(item, "items") and name in self.lists:
+            self.lists[name] = self.lists[name] + items
+        else:
+            self.lists[name] = items
+
+    def _load_macro(self, item: dict) -> None:
+        """Load a macro item.
+
+        Args:
+            item (dict): The macro item
+        """
+        condition = str(item.get("condition", ""))
+        name = str(item["macro"])
+        if _appends(item, "condition") and name in self.macros:
+            self.macros[name] = f"{self.macros[name]} {condition}"
+        else:
+            self.macros[name] = condition
+
+    def _load_rule(self, item: dict) -> None:
+        """Load a rule item.
+
+        Args:
+            item (dict): The rule item
+        """
+        name = str(item["rule"])
+        rule = dict(self.rules.get(name, {}))
+        condition = item.get("condition")
+        if condition is not None and _appends(item, "condition") and "condition" in rule:
+            condition = f"{rule['condition']} {condition}"
+        rule.update(item)
+        if condition is not None:
+            rule["condition"] = str(condition)
+        self.rules[name] = rule
+
+    def event_types(self, condition: Condition) -> EventTypes:
+        """Get the event types a parsed condition matches on.
+
+        Args:
+            condition (Condition): The parsed condition
+
+        Returns:
+            The event types, or None if the condition does not restrict them.
+
+        Raises:
+            RulesParseError: If a macro condition cannot be parsed.
+        """
+        kind = condition[0]
+        if kind == "and":
+            restricted = [t for t in map(self.event_types, condition[1]) if t is not None]
+            return frozenset.intersection(*restricted) if restricted else None
+        if kind == "or":
+            event_types: set[str] = set()
+            for operand in condition[1]:
+                operand_event_types = self.event_types(operand)
+                if operand_event_types is None:
+                    return None
+                event_types |= operand_event_types
+            return frozenset(event_types)
+        if kind == "macro":
+            return self._macro(condition[1])
+        if kind == "cmp":
+            _, field, operator, values = condition
+            if field == "evt.type" and operator in ("=", "==", "in"):
+                return frozenset(self._expand(values))
+        # Negations and other operators on the event type do not restrict the event types
+        return None
+
+    def cost(self, condition: Condition, findings: list[str]) -> float:
+        """Estimate the cost of evaluating a parsed condition for an event.
+
+        Every comparison is counted, as if none was short-circuited.
+
+        Args:
+            condition (Condition): The parsed condition
+            findings (list[str]): The costly constructs found, appended to
+
+        Returns:
+            The cost of the condition.
+
+        Raises:
+            RulesParseError: If a macro condition cannot be parsed.
+        """
+        kind = condition[0]
+        if kind in ("and", "or"):
+            return sum(self.cost(operand, findings) for operand in condition[1])
+        if kind == "not":
+            return self.cost(condition[1], findings)
+        if kind == "macro":
+            return self._macro_cost(condition[1], findings)
+        _, field, operator, values = condition
+        cost = OPERATOR_COSTS.get(operator, 1)
+        if operator in EXPENSIVE_OPERATORS:
+            findings.append(f"expensive operator {operator} on {field}")
+        if "(" in field:
+            cost += TRANSFORMER_COST
+        for value in values:
+            if value in self.lists and len(self.lists[value]) > LARGE_LIST_ITEMS:
+                findings.append(f"large list {value} of {len(self.lists[value])} items")
+        items = len(list(self._expand(values)))
+        if items > LARGE_LIST_ITEMS and not any(value in self.lists for value in values):
+            findings.append(f"large value list of {items} items on {field}")
+        return cost + items // LIST_ITEMS_COST
+
+    def _macro_cost(self, name: str, findings: list[str]) -> float:
+        """Estimate the cost of evaluating a macro for an event.
+
+        Args:
+            name (str): The macro name
+            findings (list[str]): The costly constructs found, appended to
+
+        Returns:
+            The cost of the macro, 0 if it is unknown.
+
+        Raises:
+            RulesParseError: If the macro condition cannot be parsed.
+        """
+        if name not in self._macro_costs:
+            # Macros referencing themselves cost nothing more
+            self._macro_costs[name] = (0, [])
+            if name in self.macros:
+                macro_findings: list[str] = []
+                cost = self.cost(parse_condition(self.macros[name]), macro_findings)
+                self._macro_costs[name] = (cost, macro_findings)
+        cost, macro_findings = self._macro_costs[name]
+        findings.extend(macro_findings)
+        return cost
+
+    def _macro(self, name: str) -> EventTypes:
+        """Get the event types a macro matches on.
+
+        Args:
+            name (str): The macro name
+
+        Returns:
+            The event types, or None if the macro does not restrict them or is unknown.
+
+        Raises:
+            RulesParseError: If the macro condition cannot be parsed.
+        """
+        if name not in self._macro_event_types:
+            # Macros referencing themselves do not restrict the event types
+            self._macro_event_types[name] = None
+            if name in self.macros:
+                self._macro_event_types[name] = self.event_types(
+                    parse_condition(self.macros[name])
+                )
+        return self._macro_event_types[name]
+
+    def _expand(self, values: list[str], seen: frozenset[str] = frozenset()) -> Iterator[str]:
+        """Expand the list references of values.
+
+        Args:
+            values (list[str]): The values
+            seen (frozenset[str]): The lists being expanded
+
+        Yields:
+            The values, with the lists replaced by their items.
+        """
+        for value in values:
+            if value in self.lists and value not in seen:
+                yield from self._expand(self.lists[value], seen | {value})
+            else:
+                yield value
+
+
+def parse_condition(text: str) -> Condition:
+    """Parse a Falco rule condition.
+
+    Only the structure needed to find the event types is kept: the boolean operators, the
+    comparisons and the macro references.
+
+    Args:
+        text (str): The condition
+
+    Returns:
+        The parsed condition.
+
+    Raises:
+        RulesParseError: If the condition cannot be parsed.
+    """
+    parser = _Parser(_tokenize(text))
+    condition = parser.parse_or()
+    if parser.peek() is not None:
+        raise RulesParseError(f"unexpected {parser.peek()!r} in condition")
+    return condition
+
+
+def _appends(item: dict, field: str) -> bool:
+    """Check whether a rules file item appends to a field of a previous item.
+
+    Args:
+        item (dict): The rules file item
+        field (str): The field
+
+    Returns:
+        True if the item appends to the field.
+    """
+    override = item.get("override")
+    return bool(item.get("append")) or (
+        isinstance(override, dict) and override.get(field) == "append"
+    )
+
+
+def _tokenize(text: str) -> list[str]:
+    """Split a condition into tokens.
+
+    Args:
+        text (str): The condition
+
+    Returns:
+        The tokens.
+
+    Raises:
+        RulesParseError: If the condition holds an invalid token.
+    """
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise RulesParseError(f"invalid token at {text[position : position + 20]!r}")
+        tokens.append(match.group("string") or match.group("symbol") or match.group("word"))
+        position = match.end()
+        while position < len(text) and text[position].isspace():
+            position += 1
+    return tokens
+
+
+class _Parser:
+    """Recursive descent parser of Falco rule conditions."""
+
+    def __init__(self, tokens: list[str]) -> None:
+        """Initialize the parser.
+
+        Args:
+            tokens (list[str]): The condition tokens
+        """
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        """Get the next token without consuming it.
+
+        Returns:
+            The next token, or None at the end of the condition.
+        """
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def next(self) -> str:
+        """Consume the next token.
+
+        Returns:
+            The token.
+
+        Raises:
+            RulesParseError: At the end of the condition.
+        """
+        token = self.peek()
+        if token is None:
+            raise RulesParseError("unexpected end of condition")
+        self.position += 1
+        return token
+
+    def expect(self, expected: str) -> None:
+        """Consume the next token, which must be the expected one.
+
+        Args:
+            expected (str): The expected token
+
+        Raises:
+            RulesParseError: If the next token is another one.
+        """
+        token = self.next()
+        if token != expected:
+            raise RulesParseError(f"expected {expected!r}, got {token!r}")
+
+    def parse_or(self) -> Condition:
+        """Parse a disjunction.
+
+        Returns:
+            The parsed condition.
+        """
+        operands = [self.parse_and()]
+        while self.peek() == "or":
+            self.next()
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else ("or", operands)
+
+    def parse_and(self) -> Condition:
+        """Parse a conjunction.
+
+        Returns:
+            The parsed condition.
+        """
+        operands = [self.parse_not()]
+        while self.peek() == "and":
+            self.next()
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else ("and", operands)
+
+    def parse_not(self) -> Condition:
+        """Parse a negation, or a primary condition.
+
+        Returns:
+            The parsed condition.
+        """
+        if self.peek() == "not":
+            self.next()
+            return ("not", self.parse_not())
+        if self.peek() == "(":
+            self.next()
+            condition = self.parse_or()
+            self.expect(")")
+            return condition
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> Condition:
+        """Parse a comparison, or a macro reference.
+
+        Returns:
+            The parsed condition.
+
+        Raises:
+            RulesParseError: If the comparison is invalid.
+        """
+        field = self.next()
+        if field in _OPERATORS or field in ("and", "or", ")", ","):
+            raise RulesParseError(f"unexpected {field!r}")
+        if field in _TRANSFORMERS and self.peek() == "(":
+            field = f"{field}({self._parse_argument()})"
+        operator = self.peek()
+        if operator not in _OPERATORS:
+            return ("macro", field)
+        self.next()
+        if operator == "exists":
+            return ("cmp", field, operator, [])
+        if operator in _LIST_OPERATORS and self.peek() == "(":
+            return ("cmp", field, operator, self._parse_values())
+        value = self.next()
+        if value in _TRANSFORMERS and self.peek() == "(":
+            value = f"{value}({self._parse_argument()})"
+        return ("cmp", field, operator, [_unquote(value)])
+
+    def _parse_argument(self) -> str:
+        """Parse the parenthesized argument of a transformer.
+
+        Returns:
+            The argument.
+        """
+        self.expect("(")
+        tokens: list[str] = []
+        depth = 1
+        while True:
+            token = self.next()
+            depth += {"(": 1, ")": -1}.get(token, 0)
+            if depth == 0:
+                return " ".join(tokens)
+            tokens.append(token)
+
+    def _parse_values(self) -> list[str]:
+        """Parse a parenthesized list of values.
+
+        Returns:
+            The values, unquoted.
+        """
+        self.expect("(")
+        values = []
+        while self.peek() != ")":
+            values.append(_unquote(self.next()))
+            if self.peek() == ",":
+                self.next()
+        self.expect(")")
+        return values
+
+
+def _unquote(value: str) -> str:
+    """Remove the quotes around a value.
+
+    Args:
+        value (str): The value
+
+    Returns:
+        The value without quotes.
+    """
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
@@ -3,10 +3,14 @@
 
 """Falco workload management module."""
 
+import hashlib
+import json
 import logging
 import os
 import shutil
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
@@ -14,14 +18,21 @@ from charmlibs import systemd
 from cosl import JujuTopology
 from jinja2 import Environment, FileSystemLoader
 from ops.charm import CharmBase
+from pydantic import BaseModel
 
 import state
+from bundle import BundleError, CustomConfigBundle, pack, unpack
+from config import DEFAULT_HOST_KEY_REFRESH_INTERVAL, FALCO_PLUGINS, METRICS_COUNTERS
+from metrics import HookMetrics
+from rollout import ROLLED_BACK, source_revision
+from rules import RuleCost, analyze_rules_cost, derive_base_syscalls, rules_files
+from sync import ChangeSet, Generations, SyncError, TreeSync, write_file_atomic
+from tuning import EngineTuner
 
 logger = logging.getLogger(__name__)
 
 # Executable paths
 GIT = "/usr/bin/git"
-RSYNC = "/usr/bin/rsync"
 SSH_KEYSCAN = "/usr/bin/ssh-keyscan"
 
 # Ssh related paths
@@ -34,20 +45,35 @@ KNOWN_HOSTS_FILE = SSH_DIR / "known_hosts"
 FALCO_CUSTOM_RULES_KEY = "rules.d"
 FALCO_CUSTOM_CONFIGS_KEY = "config.override.d"
 
-# Clone output directory
+# Number of custom settings generations kept on disk, including the active one
+FALCO_GENERATIONS_TO_KEEP = 3
+# File of a generation holding the revision of its custom settings, with the staged rollout
+FALCO_REVISION_FILE = "revision"
+
+# Charm managed config override file. It is sorted last in the config override directory so that
+# the charm managed settings take precedence over the custom configs.
+FALCO_MANAGED_CONFIG_FILE = "zz-juju-managed.yaml"
+
+# Cache of the syscalls needed by the rules, in the charm state directory
+BASE_SYSCALLS_CACHE_FILE = "base-syscalls.json"
+# Cache of the estimated costs of the custom rules, in the charm state directory
+RULES_COST_CACHE_FILE = "rules-cost.json"
+
+# Persistent bare mirror of the custom config repository, and its worktree holding the checkout
+MIRROR_DIR = Path.home() / "custom-falco-config-repository.git"
+MIRROR_SYNCED_REF = "refs/charm/synced"
 CLONE_OUTPUT_DIR = Path.home() / "custom-falco-config-repository"
+# Custom config bundle published by the leader, unpacked
+BUNDLE_OUTPUT_DIR = Path.home() / "custom-falco-config-bundle"
 
 
 FALCO_SERVICE_NAME = "falco"
+CHARM_METRICS_SERVICE_NAME = "falco-charm-metrics"
 
 TEMPLATE_DIR = "src/templates"
 SYSTEMD_SERVICE_DIR = Path("/etc/systemd/system")
 
 
-class RsyncError(Exception):
-    """Exception raised when rsync fails."""
-
-
 class GitCloneError(Exception):
     """Exception raised when git clone fails."""
 
@@ -68,6 +94,44 @@ class FalcoConfigurationError(Exception):
     """Exception raised when Falco configuration fails."""
 
 
+class FalcoRulesValidationError(FalcoConfigurationError):
+    """Exception raised when a custom rules file fails validation.
+
+    Attributes:
+        file_name: The name of the first rules file that failed validation.
+    """
+
+    def __init__(self, file_name: str, message: str) -> None:
+        """Initialize the exception.
+
+        Args:
+            file_name (str): The name of the rules file that failed validation
+            message (str): The validation error
+        """
+        super().__init__(f"Invalid rules file {file_name}: {message}")
+        self.file_name = file_name
+
+
+class FalcoRulesCostError(FalcoConfigurationError):
+    """Exception raised when a custom rule is estimated to cost more than allowed.
+
+    Attributes:
+        rule: The name of the most costly rule.
+        cost: The estimated cost of the rule.
+    """
+
+    def __init__(self, rule: str, cost: int) -> None:
+        """Initialize the exception.
+
+        Args:
+            rule (str): The name of the most costly rule
+            cost (int): The estimated cost of the rule
+        """
+        super().__init__(f"Rule {rule} estimated cost {cost} is above the limit")
+        self.rule = rule
+        self.cost = cost
+
+
 class FalcoLayout:
     """Falco file layout.
 
@@ -88,8 +152,24 @@ class FalcoLayout:
         self.home = base_dir
         if not self.home.exists() or not self.home.is_dir():
             raise ValueError(f"Base directory {self.home} does not exist or is not a directory")
-        self.rules_dir.mkdir(parents=True, exist_ok=True)
-        self.configs_dir.mkdir(parents=True, exist_ok=True)
+        self._link_generations()
+
+    def _link_generations(self) -> None:
+        """Link the rules and configuration directories to the active generation.
+
+        Directories left by a charm revision predating the generations are moved into the active
+        generation, so the rules and configs they hold are kept.
+        """
+        current = Generations(self.generations_dir, self.current_dir).ensure()
+        for link in (self.rules_dir, self.configs_dir):
+            if link.is_symlink():
+                continue
+            if link.is_dir():
+                shutil.rmtree(current / link.name, ignore_errors=True)
+                link.rename(current / link.name)
+            else:
+                (current / link.name).mkdir(parents=True, exist_ok=True)
+            link.symlink_to(Path(self.current_dir.name) / link.name)
 
     @property
     def cmd(self) -> Path:
@@ -101,6 +181,17 @@ class FalcoLayout:
         """Get the full path to the Falco plugins directory."""
         return self.home / self._plugins_dir
 
+    def plugin_library(self, name: str) -> Path:
+        """Get the full path to the library of a Falco plugin.
+
+        Args:
+            name (str): The plugin name
+
+        Returns:
+            The path to the plugin shared library.
+        """
+        return self.plugins_dir / f"lib{name}.so"
+
     @property
     def default_rules_dir(self) -> Path:
         """Get the full path to the Falco default rules directory."""
@@ -108,19 +199,39 @@ class FalcoLayout:
 
     @property
     def rules_dir(self) -> Path:
-        """Get the full path to the Falco rules directory."""
+        """Get the full path to the Falco rules directory, a link into the active generation."""
         return self.home / "etc/falco/rules.d"
 
     @property
     def configs_dir(self) -> Path:
-        """Get the full path to the Falco configuration directory."""
-        return self.home / "etc/falco/config.overrides.d"
+        """Get the full path to the Falco config directory, a link into the active generation."""
+        return self.home / "etc/falco/config.override.d"
+
+    @property
+    def generations_dir(self) -> Path:
+        """Get the full path to the directory holding the rules and configuration generations."""
+        return self.home / "etc/falco/generations"
+
+    @property
+    def current_dir(self) -> Path:
+        """Get the full path to the link to the active rules and configuration generation."""
+        return self.home / "etc/falco/current"
 
     @property
     def config_file(self) -> Path:
         """Get the full path to the Falco configuration file."""
         return self.home / "etc/falco/falco.yaml"
 
+    @property
+    def state_dir(self) -> Path:
+        """Get the full path to the directory holding charm managed state."""
+        return self.home / "var/lib/falco"
+
+    @property
+    def http_output_ca_file(self) -> Path:
+        """Get the full path to the CA certificate verifying the http output endpoint."""
+        return self.home / "etc/falco/certs/http-output-ca.pem"
+
 
 class Template:
     """Template file manager."""
@@ -144,6 +255,15 @@ class Template:
         """Install template file."""
         self._render(self.context)
 
+    def update(self, context: dict) -> None:
+        """Update the template file with new context.
+
+        Args:
+            context (dict): A dictionary containing new context values
+        """
+        self.context.update(context)
+        self.install()
+
     def remove(self) -> None:
         """Remove template file."""
         if self.destination.exists():
@@ -160,10 +280,14 @@ class Template:
         """
         try:
             logger.debug("Generating template file at %s", self.destination)
-            content = self._template.render(context)
+            content = self._template.render(context).encode("utf-8")
+            # Leave an unchanged file untouched, so that file watchers such as Falco's do not fire
+            if self.destination.is_file() and self.destination.read_bytes() == content:
+                logger.debug("Template file at %s is up to date", self.destination)
+                return
             if not self.destination.parent.exists():
                 self.destination.parent.mkdir(parents=True, exist_ok=True)
-            self.destination.write_text(content, encoding="utf-8")
+            write_file_atomic(self.destination, content)
             logger.debug("Template file generated at %s", self.destination)
         except OSError as e:
             logger.exception("Failed to write template to %s", self.destination)
@@ -177,116 +301,724 @@ class FalcoServiceFile(Template):
     template: str = "falco.service.j2"
     service_file: Path = SYSTEMD_SERVICE_DIR / f"{FALCO_SERVICE_NAME}.service"
 
-    def __init__(self, falco_layout: FalcoLayout, charm: CharmBase) -> None:
+    def __init__(self, falco_layout: FalcoLayout) -> None:
         """Initialize the Falco service file manager.
 
         Args:
             falco_layout: The Falco file layout.
-            charm: The charm instance.
         """
+        self.falco_layout = falco_layout
         context = {
             "command": str(falco_layout.cmd),
             "rules_dir": str(falco_layout.rules_dir),
             "config_file": str(falco_layout.config_file),
             "falco_home": str(falco_layout.home),
-            "juju_topology": JujuTopology.from_charm(charm).as_dict(),
+            "plugin_options": _plugin_options(falco_layout, list(FALCO_PLUGINS)),
+            "engine_options": [],
         }
         super().__init__(self.template, self.service_file, context=context)
 
-    def update(self, context: dict) -> None:
-        """Update the Falco service file with new context.
-
-        Args:
-            context: A dictionary containing new context values.
-        """
-        self.context.update(context)
-        self.install()
-
 
 class FalcoConfigFile(Template):
     """Falco config file manager."""
 
     template: str = "falco.yaml.j2"
 
-    def __init__(self, falco_layout: FalcoLayout) -> None:
-        """Initialize the Falco config file manager."""
+    def __init__(self, falco_layout: FalcoLayout, destination: Optional[Path] = None) -> None:
+        """Initialize the Falco config file manager.
+
+        Args:
+            falco_layout: The Falco file layout.
+            destination: Where to render the config file, if not the one of the Falco service.
+        """
         super().__init__(
             self.template,
-            falco_layout.config_file,
+            destination or falco_layout.config_file,
             context={
                 "falco_home": str(falco_layout.home),
+                "configs_dir": str(falco_layout.configs_dir),
+                "plugins": list(FALCO_PLUGINS),
             },
         )
 
 
+class FalcoOverrideConfigFile(Template):
+    """Falco charm managed config override file manager.
+
+    The override file holds the settings that Falco can hot reload, so changing them does not
+    require a restart of the Falco service.
+    """
+
+    template: str = "falco.override.yaml.j2"
+
+    def __init__(self, falco_layout: FalcoLayout, charm: CharmBase) -> None:
+        """Initialize the Falco config override file manager.
+
+        Args:
+            falco_layout: The Falco file layout.
+            charm: The charm instance.
+        """
+        defaults = state.CharmState()
+        context = {
+            "juju_topology": JujuTopology.from_charm(charm).as_dict(),
+            "metrics": defaults.metrics.model_dump(),
+            "metrics_counters": METRICS_COUNTERS,
+            "outputs": defaults.outputs,
+            "payload": defaults.payload.model_dump(),
+            "event_topology": defaults.event_topology,
+            "outputs_queue_capacity": defaults.outputs_queue_capacity,
+            "min_priority": defaults.min_priority,
+            "http_output_keep_alive": defaults.http_output_keep_alive,
+            "http_output_compress_uploads": defaults.http_output_compress_uploads,
+            "http_output_ca_file": None,
+            "machine_units": defaults.machine_units,
+        }
+        super().__init__(
+            self.template, falco_layout.configs_dir / FALCO_MANAGED_CONFIG_FILE, context=context
+        )
+        self.ca_file = falco_layout.http_output_ca_file
+
+    def install_ca(self, ca: Optional[str]) -> Optional[Path]:
+        """Install the CA certificate verifying the http output endpoint.
+
+        Args:
+            ca (Optional[str]): The PEM encoded CA certificate, or None to remove it
+
+        Returns:
+            The path to the CA certificate, or None if there is none.
+
+        Raises:
+            TemplateRenderError: If writing the CA certificate fails
+        """
+        try:
+            if ca is None:
+                self.ca_file.unlink(missing_ok=True)
+                return None
+            if not self.ca_file.is_file() or self.ca_file.read_text(encoding="utf-8") != ca:
+                self.ca_file.parent.mkdir(parents=True, exist_ok=True)
+                write_file_atomic(self.ca_file, ca.encode("utf-8"))
+        except OSError as e:
+            logger.exception("Failed to write CA certificate to %s", self.ca_file)
+            raise TemplateRenderError(f"Failed to write CA certificate to {self.ca_file}") from e
+        return self.ca_file
+
+
+class FalcoRulesValidator:
+    """Falco custom rules validator.
+
+    Each rules file is validated on its own with the bundled Falco binary, in parallel, and the
+    results are cached by the content hash of the file, so unchanged files are not validated
+    again. Files failing on their own, for example because they use a macro defined in another
+    file, are validated again together with the other files, in Falco's load order. The rules are
+    validated with the config overrides they are activated with.
+    """
+
+    file_name: str = "rules-validation.json"
+    config_file_name: str = "rules-validation.yaml"
+
+    def __init__(self, falco_layout: FalcoLayout) -> None:
+        """Initialize the Falco rules validator.
+
+        Args:
+            falco_layout (FalcoLayout): The Falco file layout
+        """
+        self.falco_layout = falco_layout
+        self.path = falco_layout.state_dir / self.file_name
+        self.plugins = list(FALCO_PLUGINS)
+
+    def validate(self, rules_dir: Path, configs_dir: Optional[Path] = None) -> None:
+        """Validate the rules files of a directory.
+
+        Args:
+            rules_dir (Path): The directory holding the rules files
+            configs_dir (Optional[Path]): The directory holding the config overrides the rules are
+                activated with, if not the active one
+
+        Raises:
+            FalcoRulesValidationError: If a rules file is invalid
+        """
+        files = rules_files(rules_dir)
+        if not files:
+            return
+
+        config_file = self.falco_layout.config_file
+        if configs_dir is not None and configs_dir != self.falco_layout.configs_dir:
+            config_file = self.falco_layout.state_dir / self.config_file_name
+            FalcoConfigFile(self.falco_layout, config_file).update(
+                context={"configs_dir": str(configs_dir), "plugins": self.plugins}
+            )
+        configs_dir = configs_dir or self.falco_layout.configs_dir
+        engine = self._engine_digest(config_file, configs_dir)
+        keys = {
+            file: hashlib.sha256(f"{engine}\0".encode() + file.read_bytes()).hexdigest()
+            for file in files
+        }
+        # The failing files may depend on other files, so they are validated together with them
+        all_key = hashlib.sha256("".join(keys[file] for file in files).encode()).hexdigest()
+        cache = self._load()
+        results = {key: cache[key] for key in [*keys.values(), all_key] if key in cache}
+        pending = [file for file in files if keys[file] not in results]
+        if pending:
+            logger.info("Validating %d of %d rules files", len(pending), len(files))
+            with ThreadPoolExecutor(max_workers=min(len(pending), os.cpu_count() or 1)) as pool:
+                errors = pool.map(lambda file: self._run(config_file, [file]), pending)
+                for file, error in zip(pending, errors, strict=True):
+                    results[keys[file]] = error
+            self._save(results)
+
+        failed = [file for file in files if results[keys[file]] is not None]
+        if not failed:
+            return
+        if all_key not in results:
+            results[all_key] = self._run(config_file, files)
+            self._save(results)
+        if results[all_key] is not None:
+            error = str(results[keys[failed[0]]])
+            logger.error("Rules file %s is invalid: %s", failed[0].name, error)
+            raise FalcoRulesValidationError(failed[0].name, error)
+
+    def _run(self, config_file: Path, files: list[Path]) -> Optional[str]:
+        """Validate rules files with the Falco binary.
+
+        Args:
+            config_file (Path): The Falco config file
+            files (list[Path]): The rules files, in load order
+
+        Returns:
+            The validation error, or None if the files are valid.
+        """
+        validate_cmd = [
+            str(self.falco_layout.cmd),
+            "-c",
+            str(config_file),
+            *[
+                arg
+                for option in _plugin_options(self.falco_layout, self.plugins)
+                for arg in ("-o", option)
+            ],
+            *[arg for file in files for arg in ("-V", str(file))],
+        ]
+        try:
+            logger.debug("Falco validate command: %s", validate_cmd)
+            subprocess.run(validate_cmd, check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as e:
+            output = (e.stdout or "") + (e.stderr or "")
+            lines = [line.strip() for line in output.splitlines() if line.strip()]
+            return "; ".join(lines[-3:]) or f"exit status {e.returncode}"
+        except OSError as e:
+            return str(e)
+        return None
+
+    def _engine_digest(self, config_file: Path, configs_dir: Path) -> str:
+        """Get the digest of what the validation depends on besides the rules files.
+
+        Args:
+            config_file (Path): The Falco config file
+            configs_dir (Path): The directory holding the config overrides
+
+        Returns:
+            The hex digest of the Falco binary, its config files and the loaded plugins.
+        """
+        digest = hashlib.sha256(_hash_paths([config_file, configs_dir]).encode())
+        digest.update(f"{','.join(self.plugins)}\0".encode())
+        for path in [self.falco_layout.cmd, *map(self.falco_layout.plugin_library, self.plugins)]:
+            try:
+                stat = path.stat()
+                digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+            except OSError:
+                digest.update(f"{path}\0".encode())
+        return digest.hexdigest()
+
+    def _load(self) -> dict[str, Optional[str]]:
+        """Load the cached validation results.
+
+        Returns:
+            The validation errors keyed by cache key, None for valid files.
+        """
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, results: dict[str, Optional[str]]) -> None:
+        """Save the validation results, dropping the results of files no longer synced.
+
+        Args:
+            results (dict[str, Optional[str]]): The validation errors keyed by cache key
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(results), encoding="utf-8")
+
+
 class FalcoCustomSetting:
     """Falco custom setting manager.
 
     Falco custom setting means the custom falco configuration files and custom falco rules files.
     """
 
-    def __init__(self, falco_layout: FalcoLayout) -> None:
+    def __init__(
+        self,
+        falco_layout: FalcoLayout,
+        validator: Optional[FalcoRulesValidator] = None,
+        metrics: Optional[HookMetrics] = None,
+    ) -> None:
         """Initialize the Falco custom setting manager.
 
         Args:
             falco_layout (FalcoLayout): The Falco file layout
+            validator (Optional[FalcoRulesValidator]): The validator of the custom rules, if any
+            metrics (Optional[HookMetrics]): The hook metrics timing the configuration phases
         """
         self.falco_layout = falco_layout
+        self.validator = validator
+        self.metrics = metrics or HookMetrics()
+        self.generations = Generations(
+            falco_layout.generations_dir, falco_layout.current_dir, keep=FALCO_GENERATIONS_TO_KEEP
+        )
 
     def install(self) -> None:
         """Install the Falco custom settings."""
         logger.info("Installing Falco custom settings")
 
         # Ensure the custom rules and config directories exist
-        self.falco_layout.rules_dir.mkdir(parents=True, exist_ok=True)
-        self.falco_layout.configs_dir.mkdir(parents=True, exist_ok=True)
+        self.generations.ensure((FALCO_CUSTOM_RULES_KEY, FALCO_CUSTOM_CONFIGS_KEY))
 
         # Ensure SSH directory exists
         SSH_DIR.mkdir(mode=0o700, exist_ok=True)
 
+        # Drop the checkout so that the next configuration pulls the custom settings again
+        shutil.rmtree(CLONE_OUTPUT_DIR, ignore_errors=True)
+
         logger.info("Falco custom settings installed")
 
-    def remove(self) -> None:
-        """Remove the Falco custom settings."""
+    def remove(self) -> ChangeSet:
+        """Remove the Falco custom settings.
+
+        Returns:
+            The changes made to the custom rules and config directories.
+        """
         logger.info("Removing Falco custom settings")
 
-        # Remove all custom rules files
-        for rule_file in self.falco_layout.rules_dir.glob("*.yaml"):
-            rule_file.unlink()
+        # Remove all custom rules and config files, but the charm managed config file
+        changes = self._sync(None)
 
-        # Remove all custom config files
-        for config_file in self.falco_layout.configs_dir.glob("*.yaml"):
-            config_file.unlink()
+        # Drop the checkout so that the custom settings are pulled again if they are reconfigured
+        shutil.rmtree(CLONE_OUTPUT_DIR, ignore_errors=True)
+        shutil.rmtree(BUNDLE_OUTPUT_DIR, ignore_errors=True)
 
         logger.info("Falco custom settings removed")
+        return changes
 
-    def configure(self, charm_state: state.CharmState) -> None:
+    def configure(self, charm_state: state.CharmState) -> ChangeSet:
         """Configure the Falco custom settings.
 
         Args:
             charm_state (CharmState): The charm state
+
+        Returns:
+            The changes made to the custom rules and config directories.
         """
+        # The custom rules are validated with the plugins the service loads
+        if self.validator is not None:
+            self.validator.plugins = charm_state.plugins
+
         if not charm_state.custom_config_repo:
             logger.info("No custom config repository set")
             logger.debug("Removing Falco custom settings")
-            self.remove()
-            return
+            return self.remove()
 
         logger.info("Configuring Falco custom settings")
 
-        # Sync custom configuration repository
-        _git_sync(
-            str(charm_state.custom_config_repo),
-            str(charm_state.custom_config_repo.host),
-            ref=charm_state.custom_config_repo_ref,
-            ssh_private_key=charm_state.custom_config_repo_ssh_key,
+        if charm_state.fetch_custom_config:
+            self.fetch(charm_state)
+            source = CLONE_OUTPUT_DIR
+        elif charm_state.custom_config_bundle is not None:
+            with self.metrics.span("unpack_bundle"):
+                unpack(charm_state.custom_config_bundle, BUNDLE_OUTPUT_DIR)
+            source = BUNDLE_OUTPUT_DIR
+        else:
+            logger.info("Waiting for the leader to publish the custom config bundle")
+            return ChangeSet()
+
+        # With the staged rollout, a revision is only applied once the rollout reaches the unit,
+        # and the previous generation is activated back when the rollout is rolled back
+        revision = None
+        plan = charm_state.custom_config_rollout
+        if plan is not None:
+            rollout = plan.rollout
+            if (
+                rollout is not None
+                and rollout.status == ROLLED_BACK
+                and rollout.revision == self.current_revision()
+            ):
+                with self.metrics.span("rollback"):
+                    self.generations.rollback()
+                logger.info("Custom settings revision %s rolled back", rollout.revision)
+            revision = source_revision(source, (FALCO_CUSTOM_RULES_KEY, FALCO_CUSTOM_CONFIGS_KEY))
+            if not plan.admits(revision):
+                logger.info("Waiting for the rollout of the custom settings revision %s", revision)
+                return ChangeSet()
+
+        # Custom rules estimated to cost more than allowed are rejected before being staged
+        if charm_state.rules_max_cost:
+            with self.metrics.span("analyze_cost"):
+                costs = self.rules_cost(source / FALCO_CUSTOM_RULES_KEY)
+            if costs and (costs[0].cost or 0) > charm_state.rules_max_cost:
+                logger.error("Custom rules too costly: %s", costs[0].model_dump())
+                raise FalcoRulesCostError(costs[0].rule, costs[0].cost or 0)
+
+        # Sync configuration files from the checkout or the bundle to falco config directories.
+        # This is a no-op when they match the active generation, and retries a checkout that was
+        # rejected by the validation.
+        changes = self._sync(source, revision)
+
+        logger.info("Falco custom settings configured")
+        return changes
+
+    def fetch(self, charm_state: state.CharmState) -> None:
+        """Fetch the custom config repository.
+
+        Args:
+            charm_state (CharmState): The charm state
+        """
+        if not charm_state.custom_config_repo:
+            return
+        with self.metrics.span("git_sync"):
+            synced = _git_sync(
+                str(charm_state.custom_config_repo),
+                str(charm_state.custom_config_repo.host),
+                ref=charm_state.custom_config_repo_ref,
+                ssh_private_key=charm_state.custom_config_repo_ssh_key,
+                host_key=charm_state.custom_config_repo_host_key,
+                host_key_refresh_interval=charm_state.custom_config_repo_host_key_refresh_interval,
+            )
+        if not synced:
+            logger.info("Custom config repository already up to date")
+
+    def bundle(self) -> CustomConfigBundle:
+        """Pack the fetched custom config repository into a bundle for the other units.
+
+        Returns:
+            The custom config bundle.
+        """
+        with self.metrics.span("pack_bundle"):
+            return pack(CLONE_OUTPUT_DIR, (FALCO_CUSTOM_RULES_KEY, FALCO_CUSTOM_CONFIGS_KEY))
+
+    def revision(self, charm_state: state.CharmState) -> Optional[str]:
+        """Get the revision of the fetched or unpacked custom config repository.
+
+        Args:
+            charm_state (CharmState): The charm state
+
+        Returns:
+            The revision, or None if there is no custom config repository to apply.
+        """
+        source = CLONE_OUTPUT_DIR if charm_state.fetch_custom_config else BUNDLE_OUTPUT_DIR
+        if not charm_state.custom_config_repo or not source.is_dir():
+            return None
+        return source_revision(source, (FALCO_CUSTOM_RULES_KEY, FALCO_CUSTOM_CONFIGS_KEY))
+
+    def current_revision(self) -> Optional[str]:
+        """Get the revision of the active custom settings, as applied by the staged rollout.
+
+        Returns:
+            The revision, or None if the active custom settings were not staged.
+        """
+        current = self.generations.current
+        if current is None:
+            return None
+        try:
+            return (current / FALCO_REVISION_FILE).read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def digest(self) -> str:
+        """Get the digest of the active custom rules and config files.
+
+        The digest is computed from the sync manifests, so the files are not read again.
+
+        Returns:
+            The hex digest of the custom rules and config files.
+        """
+        digest = hashlib.sha256()
+        current = self.generations.current
+        if current is not None:
+            for key in (FALCO_CUSTOM_RULES_KEY, FALCO_CUSTOM_CONFIGS_KEY):
+                digest.update(self._tree_sync(current, key).digest().encode())
+        return digest.hexdigest()
+
+    def base_syscalls(self) -> Optional[list[str]]:
+        """Get the syscalls the active custom rules need.
+
+        Falco only loads the rules of the rules directory, so the default rules are not analyzed.
+        The result is cached by the digest of the custom rules, so unchanged rules are not
+        analyzed again.
+
+        Returns:
+            The syscall names, or None if the rules need all the syscalls.
+        """
+        key = self.digest()
+        cache_file = self.falco_layout.state_dir / BASE_SYSCALLS_CACHE_FILE
+        try:
+            cached = json.loads(cache_file.read_text(encoding="utf-8"))
+            if cached.get("key") == key:
+                return cached.get("base_syscalls")
+        except (OSError, ValueError):
+            pass
+
+        base_syscalls = derive_base_syscalls([self.falco_layout.rules_dir])
+        logger.info("Falco rules need syscalls: %s", base_syscalls or "all")
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(
+                cache_file, json.dumps({"key": key, "base_syscalls": base_syscalls}).encode()
+            )
+        except OSError:
+            logger.exception("Failed to cache the syscalls needed by the Falco rules")
+        return base_syscalls
+
+    def rules_cost(self, rules_dir: Path) -> list[RuleCost]:
+        """Estimate the evaluation cost of the custom rules.
+
+        Falco only loads the rules of the rules directory, so all its enabled rules are estimated,
+        and the default rules are not loaded. The result is cached by the digest of the rules, so
+        unchanged rules are not analyzed again.
+
+        Args:
+            rules_dir (Path): The directory holding the custom rules
+
+        Returns:
+            The rule costs, the most costly first.
+        """
+        key = _hash_paths([rules_dir])
+        cache_file = self.falco_layout.state_dir / RULES_COST_CACHE_FILE
+        try:
+            cached = json.loads(cache_file.read_text(encoding="utf-8"))
+            if cached.get("key") == key:
+                return [RuleCost.model_validate(cost) for cost in cached.get("costs", [])]
+        except (OSError, ValueError):
+            pass
+
+        costs = analyze_rules_cost([], [rules_dir])
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(
+                cache_file,
+                json.dumps({"key": key, "costs": [cost.model_dump() for cost in costs]}).encode(),
+            )
+        except OSError:
+            logger.exception("Failed to cache the estimated costs of the custom rules")
+        return costs
+
+    def _sync(self, source: Optional[Path], revision: Optional[str] = None) -> ChangeSet:
+        """Sync the custom settings to a new generation, and activate it.
+
+        The generation is only staged when the active one differs from the source, and Falco sees
+        the new rules and configs at once when the generation is activated. A generation whose
+        rules fail validation is discarded, leaving the active one untouched.
+
+        Args:
+            source (Optional[Path]): The directory holding the custom settings, if any
+            revision (Optional[str]): The revision of the custom settings, with the staged rollout
+
+        Returns:
+            The changes made to the custom rules and config directories.
+
+        Raises:
+            FalcoRulesValidationError: If a custom rules file is invalid
+        """
+        keys = (FALCO_CUSTOM_RULES_KEY, FALCO_CUSTOM_CONFIGS_KEY)
+        with self.metrics.span("sync"):
+            current = self.generations.ensure(keys)
+            if not any(
+                self._tree_sync(current, key).plan(source / key if source else None)
+                for key in keys
+            ):
+                return ChangeSet()
+
+            staged = self.generations.stage()
+            try:
+                changes = ChangeSet()
+                for key in keys:
+                    changes += self._tree_sync(staged, key).sync(source / key if source else None)
+                # The staged generation is a copy of the active one, revision included
+                (staged / FALCO_REVISION_FILE).unlink(missing_ok=True)
+                if revision is not None:
+                    write_file_atomic(staged / FALCO_REVISION_FILE, revision.encode())
+            except SyncError:
+                self.generations.discard(staged)
+                raise
+            except OSError as e:
+                self.generations.discard(staged)
+                raise SyncError(f"Failed to record the revision of {staged}") from e
+
+        if self.validator is not None:
+            try:
+                with self.metrics.span("validate"):
+                    self.validator.validate(
+                        staged / FALCO_CUSTOM_RULES_KEY, staged / FALCO_CUSTOM_CONFIGS_KEY
+                    )
+            except FalcoRulesValidationError:
+                self.generations.discard(staged)
+                raise
+
+        with self.metrics.span("activate"):
+            self.generations.activate(staged)
+        return changes
+
+    def _tree_sync(self, generation: Path, key: str) -> TreeSync:
+        """Get the sync of a custom settings directory of a generation.
+
+        Args:
+            generation (Path): The generation directory
+            key (str): The custom settings directory name
+
+        Returns:
+            The tree sync of the directory, with its manifest kept in the generation.
+        """
+        if key == FALCO_CUSTOM_RULES_KEY:
+            return TreeSync(
+                generation / key, generation / f"{key}.manifest.json", loaded=rules_files
+            )
+        return TreeSync(
+            generation / key,
+            generation / f"{key}.manifest.json",
+            exclude=(FALCO_MANAGED_CONFIG_FILE,),
         )
 
-        # Pull configuration files from the custom repository to falco config directories
-        _pull_falco_rule_files(f"{self.falco_layout.rules_dir}/")
-        _pull_falco_config_files(f"{self.falco_layout.configs_dir}/")
 
-        logger.info("Falco custom settings configured")
+class CharmMetricsService:
+    """Charm hook metrics service manager.
+
+    The service serves the exported charm hook metrics to the COS agent on the loopback address.
+    """
+
+    service_name = CHARM_METRICS_SERVICE_NAME
+    template: str = "falco-charm-metrics.service.j2"
+    service_file: Path = SYSTEMD_SERVICE_DIR / f"{CHARM_METRICS_SERVICE_NAME}.service"
+
+    def __init__(self, metrics: HookMetrics, port: int) -> None:
+        """Initialize the charm hook metrics service manager.
+
+        Args:
+            metrics (HookMetrics): The hook metrics to serve
+            port (int): The port to serve the metrics on
+        """
+        self.metrics_dir = metrics.metrics_dir
+        self.unit_file = Template(
+            self.template,
+            self.service_file,
+            context={"directory": str(self.metrics_dir), "port": port},
+        )
+
+    def install(self) -> None:
+        """Install and start the charm hook metrics service."""
+        logger.info("Installing charm metrics service")
+        if self.metrics_dir is not None:
+            self.metrics_dir.mkdir(parents=True, exist_ok=True)
+        self.unit_file.install()
+        systemd.daemon_reload()
+        systemd.service_enable(self.service_name)
+        systemd.service_restart(self.service_name)
+
+    def remove(self) -> None:
+        """Stop and remove the charm hook metrics service."""
+        logger.info("Removing charm metrics service")
+        systemd.service_stop(self.service_name)
+        systemd.service_disable(self.service_name)
+        self.unit_file.remove()
+        systemd.daemon_reload()
+
+
+class FalcoFingerprint(BaseModel):
+    """The fingerprint of the Falco desired state.
+
+    Attributes:
+        restart: Digest of the settings that require restarting the Falco service.
+        reload: Digest of the settings that Falco can hot reload.
+    """
+
+    restart: str = ""
+    reload: str = ""
+
+
+class FalcoAppliedState:
+    """Record of the desired state last applied to the Falco service.
+
+    The record holds the fingerprint of the applied desired state together with counters of the
+    reconciliation outcomes (restarted, reloaded, or skipped).
+    """
+
+    file_name: str = "applied-state.json"
+
+    def __init__(self, falco_layout: FalcoLayout) -> None:
+        """Initialize the applied state record.
+
+        Args:
+            falco_layout (FalcoLayout): The Falco file layout
+        """
+        self.path = falco_layout.state_dir / self.file_name
+
+    def _load(self) -> dict:
+        """Load the applied state record.
+
+        Returns:
+            The applied state record, or an empty record if it does not exist or is unreadable.
+        """
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, record: dict) -> None:
+        """Save the applied state record.
+
+        Args:
+            record (dict): The applied state record
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(record), encoding="utf-8")
+
+    @property
+    def fingerprint(self) -> FalcoFingerprint:
+        """Get the fingerprint of the last applied desired state."""
+        return FalcoFingerprint(**self._load().get("fingerprint", {}))
+
+    def count(self, outcome: str) -> int:
+        """Get the number of reconciliations with the given outcome.
+
+        Args:
+            outcome (str): One of "restarted", "reloaded" or "skipped"
+
+        Returns:
+            The number of reconciliations with the outcome.
+        """
+        return self._load().get("counters", {}).get(outcome, 0)
+
+    def record(self, outcome: str, fingerprint: Optional[FalcoFingerprint] = None) -> None:
+        """Record the outcome of a reconciliation.
+
+        Args:
+            outcome (str): One of "restarted", "reloaded" or "skipped"
+            fingerprint (Optional[FalcoFingerprint]): The applied fingerprint, if any was applied
+        """
+        record = self._load()
+        counters = record.setdefault("counters", {})
+        counters[outcome] = counters.get(outcome, 0) + 1
+        if fingerprint is not None:
+            record["fingerprint"] = fingerprint.model_dump()
+        self._save(record)
+
+    @property
+    def counters(self) -> dict[str, int]:
+        """Get the number of reconciliations by outcome."""
+        return dict(self._load().get("counters", {}))
+
+    def reset(self) -> None:
+        """Forget the last applied desired state, so the next reconciliation applies it."""
+        record = self._load()
+        record.pop("fingerprint", None)
+        self._save(record)
 
 
 class FalcoService:
@@ -295,12 +1027,22 @@ class FalcoService:
     def __init__(
         self,
         config_file: FalcoConfigFile,
+        override_config_file: FalcoOverrideConfigFile,
         service_file: FalcoServiceFile,
         custom_setting: FalcoCustomSetting,
+        applied_state: FalcoAppliedState,
+        metrics: Optional[HookMetrics] = None,
+        metrics_service: Optional[CharmMetricsService] = None,
+        tuner: Optional[EngineTuner] = None,
     ) -> None:
         self.config_file = config_file
+        self.override_config_file = override_config_file
         self.service_file = service_file
         self.custom_setting = custom_setting
+        self.applied_state = applied_state
+        self.metrics = metrics or HookMetrics()
+        self.metrics_service = metrics_service
+        self.tuner = tuner
 
     def install(self) -> None:
         """Install and configure the Falco service."""
@@ -309,8 +1051,14 @@ class FalcoService:
         self.config_file.install()
         self.service_file.install()
         self.custom_setting.install()
+        self.override_config_file.install()
 
         systemd.service_enable(self.service_file.service_name)
+        if self.metrics_service is not None:
+            self.metrics_service.install()
+
+        # The Falco binary may have changed, so the next reconciliation must restart the service
+        self.applied_state.reset()
 
         logger.info("Falco service installed")
 
@@ -323,8 +1071,12 @@ class FalcoService:
         systemd.daemon_reload()
 
         self.config_file.remove()
+        self.override_config_file.remove()
         self.service_file.remove()
         self.custom_setting.remove()
+        self.applied_state.reset()
+        if self.metrics_service is not None:
+            self.metrics_service.remove()
 
         logger.info("Falco service removed")
 
@@ -339,73 +1091,185 @@ class FalcoService:
         logger.info("Configuring Falco service")
 
         try:
-            self.custom_setting.configure(charm_state)
-            self.service_file.update(context={"http_output": charm_state.http_output})
-        except (GitCloneError, SshKeyScanError, RsyncError) as e:
+            with self.metrics.span("custom_settings"):
+                changes = self.custom_setting.configure(charm_state)
+            engine_options = []
+            if self.tuner is not None:
+                with self.metrics.span("host_profile"):
+                    tuning = self.tuner.tune(
+                        charm_state.engine_overrides, charm_state.buf_size_preset_bounds
+                    )
+                    engine_options = tuning.options()
+            base_syscalls = None
+            if charm_state.derive_base_syscalls:
+                with self.metrics.span("analyze_rules"):
+                    base_syscalls = self.custom_setting.base_syscalls()
+            with self.metrics.span("render_templates"):
+                ca_file = self.override_config_file.install_ca(
+                    (charm_state.http_output or {}).get("ca")
+                )
+                self.override_config_file.update(
+                    context={
+                        "http_output": charm_state.http_output,
+                        "http_output_ca_file": str(ca_file) if ca_file else None,
+                        "base_syscalls": base_syscalls,
+                        "metrics": charm_state.metrics.model_dump(),
+                        "outputs": charm_state.outputs,
+                        "payload": charm_state.payload.model_dump(),
+                        "event_topology": charm_state.event_topology,
+                        "outputs_queue_capacity": charm_state.outputs_queue_capacity,
+                        "min_priority": charm_state.min_priority,
+                        "http_output_keep_alive": charm_state.http_output_keep_alive,
+                        "http_output_compress_uploads": charm_state.http_output_compress_uploads,
+                        "machine_units": charm_state.machine_units,
+                    }
+                )
+                self.config_file.update(context={"plugins": charm_state.plugins})
+                self.service_file.update(
+                    context={
+                        "engine_options": engine_options,
+                        "plugin_options": _plugin_options(
+                            self.service_file.falco_layout, charm_state.plugins
+                        ),
+                    }
+                )
+        except (GitCloneError, SshKeyScanError, SyncError, BundleError) as e:
             logger.error("Failed to configure Falco custom settings: %s", e)
             raise FalcoConfigurationError("Failed to configure Falco service") from e
 
-        systemd.daemon_reload()
-        systemd.service_restart(self.service_file.service_name)
+        with self.metrics.span("fingerprint"):
+            fingerprint = self.fingerprint()
+            applied = self.applied_state.fingerprint
+        if fingerprint.restart != applied.restart or not self.check_active():
+            with self.metrics.span("daemon_reload"):
+                systemd.daemon_reload()
+            with self.metrics.span("restart"):
+                systemd.service_restart(self.service_file.service_name)
+            outcome = "restarted"
+        elif fingerprint.reload != applied.reload:
+            with self.metrics.span("reload"):
+                systemd.service_reload(self.service_file.service_name, restart_on_failure=True)
+            outcome = "reloaded"
+        else:
+            outcome = "skipped"
+        self.applied_state.record(outcome, fingerprint)
+
+        logger.info(
+            "Falco desired state %s/%s %s (%d times), custom settings: %s",
+            fingerprint.restart[:12],
+            fingerprint.reload[:12],
+            outcome,
+            self.applied_state.count(outcome),
+            changes.model_dump() if changes else "unchanged",
+        )
+
+    def custom_config_bundle(
+        self, charm_state: state.CharmState, fetch: bool = False
+    ) -> CustomConfigBundle:
+        """Get the bundle of the custom settings, for the leader to publish to the other units.
+
+        Args:
+            charm_state (CharmState): The charm state
+            fetch (bool): Whether to fetch the repository first, as it was not configured
 
-        logger.info("Falco service configured and started")
+        Returns:
+            The custom config bundle.
+
+        Raises:
+            FalcoConfigurationError: If fetching or packing the custom settings fails
+        """
+        try:
+            if fetch:
+                self.custom_setting.fetch(charm_state)
+            return self.custom_setting.bundle()
+        except (GitCloneError, SshKeyScanError, BundleError) as e:
+            logger.error("Failed to bundle Falco custom settings: %s", e)
+            raise FalcoConfigurationError("Failed to bundle Falco custom settings") from e
+
+    def custom_config_revision(
+        self, charm_state: state.CharmState, fetch: bool = False
+    ) -> Optional[str]:
+        """Get the revision of the custom settings, for the leader to roll out to the units.
+
+        Args:
+            charm_state (CharmState): The charm state
+            fetch (bool): Whether to fetch the repository first, as it was not configured
+
+        Returns:
+            The revision, or None if there is no custom config repository to apply.
+
+        Raises:
+            FalcoConfigurationError: If fetching the custom settings fails
+        """
+        try:
+            if fetch:
+                self.custom_setting.fetch(charm_state)
+            return self.custom_setting.revision(charm_state)
+        except (GitCloneError, SshKeyScanError) as e:
+            logger.error("Failed to fetch Falco custom settings: %s", e)
+            raise FalcoConfigurationError("Failed to fetch Falco custom settings") from e
 
     def check_active(self) -> bool:
         """Check if the Falco service is active."""
         return systemd.service_running(self.service_file.service_name)
 
+    def fingerprint(self) -> FalcoFingerprint:
+        """Compute the fingerprint of the Falco desired state.
+
+        The restart part covers the rendered service file and the rendered config file, which
+        define the engine and the plugins. The reload part covers the custom rules and config
+        files, through their sync manifests, and the charm managed config override file, which
+        Falco hot reloads, with the http output CA certificate it points to.
+
+        Returns:
+            The fingerprint of the desired state.
+        """
+        return FalcoFingerprint(
+            restart=_hash_paths([self.service_file.destination, self.config_file.destination]),
+            reload=_hash_paths(
+                [self.override_config_file.destination, self.override_config_file.ca_file],
+                seed=self.custom_setting.digest(),
+            ),
+        )
 
-def _pull_falco_rule_files(destination: str) -> None:
-    """Pull falco config files from custom config repository.
+
+def _plugin_options(falco_layout: FalcoLayout, plugins: list[str]) -> list[str]:
+    """Get the Falco options loading the plugins.
 
     Args:
-        destination (str): The destination directory for the pulled files
+        falco_layout (FalcoLayout): The Falco file layout
+        plugins (list[str]): The plugins to load, in load order
 
-    Raises:
-        RsyncError: If rsync fails
+    Returns:
+        The options, as passed to Falco with `-o`.
     """
-    source = f"{CLONE_OUTPUT_DIR}/{FALCO_CUSTOM_RULES_KEY}/"
-    rsync_cmd = [
-        RSYNC,
-        "-av",
-        "--delete",
-        "--include=*.yaml",
-        "--",
-        source,
-        destination,
-    ]
-    try:
-        logger.debug("Rsync command: %s", rsync_cmd)
-        subprocess.run(rsync_cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        logging.error("Rsync failed from %s to %s", source, destination)
-        raise RsyncError(f"Rsync failed: {e.stderr}") from e
+    options = [f"load_plugins[{i}]={name}" for i, name in enumerate(plugins)]
+    for i, name in enumerate(plugins):
+        options.append(f"plugins[{i}].name={name}")
+        options.append(f"plugins[{i}].library_path={falco_layout.plugin_library(name)}")
+    return options
 
 
-def _pull_falco_config_files(destination: str) -> None:
-    """Pull falco config files from custom config repository.
+def _hash_paths(paths: list[Path], seed: str = "") -> str:
+    """Hash the content of files and directory trees.
 
     Args:
-        destination (str): The destination directory for the pulled files
+        paths (list[Path]): The files or directories to hash, in a stable order
+        seed (str): A digest of other content to include in the hash
 
-    Raises:
-        RsyncError: If rsync fails
+    Returns:
+        The hex digest of the paths' content; missing paths are hashed as empty.
     """
-    source = f"{CLONE_OUTPUT_DIR}/{FALCO_CUSTOM_CONFIGS_KEY}/"
-    rsync_cmd = [
-        RSYNC,
-        "-av",
-        "--delete",
-        "--include=*.yaml",
-        "--",
-        source,
-        destination,
-    ]
-    try:
-        subprocess.run(rsync_cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        logging.error("Rsync failed from %s to %s", source, destination)
-        raise RsyncError(f"Rsync failed: {e.stderr}") from e
+    digest = hashlib.sha256(seed.encode())
+    for path in paths:
+        digest.update(f"{path}\0".encode())
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            if not file.is_file():
+                continue
+            digest.update(f"{file.relative_to(path.parent)}\0".encode())
+            digest.update(hashlib.sha256(file.read_bytes()).digest())
+    return digest.hexdigest()
 
 
 def _git_sync(
@@ -413,31 +1277,44 @@ def _git_sync(
     hostname: str,
     ref: str = "",
     ssh_private_key: str = "",
-) -> None:
+    host_key: str = "",
+    host_key_refresh_interval: int = DEFAULT_HOST_KEY_REFRESH_INTERVAL,
+) -> bool:
     """Sync the repository to the specified destination.
 
+    The commit of the ref on the remote is probed first, and nothing is fetched if it is the
+    commit already checked out.
+
     Args:
         repo (str): The repository URL
         hostname (str): The host to scan for Ssh key
         ref (str): The branch or tag to checkout
         ssh_private_key (str): The SSH private key content
+        host_key (str): The pinned SSH host key; the host key is scanned if empty
+        host_key_refresh_interval (int): Seconds after which a scanned host key is scanned again
+
+    Returns:
+        True if a new commit has been checked out, False if the checkout was already up to date.
 
     Raises:
-        GitCloneError: If git clone fails
+        GitCloneError: If git ls-remote, fetch or checkout fails
         SshKeyScanError: If ssh-keyscan fails
         SshKeyWriteError: If writing the Ssh key fails
     """
-    repo_cloned = repo == _get_cloned_repo_url()
-    repo_tag_matched = ref == _get_cloned_repo_tag()
-    if repo_cloned and repo_tag_matched:
-        logger.info("Custom config repository already synced")
-        return
-
     if ssh_private_key:
         _setup_ssh_key(ssh_private_key)
 
-    _add_known_hosts(hostname)
-    _git_clone(repo, ref=ref)
+    _add_known_hosts(hostname, host_key=host_key, refresh_interval=host_key_refresh_interval)
+
+    remote_commit = _get_remote_commit(repo, ref=ref)
+    if repo == _get_cloned_repo_url() and remote_commit == _get_cloned_repo_commit():
+        logger.info("Custom config repository already synced at commit %s", remote_commit)
+        return False
+
+    _git_fetch(repo, ref=ref)
+    _git_checkout()
+    logger.info("Custom config repository synced at commit %s", _get_cloned_repo_commit())
+    return True
 
 
 def _setup_ssh_key(ssh_private_key: str) -> None:
@@ -458,47 +1335,153 @@ def _setup_ssh_key(ssh_private_key: str) -> None:
         raise SshKeyWriteError(f"Error writing SSH key to {SSH_KEY_FILE}") from e
 
 
-def _add_known_hosts(hostname: str) -> None:
-    """Scan and add the Ssh host key to known_hosts.
+def _add_known_hosts(
+    hostname: str,
+    host_key: str = "",
+    refresh_interval: int = DEFAULT_HOST_KEY_REFRESH_INTERVAL,
+) -> None:
+    """Add the Ssh host key to known_hosts.
+
+    A pinned host key is written as is. Otherwise, the host key is scanned and cached, and only
+    scanned again once the cached key is older than the refresh interval. The known_hosts entries
+    of other hosts are kept.
+
+    Args:
+        hostname (str): The host to add
+        host_key (str): The pinned host key, one "<keytype> <key>" per line; scanned if empty
+        refresh_interval (int): Seconds after which a scanned host key is scanned again
+
+    Raises:
+        SshKeyScanError: If ssh-keyscan fails
+    """
+    cache_file = _host_key_cache_file()
+    try:
+        cache = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        cache = {}
+
+    if host_key:
+        host_key_lines = [
+            line if line.startswith(f"{hostname} ") else f"{hostname} {line}"
+            for line in (line.strip() for line in host_key.splitlines())
+            if line
+        ]
+        entry = {"keys": host_key_lines, "pinned": True}
+    else:
+        entry = cache.get(hostname, {})
+        scanned_at = entry.get("scanned_at", 0)
+        if not entry.get("pinned") and time.time() - scanned_at < refresh_interval:
+            host_key_lines = entry.get("keys", [])
+        else:
+            host_key_lines = _scan_host_keys(hostname)
+            entry = {"keys": host_key_lines, "scanned_at": time.time()}
+
+    known_hosts = _read_known_hosts()
+    if cache.get(hostname) == entry and set(host_key_lines) <= set(known_hosts):
+        logger.debug("Host key of %s already in %s", hostname, KNOWN_HOSTS_FILE)
+        return
+
+    known_hosts = [line for line in known_hosts if line.split(" ", 1)[0] != hostname]
+    known_hosts += host_key_lines
+    cache[hostname] = entry
+    try:
+        KNOWN_HOSTS_FILE.write_text("".join(f"{line}\n" for line in known_hosts), encoding="utf-8")
+        cache_file.write_text(json.dumps(cache), encoding="utf-8")
+    except OSError as e:
+        logging.error("Error writing to known hosts at %s", KNOWN_HOSTS_FILE)
+        raise SshKeyScanError(f"Error writing to known hosts at {KNOWN_HOSTS_FILE}") from e
+
+
+def _scan_host_keys(hostname: str) -> list[str]:
+    """Scan the Ssh host keys of a host.
 
     Args:
         hostname (str): The host to scan
 
+    Returns:
+        The known_hosts lines of the host keys.
+
     Raises:
         SshKeyScanError: If ssh-keyscan fails
     """
     add_known_hosts_cmd = [SSH_KEYSCAN, "-t", "rsa", hostname]
     try:
         out = subprocess.check_output(add_known_hosts_cmd).decode()
-        with KNOWN_HOSTS_FILE.open("w", encoding="utf-8") as known_hosts_file:
-            known_hosts_file.write(out)
     except subprocess.CalledProcessError as e:
         logging.error("'%s' failed for host %s", SSH_KEYSCAN, hostname)
         raise SshKeyScanError(f"{SSH_KEYSCAN} failed for host {hostname}") from e
-    except OSError as e:
-        logging.error("Error writing to known hosts at %s", KNOWN_HOSTS_FILE)
-        raise SshKeyScanError(f"Error writing to known hosts at {KNOWN_HOSTS_FILE}") from e
+    logger.info("Scanned host key of %s", hostname)
+    return [line.strip() for line in out.splitlines() if line.strip()]
 
 
-def _git_clone(repo: str, ref: str = "") -> None:
-    """Clone a git repository using with depth 1.
+def _read_known_hosts() -> list[str]:
+    """Read the known_hosts lines.
+
+    Returns:
+        The known_hosts lines, or an empty list if the file does not exist.
+    """
+    try:
+        content = KNOWN_HOSTS_FILE.read_text(encoding="utf-8")
+    except OSError:
+        return []
+    return [line.strip() for line in content.splitlines() if line.strip()]
+
+
+def _host_key_cache_file() -> Path:
+    """Get the path to the cache of the scanned host keys, next to the known_hosts file."""
+    return KNOWN_HOSTS_FILE.with_name(f"{KNOWN_HOSTS_FILE.name}.json")
+
+
+def _git_fetch(repo: str, ref: str = "") -> None:
+    """Fetch the ref of a git repository into the persistent mirror.
+
+    The mirror is created on the first fetch. Later fetches are incremental shallow fetches of the
+    requested ref only, so objects already in the mirror are not transferred again.
 
     Args:
         repo (str): The repository URL
-        ref (str): The branch or tag to checkout
+        ref (str): The branch or tag to fetch; the remote HEAD if empty
 
     Raises:
-        GitCloneError: If git clone fails
+        GitCloneError: If git fetch fails
     """
-    git_clone_cmd = [GIT, "clone", "--depth", "1", repo, str(CLONE_OUTPUT_DIR)]
-    git_clone_cmd += ["-b", ref] if ref else []
+    git_dir = ["--git-dir", str(MIRROR_DIR)]
+    git_fetch_cmd = [GIT, *git_dir, "fetch", "--depth", "1", "--force", "origin"]
+    git_fetch_cmd += [f"+{ref or 'HEAD'}:{MIRROR_SYNCED_REF}"]
+
+    try:
+        if not (MIRROR_DIR / "HEAD").exists():
+            shutil.rmtree(MIRROR_DIR, ignore_errors=True)
+            subprocess.run([GIT, "init", "--quiet", "--bare", str(MIRROR_DIR)], check=True)
+        subprocess.run([GIT, *git_dir, "config", "remote.origin.url", repo], check=True)
+        subprocess.run(git_fetch_cmd, check=True)
+    except subprocess.CalledProcessError as e:
+        logging.error("Error fetching repository %s", repo)
+        raise GitCloneError(f"Error fetching repository {repo}") from e
+
+
+def _git_checkout() -> None:
+    """Check out the last fetched ref of the mirror into the worktree.
 
+    Raises:
+        GitCloneError: If git checkout fails
+    """
     try:
+        if (CLONE_OUTPUT_DIR / ".git").is_file():
+            git_checkout_cmd = [GIT, "-C", str(CLONE_OUTPUT_DIR), "checkout", "--quiet"]
+            git_checkout_cmd += ["--force", "--detach", MIRROR_SYNCED_REF]
+            subprocess.run(git_checkout_cmd, check=True)
+            return
+
+        # Not a worktree of the mirror yet, e.g. a full clone made by an older charm revision
         shutil.rmtree(CLONE_OUTPUT_DIR, ignore_errors=True)
-        subprocess.run(git_clone_cmd, check=True)
+        subprocess.run([GIT, "--git-dir", str(MIRROR_DIR), "worktree", "prune"], check=True)
+        git_worktree_cmd = [GIT, "--git-dir", str(MIRROR_DIR), "worktree", "add", "--quiet"]
+        git_worktree_cmd += ["--force", "--detach", str(CLONE_OUTPUT_DIR), MIRROR_SYNCED_REF]
+        subprocess.run(git_worktree_cmd, check=True)
     except subprocess.CalledProcessError as e:
-        logging.error("Error cloning repository %s", repo)
-        raise GitCloneError(f"Error cloning repository {repo}") from e
+        logging.error("Error checking out %s into %s", MIRROR_SYNCED_REF, CLONE_OUTPUT_DIR)
+        raise GitCloneError(f"Error checking out repository into {CLONE_OUTPUT_DIR}") from e
 
 
 def _get_cloned_repo_url() -> str:
@@ -516,16 +1499,47 @@ def _get_cloned_repo_url() -> str:
     return url.strip()
 
 
-def _get_cloned_repo_tag() -> str:
-    """Get the cloned repository tag.
+def _get_cloned_repo_commit() -> str:
+    """Get the commit checked out from the cloned repository.
 
     Returns:
-        The repository tag as a string or empty string if the repository is not cloned.
+        The commit hash as a string or empty string if the repository is not cloned.
     """
-    cmd = [GIT, "-C", str(CLONE_OUTPUT_DIR), "describe", "--tags", "--exact-match"]
+    cmd = [GIT, "-C", str(CLONE_OUTPUT_DIR), "rev-parse", "HEAD"]
     try:
-        tag = subprocess.check_output(cmd).decode()
+        commit = subprocess.check_output(cmd).decode()
     except subprocess.CalledProcessError as e:
         logger.debug(e)
         return ""
-    return tag.strip()
+    return commit.strip()
+
+
+def _get_remote_commit(repo: str, ref: str = "") -> str:
+    """Get the commit of a ref on the remote repository without fetching it.
+
+    Args:
+        repo (str): The repository URL
+        ref (str): The branch or tag to resolve; the remote HEAD if empty
+
+    Returns:
+        The commit hash of the ref, peeled if the ref is an annotated tag.
+
+    Raises:
+        GitCloneError: If git ls-remote fails or the ref does not exist on the remote
+    """
+    ref = ref or "HEAD"
+    cmd = [GIT, "ls-remote", repo, ref, f"{ref}^{{}}"]
+    try:
+        output = subprocess.check_output(cmd).decode()
+    except subprocess.CalledProcessError as e:
+        logging.error("Error probing ref %s of repository %s", ref, repo)
+        raise GitCloneError(f"Error probing ref {ref} of repository {repo}") from e
+
+    refs = dict(line.split("\t")[::-1] for line in output.splitlines() if "\t" in line)
+    candidates = [f"refs/tags/{ref}^{{}}", f"refs/tags/{ref}", f"refs/heads/{ref}", ref]
+    for name in candidates:
+        if name in refs:
+            return refs[name]
+
+    logging.error("Ref %s not found in repository %s", ref, repo)
+    raise GitCloneError(f"Ref {ref} not found in repository {repo}")
@@ -6,16 +6,90 @@
 import itertools
 import logging
 from abc import ABC, abstractmethod
+from pathlib import Path
 from typing import Optional
 
 import ops
 from pfe.interfaces.falcosidekick_http_endpoint import HttpEndpointRequirer
 from pydantic import AnyUrl, BaseModel, ValidationError
 
-from config import CharmConfig, InvalidCharmConfigError
+from bundle import CustomConfigBundle
+from config import (
+    DEFAULT_HOST_KEY_REFRESH_INTERVAL,
+    DEFAULT_METRICS_COUNTERS,
+    DEFAULT_METRICS_INTERVAL,
+    FALCO_PLUGINS,
+    CharmConfig,
+    InvalidCharmConfigError,
+    comma_separated,
+)
+from rollout import Rollout, RolloutPlan
 
 logger = logging.getLogger(__name__)
 
+# Charm config options overriding the Falco engine settings derived from the host profile
+ENGINE_SETTINGS = ("buf_size_preset", "cpus_for_each_buffer", "thread_table_size", "snaplen")
+
+# Files present on the machines running a Kubernetes API server, which can send its audit events
+# to the k8saudit plugin: kubeadm, Canonical Kubernetes, MicroK8s and Charmed Kubernetes
+KUBE_APISERVER_PATHS = (
+    Path("/etc/kubernetes/manifests/kube-apiserver.yaml"),
+    Path("/var/snap/k8s/common/args/kube-apiserver"),
+    Path("/var/snap/microk8s/current/args/kube-apiserver"),
+    Path("/snap/kube-apiserver/current"),
+)
+# The k8saudit rules extract the audit event fields with the json plugin
+PLUGIN_DEPENDENCIES = {"k8saudit": ("json",)}
+
+PEER_RELATION_NAME = "falco-peers"
+# Peer relation application data keys of the custom config bundle published by the leader
+BUNDLE_DIGEST_KEY = "custom-config-bundle-digest"
+BUNDLE_DATA_KEY = "custom-config-bundle"
+# Peer relation application data key of the staged rollout recorded by the leader
+ROLLOUT_KEY = "custom-config-rollout"
+# Peer relation unit data keys of the revision active on the unit and of its health
+ROLLOUT_REVISION_KEY = "custom-config-revision"
+ROLLOUT_HEALTH_KEY = "custom-config-health"
+
+
+class FalcoMetrics(BaseModel):
+    """The pydantic model for the Falco metrics settings.
+
+    Attributes:
+        interval: Interval of the Falco metrics snapshots.
+        output_rule: Whether the metrics snapshots are emitted as rule outputs.
+        counters: The enabled Falco metrics counter families.
+    """
+
+    interval: str = DEFAULT_METRICS_INTERVAL
+    output_rule: bool = True
+    counters: list[str] = list(DEFAULT_METRICS_COUNTERS)
+
+
+class FalcoPayload(BaseModel):
+    """The pydantic model for the Falco JSON event payload settings.
+
+    Attributes:
+        output: Whether the events carry the formatted output string.
+        output_fields: Whether the events carry the output fields.
+        tags: Whether the events carry the rule tags.
+        suggested_output: Whether the fields suggested by Falco are appended to the outputs.
+    """
+
+    output: bool = True
+    output_fields: bool = True
+    tags: bool = True
+    suggested_output: bool = True
+
+
+# The Juju topology extra fields are kept by every profile, as falcosidekick labels the Loki
+# streams with them
+PAYLOAD_PROFILES = {
+    "full": FalcoPayload(),
+    "fields-only": FalcoPayload(output=False),
+    "minimal": FalcoPayload(output=False, tags=False, suggested_output=False),
+}
+
 
 class CharmState(BaseModel):
     """The pydantic model for charm state.
@@ -24,23 +98,67 @@ class CharmState(BaseModel):
         custom_config_repo: Optional URL to a custom configuration repository.
         custom_config_repo_ref: Optional branch or tag to a custom configuration repository.
         custom_config_repo_ssh_key: Optional SSH key for custom configuration repository.
+        custom_config_repo_host_key: Optional pinned SSH host key of the repository host.
+        custom_config_repo_host_key_refresh_interval: Seconds before rescanning the host key.
         http_output: Optional HTTP output data from http-output relation.
+        engine_overrides: Falco engine settings set by the operator, by name.
+        buf_size_preset_bounds: Lowest and highest ring buffer size presets the charm applies.
+        derive_base_syscalls: Whether to capture only the syscalls the rules need.
+        metrics: The Falco metrics settings.
+        outputs: The Falco output sinks to enable.
+        payload: The Falco JSON event payload settings.
+        event_topology: Whether every event carries the Juju topology of the application.
+        outputs_queue_capacity: Alerts the Falco outputs queue holds, 0 for no limit.
+        min_priority: Lowest priority of the Falco rules loaded and alerting.
+        http_output_keep_alive: Whether the http output reuses its connection.
+        http_output_compress_uploads: Whether the http output negotiates compressed transfers.
+        plugins: The Falco plugins to load, in load order.
+        machine_units: The Juju topology labels of the falco units of the machine, by unit.
+        fetch_custom_config: Whether the unit fetches the custom config repository itself.
+        publish_custom_config_bundle: Whether the unit publishes the custom config bundle.
+        custom_config_bundle: The custom config bundle published by the leader, if any.
+        custom_config_rollout: The staged rollout settings, if new revisions are staged.
+        rules_max_cost: Highest estimated cost of a custom rule, 0 for no limit.
     """
 
     custom_config_repo: Optional[AnyUrl] = None
     custom_config_repo_ref: Optional[str] = None
     custom_config_repo_ssh_key: Optional[str] = None
+    custom_config_repo_host_key: Optional[str] = None
+    custom_config_repo_host_key_refresh_interval: int = DEFAULT_HOST_KEY_REFRESH_INTERVAL
     http_output: Optional[dict[str, str]] = None
+    engine_overrides: dict[str, int] = {}
+    buf_size_preset_bounds: tuple[int, int] = (1, 10)
+    derive_base_syscalls: bool = False
+    metrics: FalcoMetrics = FalcoMetrics()
+    outputs: list[str] = ["http", "syslog"]
+    payload: FalcoPayload = FalcoPayload()
+    event_topology: bool = True
+    outputs_queue_capacity: int = 0
+    min_priority: str = "debug"
+    http_output_keep_alive: bool = False
+    http_output_compress_uploads: bool = False
+    plugins: list[str] = list(FALCO_PLUGINS)
+    machine_units: dict[str, dict[str, str]] = {}
+    fetch_custom_config: bool = True
+    publish_custom_config_bundle: bool = False
+    custom_config_bundle: Optional[CustomConfigBundle] = None
+    custom_config_rollout: Optional[RolloutPlan] = None
+    rules_max_cost: int = 0
 
     @classmethod
     def from_charm(
-        cls, charm: ops.CharmBase, http_endpoint_requirer: HttpEndpointRequirer
+        cls,
+        charm: ops.CharmBase,
+        http_endpoint_requirer: HttpEndpointRequirer,
+        machine_units: Optional[dict[str, dict[str, str]]] = None,
     ) -> "CharmState":
         """Create a CharmState from a charm instance.
 
         Args:
             charm: The charm instance.
             http_endpoint_requirer: The HttpEndpointRequirer instance to get http output URL.
+            machine_units: The falco units of the machine, if known.
 
         Returns:
             A CharmState instance.
@@ -69,20 +187,169 @@ class CharmState(BaseModel):
 
         http_output = {}
         app_urls = http_endpoint_requirer.get_app_urls()
-        for url in app_urls.values():
+        app_cas = http_endpoint_requirer.get_app_cas()
+        for app, url in app_urls.items():
             # There should only be one URL since this relation is limited to 1, but if there are
             # multiple, just take the last one.
-            http_output.update({"url": url})
+            http_output = {"url": url}
+            if app in app_cas:
+                http_output["ca"] = app_cas[app]
             logger.info("Retrieved url info from relation: %s", url)
 
+        # With the leader distribution, only the leader fetches the repository
+        leader_distribution = charm_config.custom_config_distribution == "leader"
+        is_leader = charm.unit.is_leader()
+
+        engine_overrides = {
+            name: value
+            for name in ENGINE_SETTINGS
+            if (value := getattr(charm_config, name)) is not None
+        }
+
         return cls(
             custom_config_repo=custom_config_repo,
             custom_config_repo_ref=custom_config_repo_ref,
             custom_config_repo_ssh_key=custom_config_repo_ssh_key,
+            custom_config_repo_host_key=charm_config.custom_config_repo_host_key,
+            custom_config_repo_host_key_refresh_interval=(
+                charm_config.custom_config_repo_host_key_refresh_interval
+            ),
             http_output=http_output,
+            engine_overrides=engine_overrides,
+            buf_size_preset_bounds=(
+                charm_config.buf_size_preset_min,
+                charm_config.buf_size_preset_max,
+            ),
+            derive_base_syscalls=charm_config.derive_base_syscalls,
+            metrics=FalcoMetrics(
+                interval=charm_config.metrics_interval,
+                output_rule=charm_config.metrics_mode == "output-rule",
+                counters=comma_separated(charm_config.metrics_counters),
+            ),
+            outputs=_enabled_outputs(comma_separated(charm_config.outputs), http_output),
+            payload=PAYLOAD_PROFILES[charm_config.payload_profile],
+            event_topology=charm_config.topology_enrichment == "event",
+            outputs_queue_capacity=charm_config.outputs_queue_capacity,
+            min_priority=charm_config.min_priority,
+            http_output_keep_alive=charm_config.http_output_keep_alive,
+            http_output_compress_uploads=charm_config.http_output_compress_uploads,
+            plugins=_enabled_plugins(charm.model, charm_config.plugins),
+            machine_units=machine_units or {},
+            fetch_custom_config=not leader_distribution or is_leader,
+            publish_custom_config_bundle=leader_distribution and is_leader,
+            custom_config_bundle=(
+                _get_custom_config_bundle(charm.model)
+                if leader_distribution and not is_leader
+                else None
+            ),
+            custom_config_rollout=_get_custom_config_rollout(charm, charm_config),
+            rules_max_cost=charm_config.rules_max_cost,
         )
 
 
+def _enabled_outputs(outputs: list[str], http_output: dict[str, str]) -> list[str]:
+    """Get the Falco output sinks to enable.
+
+    The http sink is only enabled with an http endpoint. Falco refuses to start without an output
+    sink, so the syslog sink is enabled when no requested sink can be.
+
+    Args:
+        outputs: The requested output sinks.
+        http_output: The http output settings.
+
+    Returns:
+        The output sinks to enable.
+    """
+    enabled = [sink for sink in outputs if sink != "http" or http_output]
+    if not enabled:
+        logger.warning("No http endpoint for the requested outputs, falling back to syslog")
+        return ["syslog"]
+    return enabled
+
+
+def _get_custom_config_bundle(model: ops.Model) -> Optional[CustomConfigBundle]:
+    """Get the custom config bundle published by the leader through the peer relation.
+
+    Args:
+        model: The ops model.
+
+    Returns:
+        The custom config bundle, or None if the leader has not published one.
+    """
+    relation = model.get_relation(PEER_RELATION_NAME)
+    if relation is None:
+        return None
+    data = relation.data[model.app]
+    if BUNDLE_DIGEST_KEY not in data or BUNDLE_DATA_KEY not in data:
+        return None
+    return CustomConfigBundle(digest=data[BUNDLE_DIGEST_KEY], data=data[BUNDLE_DATA_KEY])
+
+
+def _get_custom_config_rollout(
+    charm: ops.CharmBase, charm_config: CharmConfig
+) -> Optional[RolloutPlan]:
+    """Get the staged rollout settings, with the rollout recorded by the leader.
+
+    Args:
+        charm: The charm instance.
+        charm_config: The charm config.
+
+    Returns:
+        The staged rollout settings, or None if new revisions are applied to all units at once.
+    """
+    if charm_config.custom_config_rollout != "staged":
+        return None
+    relation = charm.model.get_relation(PEER_RELATION_NAME)
+    if relation is None:
+        logger.warning("No %s relation to stage the rollout with", PEER_RELATION_NAME)
+        return None
+    try:
+        rollout = Rollout.model_validate_json(relation.data[charm.app].get(ROLLOUT_KEY, ""))
+    except ValidationError:
+        rollout = None
+    units = sorted(
+        (unit.name for unit in {charm.unit, *relation.units}),
+        key=lambda name: int(name.rsplit("/", 1)[1]),
+    )
+    return RolloutPlan(
+        unit=charm.unit.name,
+        units=units,
+        steps=[int(step) for step in comma_separated(charm_config.custom_config_rollout_steps)],
+        soak_interval=charm_config.custom_config_rollout_soak_interval,
+        max_cpu_increase=charm_config.custom_config_rollout_max_cpu_increase,
+        max_drop_increase=charm_config.custom_config_rollout_max_drop_increase,
+        rollout=rollout,
+    )
+
+
+def _enabled_plugins(model: ops.Model, plugins: str) -> list[str]:
+    """Get the Falco plugins to load.
+
+    With auto, the plugins are detected on the machine of the principal. The stock rules require
+    the container plugin, so it is always loaded, while the k8saudit plugin is only loaded on the
+    machines running a Kubernetes API server.
+
+    Args:
+        model: The ops model.
+        plugins: The comma separated plugins, or auto.
+
+    Returns:
+        The plugins to load, with their dependencies, in load order.
+    """
+    if plugins == "auto":
+        requested = ["container"]
+        if any(path.exists() for path in KUBE_APISERVER_PATHS):
+            requested.append("k8saudit")
+        principals = [relation.app.name for relation in model.relations["general-info"]]
+        logger.info("Detected plugins %s for principal %s", requested, ", ".join(principals))
+    else:
+        requested = comma_separated(plugins)
+    needed = set(requested)
+    for name in requested:
+        needed.update(PLUGIN_DEPENDENCIES.get(name, ()))
+    return [name for name in FALCO_PLUGINS if name in needed]
+
+
 class CharmBaseWithState(ops.CharmBase, ABC):
     """The CharmBase than can build a CharmState."""
 
@@ -0,0 +1,473 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Manifest based file tree sync module."""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class SyncError(Exception):
+    """Exception raised when syncing a file tree fails."""
+
+
+class ChangeSet(BaseModel):
+    """The changes made to a destination directory by a sync.
+
+    Attributes:
+        added: Names of the files added to the destination.
+        modified: Names of the files whose content changed in the destination.
+        removed: Names of the files removed from the destination.
+    """
+
+    added: list[str] = []
+    modified: list[str] = []
+    removed: list[str] = []
+
+    def __bool__(self) -> bool:
+        """Whether the sync changed anything."""
+        return bool(self.added or self.modified or self.removed)
+
+    def __add__(self, other: "ChangeSet") -> "ChangeSet":
+        """Merge two change sets."""
+        return ChangeSet(
+            added=self.added + other.added,
+            modified=self.modified + other.modified,
+            removed=self.removed + other.removed,
+        )
+
+
+def _yaml_files(directory: Path) -> list[Path]:
+    """List the top level YAML files of a directory.
+
+    Args:
+        directory (Path): The directory
+
+    Returns:
+        The YAML files, in name order.
+    """
+    return sorted(path for path in directory.glob("*.yaml") if path.is_file())
+
+
+class TreeSync:
+    """Sync the files of a source directory to a destination directory.
+
+    The sync keeps a manifest of the content hash, size and modification time of each file it
+    wrote to the destination. Files are synced recursively and named by their path relative to
+    the directory, like rsync does. Only files whose content differs from the manifest are copied,
+    and the files the sync wrote, or the consumer of the destination loads, that are not in the
+    source are removed from the destination, so the destination mirrors the source. Files
+    modified in the destination behind the sync's back are detected by their size and
+    modification time, and copied again.
+    """
+
+    def __init__(
+        self,
+        destination: Path,
+        manifest_file: Path,
+        loaded: Optional[Callable[[Path], list[Path]]] = None,
+        exclude: tuple[str, ...] = (),
+    ) -> None:
+        """Initialize the tree sync.
+
+        Args:
+            destination (Path): The destination directory
+            manifest_file (Path): The file holding the manifest of the destination
+            loaded (Optional[Callable[[Path], list[Path]]]): Lists the destination files its
+                consumer loads, removed when they are not in the source even if the sync did not
+                write them; defaults to the top level YAML files
+            exclude (tuple[str, ...]): Relative paths of the files in the destination the sync
+                never touches
+        """
+        self.destination = destination
+        self.manifest_file = manifest_file
+        self.loaded = loaded or _yaml_files
+        self.exclude = exclude
+
+    @property
+    def manifest(self) -> dict[str, dict]:
+        """Get the manifest of the destination, mapping file names to their hash and stat."""
+        try:
+            return json.loads(self.manifest_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def digest(self) -> str:
+        """Get the digest of the destination content according to the manifest.
+
+        Returns:
+            The hex digest of the names and content hashes of the synced files.
+        """
+        digest = hashlib.sha256()
+        for name, entry in sorted(self.manifest.items()):
+            digest.update(f"{name}\0{entry['sha256']}\0".encode())
+        return digest.hexdigest()
+
+    def plan(self, source: Optional[Path]) -> ChangeSet:
+        """Compute the changes a sync of the source directory would make, without making them.
+
+        Args:
+            source (Optional[Path]): The source directory; a missing source or None empties the
+                destination
+
+        Returns:
+            The changes a sync would make to the destination.
+
+        Raises:
+            SyncError: If reading the source or the destination fails
+        """
+        try:
+            return self._sync(source, dry_run=True)
+        except OSError as e:
+            logger.error("Failed to compare %s to %s", source, self.destination)
+            raise SyncError(f"Failed to compare {source} to {self.destination}") from e
+
+    def sync(self, source: Optional[Path]) -> ChangeSet:
+        """Sync the source directory to the destination directory.
+
+        Args:
+            source (Optional[Path]): The source directory; a missing source or None empties the
+                destination
+
+        Returns:
+            The changes made to the destination.
+
+        Raises:
+            SyncError: If reading the source or writing the destination fails
+        """
+        try:
+            return self._sync(source)
+        except OSError as e:
+            logger.error("Failed to sync %s to %s", source, self.destination)
+            raise SyncError(f"Failed to sync {source} to {self.destination}") from e
+
+    def _sync(self, source: Optional[Path], dry_run: bool = False) -> ChangeSet:
+        """Sync the source directory to the destination directory.
+
+        Args:
+            source (Optional[Path]): The source directory
+            dry_run (bool): Only compute the changes, without making them
+
+        Returns:
+            The changes made to the destination.
+        """
+        manifest = self.manifest
+        if not dry_run:
+            self.destination.mkdir(parents=True, exist_ok=True)
+
+        wanted = self._list(source) if source is not None and source.is_dir() else {}
+        destination = self._list(self.destination) if self.destination.is_dir() else {}
+        # Files the sync did not write are left alone, but the ones the consumer loads
+        loaded = set(self.loaded(self.destination)) if self.destination.is_dir() else set()
+        present = {
+            name: path for name, path in destination.items() if name in manifest or path in loaded
+        }
+        changes = ChangeSet()
+        new_manifest: dict[str, dict] = {}
+
+        for name in sorted(present.keys() - wanted.keys()):
+            if not dry_run:
+                present[name].unlink()
+                self._remove_empty_parents(present[name])
+            changes.removed.append(name)
+
+        for name, source_file in sorted(wanted.items()):
+            content = source_file.read_bytes()
+            sha256 = hashlib.sha256(content).hexdigest()
+            entry = manifest.get(name)
+            if entry and entry["sha256"] == sha256 and self._unchanged(name, entry):
+                new_manifest[name] = entry
+                continue
+            (changes.modified if name in present else changes.added).append(name)
+            if not dry_run:
+                new_manifest[name] = self._write(name, content, sha256)
+
+        if dry_run:
+            return changes
+        if changes or new_manifest != manifest:
+            self._save_manifest(new_manifest)
+        if changes:
+            logger.info(
+                "Synced %s: %d added, %d modified, %d removed",
+                self.destination,
+                len(changes.added),
+                len(changes.modified),
+                len(changes.removed),
+            )
+        return changes
+
+    def _list(self, directory: Path) -> dict[str, Path]:
+        """List the files to sync in a directory.
+
+        Args:
+            directory (Path): The directory
+
+        Returns:
+            A mapping of the file paths relative to the directory to their paths.
+        """
+        files = {
+            path.relative_to(directory).as_posix(): path
+            for path in directory.rglob("*")
+            if path.is_file()
+        }
+        return {name: path for name, path in files.items() if name not in self.exclude}
+
+    def _remove_empty_parents(self, path: Path) -> None:
+        """Remove the directories of the destination left empty by removing a file.
+
+        Args:
+            path (Path): The removed file
+        """
+        for parent in path.parents:
+            if parent == self.destination or self.destination not in parent.parents:
+                return
+            try:
+                parent.rmdir()
+            except OSError:
+                return
+
+    def _unchanged(self, name: str, entry: dict) -> bool:
+        """Check if a destination file is still the file recorded in the manifest.
+
+        Args:
+            name (str): The file path relative to the destination
+            entry (dict): The manifest entry of the file
+
+        Returns:
+            True if the file size and modification time match the manifest entry.
+        """
+        try:
+            stat = (self.destination / name).stat()
+        except OSError:
+            return False
+        return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]
+
+    def _write(self, name: str, content: bytes, sha256: str) -> dict:
+        """Atomically write a file to the destination.
+
+        Args:
+            name (str): The file path relative to the destination
+            content (bytes): The file content
+            sha256 (str): The hex digest of the content
+
+        Returns:
+            The manifest entry of the written file.
+        """
+        (self.destination / name).parent.mkdir(parents=True, exist_ok=True)
+        write_file_atomic(self.destination / name, content)
+        stat = (self.destination / name).stat()
+        return {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _save_manifest(self, manifest: dict[str, dict]) -> None:
+        """Save the manifest of the destination.
+
+        Args:
+            manifest (dict[str, dict]): The manifest
+        """
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        write_file_atomic(self.manifest_file, json.dumps(manifest, sort_keys=True).encode())
+
+
+class Generations:
+    """Generations of a directory tree, switched in with an atomic symlink swap.
+
+    Each generation is a directory named after its number, and a link points to the active one.
+    A new generation is staged as a hard linked copy of the active one, so staging does not copy
+    any file content; files are then replaced in the staged tree, never modified in place.
+    Activating the staged generation replaces the link in a single rename, so readers of the
+    link see either the previous or the new tree, never a mix of both. The last generations are
+    kept, so rolling back is a link swap too.
+    """
+
+    staging_name: str = "staging"
+
+    def __init__(self, directory: Path, link: Path, keep: int = 3) -> None:
+        """Initialize the generations.
+
+        Args:
+            directory (Path): The directory holding the generations
+            link (Path): The link to the active generation
+            keep (int): The number of generations to keep, including the active one
+        """
+        self.directory = directory
+        self.link = link
+        self.keep = max(keep, 1)
+
+    def list(self) -> list[Path]:
+        """List the generations, from the oldest to the newest.
+
+        Returns:
+            The generation directories.
+        """
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            (path for path in self.directory.iterdir() if path.name.isdigit()),
+            key=lambda path: int(path.name),
+        )
+
+    @property
+    def current(self) -> Optional[Path]:
+        """Get the active generation, if any."""
+        if not self.link.is_symlink():
+            return None
+        current = self.directory / Path(os.readlink(self.link)).name
+        return current if current.is_dir() else None
+
+    def ensure(self, subdirs: tuple[str, ...] = ()) -> Path:
+        """Ensure there is an active generation holding the given directories.
+
+        Args:
+            subdirs (tuple[str, ...]): The directories the active generation must hold
+
+        Returns:
+            The active generation.
+
+        Raises:
+            SyncError: If creating the generation fails
+        """
+        try:
+            current = self.current
+            if current is None:
+                generations = self.list()
+                current = generations[-1] if generations else self.directory / "0"
+                current.mkdir(parents=True, exist_ok=True)
+                self._link(current)
+            for subdir in subdirs:
+                (current / subdir).mkdir(parents=True, exist_ok=True)
+            return current
+        except OSError as e:
+            logger.error("Failed to create a generation in %s", self.directory)
+            raise SyncError(f"Failed to create a generation in {self.directory}") from e
+
+    def stage(self) -> Path:
+        """Stage a new generation as a copy of the active one.
+
+        Returns:
+            The staged generation directory.
+
+        Raises:
+            SyncError: If staging fails
+        """
+        staged = self.directory / self.staging_name
+        try:
+            # A staged generation left over by an interrupted sync is never activated
+            shutil.rmtree(staged, ignore_errors=True)
+            current = self.ensure()
+            shutil.copytree(current, staged, symlinks=True, copy_function=os.link)
+        except OSError as e:
+            logger.error("Failed to stage a generation in %s", self.directory)
+            raise SyncError(f"Failed to stage a generation in {self.directory}") from e
+        return staged
+
+    def discard(self, staged: Path) -> None:
+        """Discard a staged generation.
+
+        Args:
+            staged (Path): The staged generation directory
+        """
+        shutil.rmtree(staged, ignore_errors=True)
+
+    def activate(self, staged: Path) -> Path:
+        """Activate a staged generation, and prune the old generations.
+
+        Args:
+            staged (Path): The staged generation directory
+
+        Returns:
+            The activated generation directory.
+
+        Raises:
+            SyncError: If activating fails
+        """
+        generations = self.list()
+        generation = self.directory / str(int(generations[-1].name) + 1 if generations else 0)
+        try:
+            staged.rename(generation)
+            self._link(generation)
+        except OSError as e:
+            logger.error("Failed to activate generation %s", generation)
+            raise SyncError(f"Failed to activate generation {generation}") from e
+        logger.info("Activated generation %s", generation)
+        self._prune()
+        return generation
+
+    def rollback(self) -> Path:
+        """Activate the generation before the active one.
+
+        Returns:
+            The activated generation directory.
+
+        Raises:
+            SyncError: If there is no previous generation or activating fails
+        """
+        current = self.current
+        previous = [
+            generation
+            for generation in self.list()
+            if current is None or int(generation.name) < int(current.name)
+        ]
+        if not previous:
+            raise SyncError(f"No generation to roll back to in {self.directory}")
+        try:
+            self._link(previous[-1])
+        except OSError as e:
+            logger.error("Failed to roll back to generation %s", previous[-1])
+            raise SyncError(f"Failed to roll back to generation {previous[-1]}") from e
+        logger.info("Rolled back to generation %s", previous[-1])
+        return previous[-1]
+
+    def _link(self, generation: Path) -> None:
+        """Atomically point the link to a generation.
+
+        Args:
+            generation (Path): The generation directory
+        """
+        tmp_link = self.link.with_name(f".{self.link.name}.tmp")
+        tmp_link.unlink(missing_ok=True)
+        tmp_link.symlink_to(os.path.relpath(generation, self.link.parent))
+        os.replace(tmp_link, self.link)
+
+    def _prune(self) -> None:
+        """Remove the oldest generations, keeping the active one."""
+        current = self.current
+        generations = [generation for generation in self.list() if generation != current]
+        for generation in generations[: max(len(generations) - self.keep + 1, 0)]:
+            logger.debug("Removing generation %s", generation)
+            shutil.rmtree(generation, ignore_errors=True)
+
+
+def write_file_atomic(path: Path, content: bytes, mode: int = 0o644) -> None:
+    """Write a file atomically.
+
+    The content is written to a temporary file in the same directory, which then replaces the
+    file, so readers never see a partially written file, and hard links to the previous file
+    keep the previous content.
+
+    Args:
+        path (Path): The file path
+        content (bytes): The file content
+        mode (int): The file mode
+
+    Raises:
+        OSError: If writing the file fails
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(content)
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except OSError:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
@@ -0,0 +1,487 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Falco engine tuning module.
+
+The charm profiles the host (CPU count, memory, maximum PID and the syscall rate observed by
+Falco) and derives the sizes of the modern eBPF ring buffers and of the libs tables from it. The
+operator can override each derived setting. The profile, the derived settings, the overrides and
+the applied settings are recorded in the charm state directory for auditing.
+
+On top of the derived sizes, a feedback loop samples the Falco drop counters and steps the ring
+buffer size preset up while Falco drops events, and back down once it stops dropping them.
+"""
+
+import http.client
+import json
+import logging
+import math
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel
+
+from sync import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+# Falco counters of the events read from the kernel and of the events dropped, across all the
+# ring buffers
+EVENTS_METRIC = "falcosecurity_scap_n_evts_total"
+DROPS_METRIC = "falcosecurity_scap_n_drops_total"
+
+# Size of a ring buffer, in MiB, is 2 ** (preset - 1), see the Falco engine.modern_ebpf settings
+MIN_BUF_SIZE_PRESET = 1
+MAX_BUF_SIZE_PRESET = 10
+
+# Share of the host memory the ring buffers may use
+RING_BUFFERS_MEMORY_RATIO = 0.02
+# Seconds of events a ring buffer holds, to absorb bursts above the average syscall rate and
+# stalls of the Falco userspace
+RING_BUFFER_HEADROOM_SECONDS = 2
+# Approximate size, in bytes, of an event without its captured I/O payload
+EVENT_HEADER_SIZE = 120
+
+# Drop samples older than the window are forgotten
+DROP_WINDOW_SECONDS = 3600
+# Shortest window the drop ratio is computed over
+DROP_MIN_WINDOW_SECONDS = 600
+# Drop ratio above which the ring buffer size preset is stepped up
+DROP_RATIO_STEP_UP = 0.001
+# Seconds without drops, since the last step, before the preset is stepped back down
+DROP_FREE_STEP_DOWN_SECONDS = 86400
+
+# Relative change of the measured syscall rate below which the recorded rate is kept, so the
+# derived settings, part of the Falco service fingerprint, do not follow small rate changes
+SYSCALL_RATE_HYSTERESIS = 0.5
+
+DEFAULT_SNAPLEN = 80
+MIN_SNAPLEN = 32
+# The reduced snaplen is rounded down to a multiple of the step
+SNAPLEN_STEP = 16
+MIN_THREAD_TABLE_SIZE = 32768
+MAX_THREAD_TABLE_SIZE = 262144
+# Hosts with less memory get a smaller thread table
+SMALL_HOST_MEMORY = 4 * 1024**3
+SMALL_HOST_THREAD_TABLE_SIZE = 65536
+
+
+class HostProfile(BaseModel):
+    """The host resources sizing the Falco engine.
+
+    Attributes:
+        cpus: The number of online CPUs.
+        memory_bytes: The total memory of the host.
+        pid_max: The maximum PID of the host.
+        syscall_rate: The events per second observed by Falco, if known.
+    """
+
+    cpus: int
+    memory_bytes: int
+    pid_max: int
+    syscall_rate: Optional[float] = None
+
+
+class EngineTuning(BaseModel):
+    """The Falco engine sizing settings.
+
+    Attributes:
+        buf_size_preset: The modern eBPF ring buffer size preset.
+        cpus_for_each_buffer: The number of CPUs sharing a ring buffer.
+        thread_table_size: The maximum number of threads in the libs thread table.
+        snaplen: The number of bytes of I/O buffers captured with each event.
+    """
+
+    buf_size_preset: int
+    cpus_for_each_buffer: int
+    thread_table_size: int
+    snaplen: int
+
+    def options(self) -> list[str]:
+        """Get the Falco options applying the settings.
+
+        Returns:
+            The options, as passed to Falco with `-o`.
+        """
+        return [
+            f"engine.modern_ebpf.buf_size_preset={self.buf_size_preset}",
+            f"engine.modern_ebpf.cpus_for_each_buffer={self.cpus_for_each_buffer}",
+            f"falco_libs.thread_table_size={self.thread_table_size}",
+            f"falco_libs.snaplen={self.snaplen}",
+        ]
+
+
+class EngineTuner:
+    """Falco engine tuner.
+
+    The syscall rate is the rate of the Falco events counter between two reconciliations. The last
+    known rate is kept until a new one can be measured, so the settings do not change with the
+    availability of the Falco metrics, and until a new one differs from it by more than half, so
+    the settings do not change, restarting Falco, with the ordinary variations of the rate.
+    """
+
+    file_name: str = "engine-tuning.json"
+
+    def __init__(self, state_dir: Path, metrics_port: int) -> None:
+        """Initialize the engine tuner.
+
+        Args:
+            state_dir (Path): The directory holding the tuning record
+            metrics_port (int): The local port of the Falco webserver serving the metrics
+        """
+        self.path = state_dir / self.file_name
+        self.metrics_port = metrics_port
+
+    def tune(
+        self,
+        overrides: Optional[dict[str, int]] = None,
+        bounds: tuple[int, int] = (MIN_BUF_SIZE_PRESET, MAX_BUF_SIZE_PRESET),
+    ) -> EngineTuning:
+        """Profile the host, and derive the engine settings from the profile.
+
+        The ring buffer size preset is the derived one, plus the steps of the drop feedback loop,
+        within the bounds, unless it is overridden.
+
+        Args:
+            overrides (Optional[dict[str, int]]): Settings set by the operator, by name
+            bounds (tuple[int, int]): The lowest and highest ring buffer size presets
+
+        Returns:
+            The engine settings to apply.
+        """
+        record = self._load()
+        profile = self.profile(record)
+        derived = derive_tuning(profile)
+        overrides = overrides or {}
+        lower = bounds[0]
+        upper = max(lower, min(bounds[1], max_buf_size_preset(profile)))
+        preset = _clamp(derived.buf_size_preset + record.get("adjustment", 0), lower, upper)
+        applied = derived.model_copy(update={"buf_size_preset": preset, **overrides})
+        if applied.model_dump() != record.get("applied"):
+            logger.info(
+                "Falco engine tuning %s derived from %s with overrides %s",
+                applied.model_dump(),
+                profile.model_dump(),
+                overrides,
+            )
+        record.update(
+            host=profile.model_dump(),
+            derived=derived.model_dump(),
+            overrides=overrides,
+            bounds=[lower, upper],
+            applied=applied.model_dump(),
+        )
+        self._try_save(record)
+        return applied
+
+    def step(self) -> bool:
+        """Sample the Falco drop counters, and step the ring buffer size preset on the drop ratio.
+
+        The drop ratio is computed over the samples of the last hour, taken since Falco last
+        started. The preset is stepped up when the ratio exceeds 0.1%, and stepped back down,
+        never below the derived preset, after a day without drops. The preset is left alone when
+        it is overridden or at its bounds, as recorded by the last tuning.
+
+        Returns:
+            True if the preset was stepped, and the Falco service must be reconfigured.
+        """
+        record = self._load()
+        counters = scrape_counters(self.metrics_port, (EVENTS_METRIC, DROPS_METRIC))
+        applied = record.get("applied")
+        if len(counters) < 2 or applied is None:
+            return False
+
+        now = time.time()
+        window = [
+            sample
+            for sample in record.get("window", [])
+            if now - sample["time"] <= DROP_WINDOW_SECONDS
+        ]
+        if window and (
+            counters[EVENTS_METRIC] < window[-1]["events"]
+            or counters[DROPS_METRIC] < window[-1]["drops"]
+        ):
+            # The counters restart with Falco
+            window = []
+        window.append(
+            {"time": now, "events": counters[EVENTS_METRIC], "drops": counters[DROPS_METRIC]}
+        )
+        record["window"] = window
+
+        step = 0
+        events = window[-1]["events"] - window[0]["events"]
+        drops = window[-1]["drops"] - window[0]["drops"]
+        adjustment = record.get("adjustment", 0)
+        lower, upper = record.get("bounds", (MIN_BUF_SIZE_PRESET, MAX_BUF_SIZE_PRESET))
+        preset = applied["buf_size_preset"]
+        if (
+            "buf_size_preset" not in record.get("overrides", {})
+            and now - window[0]["time"] >= DROP_MIN_WINDOW_SECONDS
+            and events > 0
+        ):
+            record["drop_ratio"] = drops / events
+            if drops / events > DROP_RATIO_STEP_UP and preset < upper:
+                step = 1
+            elif (
+                drops == 0
+                and adjustment > 0
+                and preset > lower
+                and now - record.get("stepped", 0) >= DROP_FREE_STEP_DOWN_SECONDS
+            ):
+                step = -1
+
+        if step:
+            logger.info(
+                "Falco dropped %d of %d events, stepping the ring buffer size preset from %d",
+                drops,
+                events,
+                preset,
+            )
+            record.update(adjustment=adjustment + step, stepped=now, window=[])
+        self._try_save(record)
+        return step != 0
+
+    def profile(self, record: Optional[dict] = None) -> HostProfile:
+        """Profile the host.
+
+        Args:
+            record (Optional[dict]): The tuning record, holding the previous events sample
+
+        Returns:
+            The host profile.
+        """
+        record = self._load() if record is None else record
+        rate = record.get("host", {}).get("syscall_rate")
+        events = scrape_counters(self.metrics_port, (EVENTS_METRIC,)).get(EVENTS_METRIC)
+        now = time.time()
+        sample = record.get("sample")
+        if events is not None:
+            if sample and now > sample["time"] and events >= sample["events"]:
+                measured = (events - sample["events"]) / (now - sample["time"])
+                if rate is None or abs(measured - rate) > rate * SYSCALL_RATE_HYSTERESIS:
+                    rate = measured
+            # The counter restarts with Falco, so each sample replaces the previous one
+            record["sample"] = {"time": now, "events": events}
+        return HostProfile(
+            cpus=len(os.sched_getaffinity(0)),
+            memory_bytes=_read_memory_bytes(),
+            pid_max=_read_pid_max(),
+            syscall_rate=rate,
+        )
+
+    def _load(self) -> dict:
+        """Load the tuning record.
+
+        Returns:
+            The tuning record, or an empty record if it does not exist or is unreadable.
+        """
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, record: dict) -> None:
+        """Save the tuning record.
+
+        Args:
+            record (dict): The tuning record
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_file_atomic(self.path, json.dumps(record, indent=2).encode())
+
+    def _try_save(self, record: dict) -> None:
+        """Save the tuning record, logging a failure to save it.
+
+        Args:
+            record (dict): The tuning record
+        """
+        try:
+            self._save(record)
+        except OSError:
+            logger.exception("Failed to record the Falco engine tuning")
+
+
+def derive_tuning(profile: HostProfile) -> EngineTuning:
+    """Derive the engine settings from a host profile.
+
+    Hosts with up to 4 CPUs share a single ring buffer, larger hosts use a buffer for every 2
+    CPUs, as Falco does by default. Each buffer is sized to hold two seconds of the events it
+    receives, or by CPU count until the syscall rate is known, within 2% of the host memory. When
+    the memory cap leaves the buffers too small for the rate, the snaplen is reduced to shrink the
+    events, in steps of 16 bytes. The thread table holds all the PIDs of the host, within bounds.
+
+    Args:
+        profile (HostProfile): The host profile
+
+    Returns:
+        The engine settings.
+    """
+    cpus_for_each_buffer = _cpus_for_each_buffer(profile.cpus)
+    buffers = math.ceil(profile.cpus / cpus_for_each_buffer)
+    max_preset = max_buf_size_preset(profile)
+
+    snaplen = DEFAULT_SNAPLEN
+    if profile.syscall_rate is None:
+        preset = _baseline_preset(profile.cpus)
+    else:
+        rate = profile.syscall_rate / buffers * RING_BUFFER_HEADROOM_SECONDS
+        preset = _preset_for(rate * (EVENT_HEADER_SIZE + snaplen))
+        if preset > max_preset:
+            snaplen = int(_buffer_size(max_preset) / rate) - EVENT_HEADER_SIZE
+            snaplen = max(MIN_SNAPLEN, snaplen // SNAPLEN_STEP * SNAPLEN_STEP)
+
+    thread_table_size = min(max(profile.pid_max, MIN_THREAD_TABLE_SIZE), MAX_THREAD_TABLE_SIZE)
+    if profile.memory_bytes < SMALL_HOST_MEMORY:
+        thread_table_size = min(thread_table_size, SMALL_HOST_THREAD_TABLE_SIZE)
+
+    return EngineTuning(
+        buf_size_preset=min(preset, max_preset),
+        cpus_for_each_buffer=cpus_for_each_buffer,
+        thread_table_size=thread_table_size,
+        snaplen=snaplen,
+    )
+
+
+def max_buf_size_preset(profile: HostProfile) -> int:
+    """Get the largest ring buffer size preset keeping the ring buffers within the memory cap.
+
+    Args:
+        profile (HostProfile): The host profile
+
+    Returns:
+        The largest ring buffer size preset.
+    """
+    buffers = math.ceil(profile.cpus / _cpus_for_each_buffer(profile.cpus))
+    max_buffer_size = profile.memory_bytes * RING_BUFFERS_MEMORY_RATIO / buffers
+    preset = MAX_BUF_SIZE_PRESET
+    while preset > MIN_BUF_SIZE_PRESET and _buffer_size(preset) > max_buffer_size:
+        preset -= 1
+    return preset
+
+
+def _cpus_for_each_buffer(cpus: int) -> int:
+    """Get the number of CPUs sharing a ring buffer.
+
+    Args:
+        cpus (int): The number of CPUs
+
+    Returns:
+        All the CPUs on hosts with up to 4 CPUs, and 2 on larger hosts.
+    """
+    return cpus if cpus <= 4 else 2
+
+
+def _clamp(value: int, lower: int, upper: int) -> int:
+    """Clamp a value within bounds.
+
+    Args:
+        value (int): The value
+        lower (int): The lower bound
+        upper (int): The upper bound
+
+    Returns:
+        The value within the bounds.
+    """
+    return max(lower, min(value, upper))
+
+
+def _buffer_size(preset: int) -> int:
+    """Get the size, in bytes, of a ring buffer.
+
+    Args:
+        preset (int): The ring buffer size preset
+
+    Returns:
+        The ring buffer size.
+    """
+    return 2 ** (preset - 1) * 1024**2
+
+
+def _preset_for(size: float) -> int:
+    """Get the smallest ring buffer size preset holding a number of bytes.
+
+    Args:
+        size (float): The number of bytes
+
+    Returns:
+        The ring buffer size preset, at most the largest one.
+    """
+    preset = MIN_BUF_SIZE_PRESET
+    while preset < MAX_BUF_SIZE_PRESET and _buffer_size(preset) < size:
+        preset += 1
+    return preset
+
+
+def _baseline_preset(cpus: int) -> int:
+    """Get the ring buffer size preset of a host whose syscall rate is unknown.
+
+    Args:
+        cpus (int): The number of CPUs
+
+    Returns:
+        The ring buffer size preset.
+    """
+    if cpus <= 4:
+        return 3
+    if cpus < 16:
+        return 4
+    if cpus < 64:
+        return 5
+    return 6
+
+
+def _read_memory_bytes() -> int:
+    """Read the total memory of the host.
+
+    Returns:
+        The total memory in bytes.
+    """
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    return page_size * os.sysconf("SC_PHYS_PAGES")
+
+
+def _read_pid_max() -> int:
+    """Read the maximum PID of the host.
+
+    Returns:
+        The maximum PID, or the largest thread table size if it cannot be read.
+    """
+    try:
+        return int(Path("/proc/sys/kernel/pid_max").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return MAX_THREAD_TABLE_SIZE
+
+
+def scrape_counters(port: int, names: tuple[str, ...]) -> dict[str, float]:
+    """Scrape counters from the Falco Prometheus metrics, each summed over its labels.
+
+    Args:
+        port (int): The local port of the Falco webserver
+        names (tuple[str, ...]): The counter names
+
+    Returns:
+        The values of the counters found, by name, empty if the metrics are not available.
+    """
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+    try:
+        connection.request("GET", "/metrics")
+        response = connection.getresponse()
+        text = response.read().decode("utf-8") if response.status == 200 else ""
+    except (OSError, http.client.HTTPException):
+        text = ""
+    finally:
+        connection.close()
+    counters: dict[str, float] = {}
+    for line in text.splitlines():
+        name = line.split("{", 1)[0].split(" ", 1)[0]
+        if name not in names:
+            continue
+        try:
+            counters[name] = counters.get(name, 0.0) + float(line.rsplit(" ", 1)[1])
+        except (IndexError, ValueError):
+            continue
+    if len(counters) < len(names):
+        logger.debug("Falco metrics %s are not all available on port %d", names, port)
+    return counters
@@ -0,0 +1,239 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Fixtures for the reconcile benchmarks."""
+
+import json
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import ownership
+import service
+
+# Stand-in for systemctl keeping the active units as files
+FAKE_SYSTEMCTL = """#!/bin/sh
+unit=""
+for arg in "$@"; do unit="${arg%.service}"; done
+case "$1 $2" in
+  daemon-reload*) ;;
+  "--quiet is-active") test -f "$FAKE_SYSTEMD_DIR/$unit.active" ;;
+  stop*|disable*) rm -f "$FAKE_SYSTEMD_DIR/$unit.active" ;;
+  start*|restart*|reload*) touch "$FAKE_SYSTEMD_DIR/$unit.active" ;;
+esac
+"""
+
+# Stand-in for the Falco binary accepting any rules file
+FAKE_FALCO = "#!/bin/sh\nexit 0\n"
+
+REPO_URL = "git+ssh://git@git.example.com/falco-config.git"
+
+
+def _bytes_written() -> int:
+    """Get the number of bytes written by the process so far.
+
+    Returns:
+        The `wchar` counter of the process.
+    """
+    for line in Path("/proc/self/io").read_text(encoding="utf-8").splitlines():
+        if line.startswith("wchar:"):
+            return int(line.split()[1])
+    return 0
+
+
+class Benchmark:
+    """Recorder of the benchmark scenario measurements."""
+
+    def __init__(self, rounds: int) -> None:
+        """Initialize the recorder.
+
+        Args:
+            rounds: The number of times each scenario is run.
+        """
+        self.rounds = rounds
+        self.samples: dict[str, dict[str, list[float]]] = {}
+
+    @contextmanager
+    def measure(self, scenario: str):
+        """Measure the wall time, subprocesses spawned and bytes written by a scenario.
+
+        Args:
+            scenario: The scenario name.
+
+        Yields:
+            The list of the commands spawned by the scenario.
+        """
+        commands: list = []
+        popen = subprocess.Popen
+
+        class CountingPopen(popen):  # type: ignore[valid-type, misc]
+            def __init__(self, args, *other_args, **kwargs):
+                commands.append(args)
+                super().__init__(args, *other_args, **kwargs)
+
+        with patch("subprocess.Popen", CountingPopen):
+            bytes_written = _bytes_written()
+            start = time.perf_counter()
+            yield commands
+            wall_time = time.perf_counter() - start
+            bytes_written = _bytes_written() - bytes_written
+
+        self.record(scenario, "wall_time_seconds", wall_time)
+        self.record(scenario, "subprocesses", len(commands))
+        self.record(scenario, "bytes_written", bytes_written)
+
+    def record(self, scenario: str, name: str, value: float) -> None:
+        """Record a measurement of a scenario.
+
+        Args:
+            scenario: The scenario name.
+            name: The measurement name.
+            value: The measured value.
+        """
+        self.samples.setdefault(scenario, {}).setdefault(name, []).append(value)
+
+    def report(self, charm: str) -> dict:
+        """Summarize the measurements.
+
+        Args:
+            charm: The benchmarked charm name.
+
+        Returns:
+            The minimum, median and maximum of each measurement, by scenario.
+        """
+        return {
+            "charm": charm,
+            "python": platform.python_version(),
+            "rounds": self.rounds,
+            "scenarios": {
+                scenario: {
+                    name: {
+                        "min": min(values),
+                        "median": statistics.median(values),
+                        "max": max(values),
+                    }
+                    for name, values in samples.items()
+                }
+                for scenario, samples in self.samples.items()
+            },
+        }
+
+
+@pytest.fixture(scope="session")
+def benchmark(request):
+    """Record the benchmark measurements, and write them to the benchmark output file."""
+    recorder = Benchmark(request.config.getoption("--benchmark-rounds"))
+    yield recorder
+    output = Path(request.config.getoption("--benchmark-output"))
+    output.write_text(json.dumps(recorder.report("falco"), indent=2), encoding="utf-8")
+
+
+class FalcoWorld:
+    """Local stand-ins for the Falco charm environment."""
+
+    def __init__(self, root: Path) -> None:
+        """Create the charm directory, the custom config repository and the stand-ins.
+
+        Args:
+            root: The directory holding the environment.
+        """
+        self.root = root
+        self.charm_dir = root / "charm"
+        falco_dir = self.charm_dir / "falco"
+        (falco_dir / "usr/bin").mkdir(parents=True)
+        (falco_dir / "usr/share/falco/plugins").mkdir(parents=True)
+        (falco_dir / "etc/falco/default_rules").mkdir(parents=True)
+        self._write_executable(falco_dir / "usr/bin/falco", FAKE_FALCO)
+
+        self.bin_dir = root / "bin"
+        self.systemd_dir = root / "systemd"
+        self.systemd_dir.mkdir()
+        self._write_executable(self.bin_dir / "systemctl", FAKE_SYSTEMCTL)
+
+        self.remote = root / "remote.git"
+        self.work = root / "work"
+        self._git("init", "--quiet", "--bare", str(self.remote))
+        self._git("init", "--quiet", "--initial-branch", "main", str(self.work))
+        for index in range(20):
+            self.push_rules(f"rules-{index:02d}.yaml", f"- list: list_{index}\n  items: []\n")
+
+    def push_rules(self, name: str, content: str) -> None:
+        """Commit a rules file and push it to the custom config repository.
+
+        Args:
+            name: The rules file name.
+            content: The rules file content.
+        """
+        (self.work / "rules.d").mkdir(exist_ok=True)
+        (self.work / "rules.d" / name).write_text(content, encoding="utf-8")
+        self._git("-C", str(self.work), "add", ".")
+        self._git(
+            "-C",
+            str(self.work),
+            "-c",
+            "user.name=falco",
+            "-c",
+            "user.email=falco@example.com",
+            "commit",
+            "--quiet",
+            "--message",
+            f"Update {name}",
+        )
+        self._git("-C", str(self.work), "push", "--quiet", str(self.remote), "HEAD:main")
+
+    @property
+    def env(self) -> dict[str, str]:
+        """Get the environment variables pointing the charm to the stand-ins."""
+        return {
+            "FAKE_SYSTEMD_DIR": str(self.systemd_dir),
+            # Fetch the custom config repository from the local bare repository
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": f"url.{self.remote}.insteadOf",
+            "GIT_CONFIG_VALUE_0": REPO_URL,
+        }
+
+    @staticmethod
+    def _git(*args: str) -> None:
+        subprocess.run(["git", *args], check=True, capture_output=True)
+
+    @staticmethod
+    def _write_executable(path: Path, content: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+        path.chmod(0o755)
+
+
+@pytest.fixture
+def falco_world(tmp_path_factory, monkeypatch):
+    """Create fresh Falco charm environments with local stand-ins."""
+
+    def create() -> FalcoWorld:
+        world = FalcoWorld(tmp_path_factory.mktemp("falco"))
+        home = world.root / "home"
+        home.mkdir()
+        monkeypatch.setattr(service, "MIRROR_DIR", home / "custom-falco-config-repository.git")
+        monkeypatch.setattr(service, "CLONE_OUTPUT_DIR", home / "custom-falco-config-repository")
+        monkeypatch.setattr(service, "SSH_DIR", home / ".ssh")
+        monkeypatch.setattr(service, "SSH_KEY_FILE", home / ".ssh" / "id_rsa")
+        monkeypatch.setattr(service, "KNOWN_HOSTS_FILE", home / ".ssh" / "known_hosts")
+        monkeypatch.setattr(ownership, "MACHINE_DIR", world.root / "machine")
+        monkeypatch.setattr(
+            service.FalcoServiceFile, "service_file", world.systemd_dir / "falco.service"
+        )
+        monkeypatch.setattr(
+            service.CharmMetricsService,
+            "service_file",
+            world.systemd_dir / "falco-charm-metrics.service",
+        )
+        monkeypatch.setenv("PATH", f"{world.bin_dir}:{Path('/usr/bin')}:{Path('/bin')}")
+        for key, value in world.env.items():
+            monkeypatch.setenv(key, value)
+        return world
+
+    return create
@@ -0,0 +1,172 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Output sink benchmarks for the Falco charm."""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import ClassVar
+
+import pytest
+
+from config import OUTPUT_SINKS
+
+# Output sink topologies, the first one enabling every sink as a baseline
+TOPOLOGIES = ("http,syslog,stdout", "http,syslog", "http")
+
+# Http output settings, the first one being the charm defaults as a baseline
+HTTP_OUTPUT_SETTINGS = {
+    "default": {"keep_alive": False, "compress_uploads": False},
+    "keep_alive": {"keep_alive": True, "compress_uploads": False},
+    "keep_alive_compress": {"keep_alive": True, "compress_uploads": True},
+}
+
+
+class _AcceptingHandler(BaseHTTPRequestHandler):
+    """Http output receiver accepting and discarding every event."""
+
+    protocol_version = "HTTP/1.1"
+    received_bytes: ClassVar[int] = 0
+    connections: ClassVar[set[tuple[str, int]]] = set()
+
+    def do_POST(self) -> None:
+        """Discard the posted event, counting its bytes and the connection it came through."""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        type(self).received_bytes += len(body)
+        type(self).connections.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *_args) -> None:
+        """Do not log the requests."""
+
+
+def _falco(
+    capture: Path, outputs: str, url: str, stdout: int, http_output: dict[str, bool] | None = None
+) -> subprocess.CompletedProcess:
+    """Replay a capture file through Falco with the given output sinks.
+
+    Args:
+        capture: The capture file.
+        outputs: The comma separated output sinks to enable.
+        url: The http output URL.
+        stdout: Where the Falco standard output goes.
+        http_output: The http output settings, the Falco defaults if None.
+
+    Returns:
+        The completed Falco process.
+    """
+    sinks = outputs.split(",")
+    options = [
+        "json_output=true",
+        f"http_output.url={url}",
+        *(f"{sink}_output.enabled={str(sink in sinks).lower()}" for sink in OUTPUT_SINKS),
+        *(f"http_output.{key}={str(value).lower()}" for key, value in (http_output or {}).items()),
+    ]
+    return subprocess.run(  # nosec B603
+        [
+            str(shutil.which("falco")),
+            "-e",
+            str(capture),
+            *(arg for option in options for arg in ("-o", option)),
+        ],
+        check=True,
+        stdout=stdout,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+
+
+def test_outputs(benchmark, request):
+    """Benchmark the Falco CPU time spent on each alert by output sink topology.
+
+    The capture file is replayed with every sink enabled to count the alerts, and then once by
+    topology with the standard output discarded, as with the systemd unit. The CPU time saved by
+    alert is measured against the topology enabling every sink.
+    """
+    captures = request.config.getoption("--benchmark-capture")
+    if not captures or not shutil.which("falco"):
+        pytest.skip("Needs a Falco binary and a capture file given with --benchmark-capture")
+    capture = captures[0]
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _AcceptingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    try:
+        replay = _falco(Path(capture), "stdout", url, subprocess.PIPE)
+        alerts = sum(line.startswith("{") for line in replay.stdout.splitlines())
+        if not alerts:
+            pytest.skip("The capture file triggers no alert")
+
+        for _ in range(benchmark.rounds):
+            cpu_seconds = {}
+            for outputs in TOPOLOGIES:
+                before = os.times()
+                _falco(Path(capture), outputs, url, subprocess.DEVNULL)
+                after = os.times()
+                cpu_seconds[outputs] = (after.children_user - before.children_user) + (
+                    after.children_system - before.children_system
+                )
+            for outputs, seconds in cpu_seconds.items():
+                scenario = f"outputs_{outputs.replace(',', '_')}"
+                benchmark.record(scenario, "alerts", alerts)
+                benchmark.record(scenario, "cpu_seconds", seconds)
+                benchmark.record(
+                    scenario,
+                    "cpu_microseconds_saved_per_alert",
+                    (cpu_seconds[TOPOLOGIES[0]] - seconds) / alerts * 1e6,
+                )
+    finally:
+        server.shutdown()
+
+
+def test_http_output(benchmark, request):
+    """Benchmark the Falco http output by connection reuse and compression settings.
+
+    The capture file is replayed with the http sink alone once by settings, recording the CPU
+    and wall time by alert, the bytes received by the local sink and the connections opened.
+    """
+    captures = request.config.getoption("--benchmark-capture")
+    if not captures or not shutil.which("falco"):
+        pytest.skip("Needs a Falco binary and a capture file given with --benchmark-capture")
+    capture = captures[0]
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _AcceptingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    try:
+        replay = _falco(Path(capture), "stdout", url, subprocess.PIPE)
+        alerts = sum(line.startswith("{") for line in replay.stdout.splitlines())
+        if not alerts:
+            pytest.skip("The capture file triggers no alert")
+
+        for _ in range(benchmark.rounds):
+            for name, http_output in HTTP_OUTPUT_SETTINGS.items():
+                _AcceptingHandler.received_bytes = 0
+                _AcceptingHandler.connections = set()
+                before = os.times()
+                start = time.perf_counter()
+                _falco(Path(capture), "http", url, subprocess.DEVNULL, http_output)
+                wall_seconds = time.perf_counter() - start
+                after = os.times()
+                cpu_seconds = (after.children_user - before.children_user) + (
+                    after.children_system - before.children_system
+                )
+                scenario = f"http_output_{name}"
+                benchmark.record(scenario, "alerts", alerts)
+                benchmark.record(
+                    scenario, "cpu_microseconds_per_alert", cpu_seconds / alerts * 1e6
+                )
+                benchmark.record(
+                    scenario, "wall_microseconds_per_alert", wall_seconds / alerts * 1e6
+                )
+                benchmark.record(scenario, "bytes_received", _AcceptingHandler.received_bytes)
+                benchmark.record(scenario, "connections", len(_AcceptingHandler.connections))
+    finally:
+        server.shutdown()
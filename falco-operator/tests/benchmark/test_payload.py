@@ -0,0 +1,59 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""JSON event payload size benchmarks for the Falco charm."""
+
+import json
+from pathlib import Path
+
+from state import PAYLOAD_PROFILES, FalcoPayload
+
+# Falco alerts as sent with the full payload profile
+SAMPLE_EVENTS = Path(__file__).parent / "sample_events.jsonl"
+# Output fields appended by suggested_output when the rule output does not hold them
+SUGGESTED_FIELD_PREFIXES = ("container.", "k8s.")
+
+
+def _payload(event: dict, payload: FalcoPayload) -> dict:
+    """Strip a full payload event down to the properties of a payload profile.
+
+    Args:
+        event: The event sent with the full payload profile.
+        payload: The payload settings of the profile.
+
+    Returns:
+        The event as sent with the payload profile.
+    """
+    event = dict(event)
+    if not payload.output:
+        del event["output"]
+    if not payload.tags:
+        del event["tags"]
+    if not payload.output_fields:
+        del event["output_fields"]
+    elif not payload.suggested_output:
+        event["output_fields"] = {
+            name: value
+            for name, value in event["output_fields"].items()
+            if not name.startswith(SUGGESTED_FIELD_PREFIXES)
+        }
+    return event
+
+
+def test_payload(benchmark):
+    """Benchmark the bytes of the sample events sent with each payload profile.
+
+    The suggested fields are approximated by the container and Kubernetes fields, which the
+    sample rules outputs do not hold.
+    """
+    events = [json.loads(line) for line in SAMPLE_EVENTS.read_text(encoding="utf-8").splitlines()]
+    full_bytes = sum(len(json.dumps(event, separators=(",", ":"))) for event in events)
+
+    for _ in range(benchmark.rounds):
+        for name, payload in PAYLOAD_PROFILES.items():
+            sizes = [
+                len(json.dumps(_payload(event, payload), separators=(",", ":")))
+                for event in events
+            ]
+            benchmark.record(f"payload_{name}", "bytes_per_event", sum(sizes) / len(sizes))
+            benchmark.record(f"payload_{name}", "bytes_ratio_to_full", sum(sizes) / full_bytes)
@@ -0,0 +1,146 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Plugin set startup benchmarks for the Falco charm."""
+
+import shutil
+import socket
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from config import FALCO_PLUGINS
+
+# Plugin sets, the first one loading every bundled plugin as a baseline
+PLUGIN_SETS = {
+    "all": list(FALCO_PLUGINS),
+    "container": ["container"],
+    "none": [],
+}
+
+# Rules file loading no rule, so that the startup only differs by the plugins
+EMPTY_RULES = "- macro: never_true\n  condition: (evt.num=0)\n"
+
+STARTUP_TIMEOUT_SECONDS = 60
+
+
+def _free_port() -> int:
+    """Get a free local TCP port.
+
+    Returns:
+        The port number.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _status(pid: int) -> dict[str, str]:
+    """Read the status of a process.
+
+    Args:
+        pid: The process ID.
+
+    Returns:
+        The status fields, by name.
+    """
+    lines = Path(f"/proc/{pid}/status").read_text(encoding="utf-8").splitlines()
+    return dict(line.split(":\t", 1) for line in lines if ":\t" in line)
+
+
+def _command(falco: str, config: Path, rules: Path, plugins: list[str], port: int) -> list[str]:
+    """Get the command running Falco without a driver.
+
+    Args:
+        falco: The Falco binary.
+        config: The Falco config file.
+        rules: The Falco rules file.
+        plugins: The plugins to load, in load order.
+        port: The port of the Falco webserver.
+
+    Returns:
+        The Falco command.
+    """
+    plugins_dir = Path(falco).resolve().parents[1] / "share/falco/plugins"
+    options = [
+        "engine.kind=nodriver",
+        "webserver.enabled=true",
+        "webserver.listen_address=127.0.0.1",
+        f"webserver.listen_port={port}",
+        *(f"load_plugins[{i}]={name}" for i, name in enumerate(plugins)),
+        *(f"plugins[{i}].name={name}" for i, name in enumerate(plugins)),
+        *(
+            f"plugins[{i}].library_path={plugins_dir / f'lib{name}.so'}"
+            for i, name in enumerate(plugins)
+        ),
+    ]
+    if "k8saudit" in plugins:
+        options.append(f"plugins[{plugins.index('k8saudit')}].open_params=http://:9765/k8s-audit")
+    return [
+        falco,
+        "-c",
+        str(config),
+        "-r",
+        str(rules),
+        *(arg for option in options for arg in ("-o", option)),
+    ]
+
+
+def _wait_ready(process: subprocess.Popen, port: int) -> float:
+    """Wait for Falco to serve its health endpoint.
+
+    Args:
+        process: The Falco process.
+        port: The port of the Falco webserver.
+
+    Returns:
+        The seconds elapsed since the call.
+    """
+    start = time.perf_counter()
+    while time.perf_counter() - start < STARTUP_TIMEOUT_SECONDS:
+        if process.poll() is not None:
+            pytest.fail(f"Falco exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1):  # nosec
+                return time.perf_counter() - start
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.05)
+    pytest.fail("Falco did not start in time")
+
+
+def test_plugins(benchmark, tmp_path):
+    """Benchmark the Falco startup time, memory and threads by plugin set.
+
+    Falco runs without a driver, so only the plugins differ between the sets. Each set is started
+    until the webserver serves its health endpoint, and its resident memory and threads are read
+    then.
+    """
+    falco = shutil.which("falco")
+    if not falco:
+        pytest.skip("Needs a Falco binary")
+    config = tmp_path / "falco.yaml"
+    config.write_text("plugins: []\nload_plugins: []\n", encoding="utf-8")
+    rules = tmp_path / "rules.yaml"
+    rules.write_text(EMPTY_RULES, encoding="utf-8")
+
+    for _ in range(benchmark.rounds):
+        for name, plugins in PLUGIN_SETS.items():
+            port = _free_port()
+            command = _command(falco, config, rules, plugins, port)
+            process = subprocess.Popen(  # nosec B603
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                startup_seconds = _wait_ready(process, port)
+                status = _status(process.pid)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            scenario = f"plugins_{name}"
+            benchmark.record(scenario, "startup_seconds", startup_seconds)
+            benchmark.record(scenario, "rss_kib", int(status["VmRSS"].split()[0]))
+            benchmark.record(scenario, "threads", int(status["Threads"]))
@@ -0,0 +1,58 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Reconcile latency benchmarks for the Falco charm."""
+
+import dataclasses
+
+import ops
+from ops import testing
+
+from charm import Falco
+from tests.benchmark.conftest import REPO_URL
+
+
+def test_reconcile(benchmark, falco_world):
+    """Benchmark the Falco charm reconciliation.
+
+    The scenarios are a cold install, a reconcile without changes, a change of the custom rules
+    and a change of the http endpoint.
+    """
+    for _ in range(benchmark.rounds):
+        world = falco_world()
+        ctx = testing.Context(charm_type=Falco, charm_root=world.charm_dir)
+        relation = testing.Relation(
+            endpoint="http-endpoint",
+            interface="http_endpoint",
+            remote_app_data={"url": '"http://127.0.0.1:8080/"'},
+        )
+        state = testing.State(
+            config={
+                "custom-config-repository": f"{REPO_URL}@main",
+                "custom-config-repo-host-key": "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIBenchmark",
+            },
+            relations=[relation],
+        )
+
+        with benchmark.measure("cold_install"):
+            state = ctx.run(ctx.on.install(), state)
+            state = ctx.run(ctx.on.config_changed(), state)
+        assert state.unit_status == ops.ActiveStatus()
+
+        with benchmark.measure("noop_reconcile") as commands:
+            state = ctx.run(ctx.on.config_changed(), state)
+        assert not any("restart" in command or "fetch" in command for command in commands)
+
+        world.push_rules("rules-00.yaml", "- list: list_00\n  items: [changed]\n")
+        with benchmark.measure("rule_change") as commands:
+            state = ctx.run(ctx.on.config_changed(), state)
+        assert any("reload" in command for command in commands)
+
+        relation = dataclasses.replace(
+            relation, remote_app_data={"url": '"http://127.0.0.1:9090/"'}
+        )
+        state = dataclasses.replace(state, relations=[relation])
+        with benchmark.measure("endpoint_change") as commands:
+            state = ctx.run(ctx.on.relation_changed(relation), state)
+        assert any("reload" in command for command in commands)
+        assert state.unit_status == ops.ActiveStatus()
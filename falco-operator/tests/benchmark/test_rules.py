@@ -0,0 +1,206 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Custom rules throughput benchmarks for the Falco charm."""
+
+import json
+import os
+import re
+import statistics
+import subprocess
+import time
+from collections import Counter
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+from cosl import JujuTopology
+
+from service import (
+    FalcoConfigFile,
+    FalcoCustomSetting,
+    FalcoLayout,
+    FalcoOverrideConfigFile,
+    _plugin_options,
+)
+
+# Falco verbose summary of a capture file replay
+CAPTURED_EVENTS_PATTERN = re.compile(r"Captured Events: (\d+)")
+
+# Settings keeping the replay offline and printing every alert as JSON on the standard output
+REPLAY_OPTIONS = (
+    "json_output=true",
+    "stdout_output.enabled=true",
+    "syslog_output.enabled=false",
+    "http_output.enabled=false",
+    "file_output.enabled=false",
+    "program_output.enabled=false",
+    "grpc_output.enabled=false",
+    "webserver.enabled=false",
+)
+
+# Juju topology of the charm managed config override file
+TOPOLOGY = JujuTopology(
+    model="benchmark",
+    model_uuid="00000000-0000-4000-8000-000000000000",
+    application="falco",
+    unit="falco/0",
+    charm_name="falco",
+)
+
+
+def _falco_layout(falco_home: Path, root: Path) -> FalcoLayout:
+    """Get the layout of the packaged Falco, without writing to the build artifact.
+
+    Args:
+        falco_home: The unpacked Falco build artifact.
+        root: The directory holding the layout.
+
+    Returns:
+        The Falco file layout, linking to the binary and plugins of the artifact.
+    """
+    home = root / "falco"
+    (home / "etc/falco").mkdir(parents=True)
+    (home / "usr").symlink_to(falco_home / "usr")
+    return FalcoLayout(home)
+
+
+def _stage(layout: FalcoLayout, checkout: Path, plugins: list[str]) -> None:
+    """Activate the custom settings of a checkout, and render the Falco config files.
+
+    The custom rules and configs are synced into a new generation, and the config file and the
+    charm managed override file are rendered, with the charm defaults, as the charm does.
+
+    Args:
+        layout: The Falco file layout.
+        checkout: The custom config repository checkout.
+        plugins: The plugins to load, in load order.
+    """
+    custom_setting = FalcoCustomSetting(layout)
+    custom_setting._sync(checkout)
+    FalcoConfigFile(layout).update(context={"plugins": plugins})
+    with patch.object(JujuTopology, "from_charm", return_value=TOPOLOGY):
+        override_config_file = FalcoOverrideConfigFile(layout, Mock())
+    override_config_file.install()
+
+
+def _replay(layout: FalcoLayout, plugins: list[str], capture: Path) -> dict:
+    """Replay a capture file through Falco with the active custom settings.
+
+    Falco is started with the config file, rules directory and plugins of the Falco service,
+    reading the capture file instead of the kernel events, and with the outputs other than the
+    standard output disabled.
+
+    Args:
+        layout: The Falco file layout.
+        plugins: The plugins to load, in load order.
+        capture: The capture file.
+
+    Returns:
+        The events read, wall and CPU seconds spent, and alerts by rule name.
+    """
+    options = [*_plugin_options(layout, plugins), *REPLAY_OPTIONS]
+    before = os.times()
+    start = time.perf_counter()
+    replay = subprocess.run(  # nosec B603
+        [
+            str(layout.cmd),
+            "-c",
+            str(layout.config_file),
+            "-r",
+            str(layout.rules_dir),
+            "-v",
+            "-e",
+            str(capture),
+            *(arg for option in options for arg in ("-o", option)),
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    wall_seconds = time.perf_counter() - start
+    after = os.times()
+
+    events = CAPTURED_EVENTS_PATTERN.search(replay.stderr + replay.stdout)
+    if not events:
+        pytest.fail(f"Falco did not report the events read from {capture}")
+    alerts = [json.loads(line) for line in replay.stdout.splitlines() if line.startswith("{")]
+    return {
+        "events": int(events.group(1)),
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": (after.children_user - before.children_user)
+        + (after.children_system - before.children_system),
+        "matches": Counter(alert["rule"] for alert in alerts),
+    }
+
+
+def test_rules(benchmark, request, tmp_path):
+    """Benchmark the Falco throughput of a custom rules revision, against the previous revision.
+
+    Each capture file is replayed offline through the packaged Falco, set up as the Falco service
+    of the charm with the custom settings of the revision, once by round and by revision, and the
+    events per second, CPU time and alerts by rule of all the captures are recorded. The test
+    fails when the median events per second of the candidate revision drop, or its median CPU
+    time grows, by more than the allowed share of the previous revision.
+    """
+    falco_home = request.config.getoption("--benchmark-falco-home")
+    captures = request.config.getoption("--benchmark-capture")
+    candidate = request.config.getoption("--benchmark-rules")
+    if not falco_home or not captures or not candidate:
+        pytest.skip(
+            "Needs a Falco build artifact, capture files and a custom config repository checkout"
+            " given with --benchmark-falco-home, --benchmark-capture and --benchmark-rules"
+        )
+    layout = _falco_layout(Path(falco_home).resolve(), tmp_path)
+    plugins = [name for name in request.config.getoption("--benchmark-plugins").split(",") if name]
+    revisions = {"candidate": Path(candidate)}
+    baseline = request.config.getoption("--benchmark-baseline-rules")
+    if baseline:
+        revisions["baseline"] = Path(baseline)
+
+    throughput: dict[str, list[float]] = {name: [] for name in revisions}
+    cpu: dict[str, list[float]] = {name: [] for name in revisions}
+    matches: dict[str, Counter] = {}
+    for _ in range(benchmark.rounds):
+        for name, checkout in revisions.items():
+            _stage(layout, checkout, plugins)
+            replays = [_replay(layout, plugins, Path(capture)) for capture in captures]
+            events = sum(replay["events"] for replay in replays)
+            wall_seconds = sum(replay["wall_seconds"] for replay in replays)
+            cpu_seconds = sum(replay["cpu_seconds"] for replay in replays)
+            matches[name] = sum((replay["matches"] for replay in replays), Counter())
+            throughput[name].append(events / wall_seconds)
+            cpu[name].append(cpu_seconds)
+
+            scenario = f"rules_{name}"
+            benchmark.record(scenario, "events", events)
+            benchmark.record(scenario, "events_per_second", events / wall_seconds)
+            benchmark.record(scenario, "cpu_seconds", cpu_seconds)
+            benchmark.record(
+                scenario, "cpu_microseconds_per_event", cpu_seconds / max(events, 1) * 1e6
+            )
+            for rule, count in sorted(matches[name].items()):
+                benchmark.record(scenario, f"matches:{rule}", count)
+
+    if "baseline" not in revisions:
+        return
+    max_regression = request.config.getoption("--benchmark-max-regression")
+    candidate_eps, baseline_eps = (statistics.median(throughput[name]) for name in revisions)
+    candidate_cpu, baseline_cpu = (statistics.median(cpu[name]) for name in revisions)
+    benchmark.record(
+        "rules_candidate", "events_per_second_change", candidate_eps / baseline_eps - 1
+    )
+    if baseline_cpu:
+        benchmark.record("rules_candidate", "cpu_seconds_change", candidate_cpu / baseline_cpu - 1)
+    for rule in sorted(set(matches["candidate"]) | set(matches["baseline"])):
+        benchmark.record(
+            "rules_candidate",
+            f"matches_change:{rule}",
+            matches["candidate"][rule] - matches["baseline"][rule],
+        )
+    assert candidate_eps >= baseline_eps * (1 - max_regression), (
+        f"Events per second dropped from {baseline_eps:.0f} to {candidate_eps:.0f}"
+    )
+    assert candidate_cpu <= baseline_cpu * (1 + max_regression), (
+        f"CPU time grew from {baseline_cpu:.3f}s to {candidate_cpu:.3f}s"
+    )
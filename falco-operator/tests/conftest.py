@@ -11,6 +11,52 @@ def pytest_addoption(parser):
         parser: Pytest parser.
     """
     parser.addoption("--charm-file", action="store")
+    parser.addoption(
+        "--benchmark-output",
+        action="store",
+        default="benchmark.json",
+        help="File to write the benchmark results to",
+    )
+    parser.addoption(
+        "--benchmark-rounds",
+        action="store",
+        type=int,
+        default=5,
+        help="Number of times each benchmark scenario is run",
+    )
+    parser.addoption(
+        "--benchmark-capture",
+        action="append",
+        help="Capture file replayed through Falco by the benchmarks, repeated for several files",
+    )
+    parser.addoption(
+        "--benchmark-falco-home",
+        action="store",
+        help="Unpacked Falco build artifact replaying the captures of the rules benchmark",
+    )
+    parser.addoption(
+        "--benchmark-rules",
+        action="store",
+        help="Custom config repository checkout of the candidate rules revision",
+    )
+    parser.addoption(
+        "--benchmark-baseline-rules",
+        action="store",
+        help="Custom config repository checkout of the previous rules revision",
+    )
+    parser.addoption(
+        "--benchmark-plugins",
+        action="store",
+        default="json,k8saudit,container",
+        help="Comma separated plugins the rules benchmark loads, as the charm plugins option",
+    )
+    parser.addoption(
+        "--benchmark-max-regression",
+        action="store",
+        type=float,
+        default=0.1,
+        help="Share of the previous rules revision throughput the candidate may lose",
+    )
     parser.addoption(
         "--keep-models",
         action="store_true",
@@ -2,12 +2,23 @@
 # See LICENSE file for licensing details.
 
 
+import subprocess
+
 import pytest
 from ops import testing
 
+from ownership import MachineOwnership
 from service import FalcoLayout
 
 
+@pytest.fixture(autouse=True)
+def mock_machine_dir(tmp_path, monkeypatch):
+    """Point the machine-wide directory shared by the falco units to a temporary directory."""
+    machine_dir = tmp_path / "machine"
+    monkeypatch.setattr("ownership.MACHINE_DIR", machine_dir)
+    return machine_dir
+
+
 @pytest.fixture
 def mock_charm_dir(tmp_path):
     """Mock charm directory containing Falco directory."""
@@ -32,6 +43,15 @@ def mock_falco_layout(mock_falco_base_dir):
     yield FalcoLayout(base_dir=mock_falco_base_dir)
 
 
+@pytest.fixture
+def machine_owner(mock_charm_dir):
+    """Make the falco unit of the charm tests the owner of the Falco service of the machine."""
+    ownership = MachineOwnership("falco/0", mock_charm_dir)
+    with ownership.lock():
+        ownership.claim()
+    return ownership
+
+
 @pytest.fixture
 def http_endpoint_relation():
     """Fixture for http-endpoint relation.
@@ -46,3 +66,40 @@ def http_endpoint_relation():
             "url": '"http://127.0.0.1:8080/"',
         },
     )
+
+
+@pytest.fixture
+def mock_git_dirs(tmp_path, monkeypatch):
+    """Point the custom config repository mirror and worktree to temporary directories."""
+    mirror_dir = tmp_path / "custom-falco-config-repository.git"
+    clone_dir = tmp_path / "custom-falco-config-repository"
+    monkeypatch.setattr("service.MIRROR_DIR", mirror_dir)
+    monkeypatch.setattr("service.CLONE_OUTPUT_DIR", clone_dir)
+    return mirror_dir, clone_dir
+
+
+@pytest.fixture
+def local_git_repo(tmp_path):
+    """Create a local custom config repository.
+
+    The repository has a `v1` tag with one rules file, and a `main` branch with two rules files.
+    """
+    repo = tmp_path / "remote"
+
+    def git(*args):
+        subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True)
+
+    (repo / "rules.d").mkdir(parents=True)
+    (repo / "config.override.d").mkdir()
+    git("init", "--initial-branch", "main")
+    git("config", "user.email", "falco@example.com")
+    git("config", "user.name", "falco")
+    (repo / "rules.d/a.yaml").write_text("- list: a\n  items: []\n")
+    (repo / "config.override.d/a.yaml").write_text("json_output: true\n")
+    git("add", ".")
+    git("commit", "--message", "first")
+    git("tag", "--annotate", "v1", "--message", "v1")
+    (repo / "rules.d/b.yaml").write_text("- list: b\n  items: []\n")
+    git("add", ".")
+    git("commit", "--message", "second")
+    return repo
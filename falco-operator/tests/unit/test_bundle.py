@@ -0,0 +1,83 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the custom config bundle module."""
+
+import base64
+import hashlib
+import os
+
+import pytest
+
+from bundle import DIGEST_FILE_NAME, BundleError, CustomConfigBundle, pack, unpack
+
+KEYS = ("rules.d", "config.override.d")
+
+
+@pytest.fixture
+def checkout(tmp_path):
+    """Create a checkout of a custom config repository."""
+    source = tmp_path / "checkout"
+    (source / "rules.d").mkdir(parents=True)
+    (source / "rules.d/a.yaml").write_text("- list: a\n  items: []\n")
+    (source / "config.override.d").mkdir()
+    (source / "config.override.d/a.yaml").write_text("json_output: true\n")
+    (source / "README.md").write_text("not bundled")
+    return source
+
+
+class TestBundle:
+    """Test the bundle pack and unpack functions."""
+
+    def test_pack_is_reproducible(self, checkout):
+        """Test the same files give the same digest, whatever their timestamps."""
+        bundle = pack(checkout, KEYS)
+        os.utime(checkout / "rules.d/a.yaml", (0, 0))
+
+        assert pack(checkout, KEYS) == bundle
+
+        (checkout / "rules.d/a.yaml").write_text("- list: a\n  items: [b]\n")
+        assert pack(checkout, KEYS).digest != bundle.digest
+
+    def test_pack_too_large(self, checkout, monkeypatch):
+        """Test a bundle larger than the peer relation data allows is refused."""
+        monkeypatch.setattr("bundle.MAX_BUNDLE_SIZE", 16)
+
+        with pytest.raises(BundleError, match="larger than 16 bytes"):
+            pack(checkout, KEYS)
+
+    def test_unpack(self, checkout, tmp_path):
+        """Test a bundle is unpacked once, replacing the previous content."""
+        destination = tmp_path / "bundle"
+        (destination / "rules.d").mkdir(parents=True)
+        (destination / "rules.d/old.yaml").write_text("- list: old\n")
+        bundle = pack(checkout, KEYS)
+
+        assert unpack(bundle, destination)
+        assert not unpack(bundle, destination)
+
+        assert (destination / "rules.d/a.yaml").read_text() == "- list: a\n  items: []\n"
+        assert (destination / "config.override.d/a.yaml").read_text() == "json_output: true\n"
+        assert not (destination / "rules.d/old.yaml").exists()
+        assert not (destination / "README.md").exists()
+        assert (destination / DIGEST_FILE_NAME).read_text() == bundle.digest
+
+    def test_unpack_tampered(self, checkout, tmp_path):
+        """Test a bundle not matching its digest is refused, leaving the directory untouched."""
+        destination = tmp_path / "bundle"
+        bundle = pack(checkout, KEYS)
+        unpack(bundle, destination)
+        other = pack(checkout, ("rules.d",))
+
+        with pytest.raises(BundleError, match="does not match its digest"):
+            unpack(CustomConfigBundle(digest="0" * 64, data=other.data), destination)
+        data = b"not a tarball"
+        with pytest.raises(BundleError, match="not a valid tarball"):
+            unpack(
+                CustomConfigBundle(
+                    digest=hashlib.sha256(data).hexdigest(), data=base64.b64encode(data).decode()
+                ),
+                destination,
+            )
+
+        assert (destination / DIGEST_FILE_NAME).read_text() == bundle.digest
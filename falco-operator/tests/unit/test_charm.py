@@ -3,16 +3,23 @@
 
 """Unit tests for Falco charm."""
 
+import dataclasses
+import json
 import shutil
 from unittest.mock import MagicMock, patch
 
 import ops
 import ops.testing
 import pytest
+from pfe.interfaces.falcosidekick_http_endpoint import HttpEndpointTopology
 from pydantic import AnyUrl
 
+from bundle import CustomConfigBundle
 from charm import Falco
-from service import FalcoConfigurationError
+from ownership import MachineOwnership
+from rollout import PENDING, REGRESSED, ROLLED_BACK, Rollout
+from rules import RuleCost
+from service import FalcoConfigurationError, FalcoRulesCostError, FalcoRulesValidationError
 
 
 class TestCharm:
@@ -140,6 +147,211 @@ class TestCharm:
         mock_service.remove.assert_called_once()
 
 
+class TestCharmMachineOwnership:
+    """Test the coordination of the falco units of a machine."""
+
+    @patch("charm.FalcoService")
+    def test_passive_unit(self, mock_service_class, mock_charm_dir, mock_falco_layout, tmp_path):
+        """Test a unit leaves the Falco service to the unit owning it, and contributes labels."""
+        owner_charm_dir = tmp_path / "unit-falco-b-0"
+        owner_charm_dir.mkdir()
+        owner = MachineOwnership("falco-b/0", owner_charm_dir)
+        owner.claim()
+        mock_service = mock_service_class.return_value
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_out = context.run(context.on.install(), ops.testing.State())
+        state_out = context.run(context.on.config_changed(), state_out)
+        context.run(context.on.remove(), state_out)
+
+        assert state_out.unit_status == ops.testing.ActiveStatus(
+            "Passive, Falco owned by falco-b/0"
+        )
+        mock_service.install.assert_not_called()
+        mock_service.configure.assert_not_called()
+        mock_service.remove.assert_not_called()
+        assert owner.owner() == "falco-b/0"
+        assert list(owner.contributions()) == []
+
+    @patch("charm.FalcoService")
+    def test_owner_applies_changed_units(
+        self, mock_service_class, mock_charm_dir, mock_falco_layout, tmp_path, machine_owner
+    ):
+        """Test the owner reconciles on update-status once another unit changes its labels."""
+        passive_charm_dir = tmp_path / "unit-falco-b-0"
+        passive_charm_dir.mkdir()
+        passive = MachineOwnership("falco-b/0", passive_charm_dir)
+        mock_service = mock_service_class.return_value
+        mock_service.check_active.return_value = True
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_out = context.run(context.on.config_changed(), ops.testing.State())
+        mock_service.configure.reset_mock()
+        state_out = context.run(context.on.update_status(), state_out)
+        mock_service.configure.assert_not_called()
+
+        passive.contribute({"unit": "falco-b/0", "application": "falco-b"})
+        context.run(context.on.update_status(), state_out)
+
+        charm_state = mock_service.configure.call_args.args[0]
+        assert list(charm_state.machine_units) == ["falco/0", "falco-b/0"]
+        assert not machine_owner.stale()
+
+    @patch("charm.FalcoService")
+    def test_take_over_removed_owner(
+        self, mock_service_class, mock_charm_dir, mock_falco_layout, tmp_path
+    ):
+        """Test a passive unit installs and configures Falco once the owner is removed."""
+        owner_charm_dir = tmp_path / "unit-falco-b-0"
+        owner_charm_dir.mkdir()
+        owner = MachineOwnership("falco-b/0", owner_charm_dir)
+        owner.claim()
+        owner.contribute({"unit": "falco-b/0", "application": "falco-b"})
+        mock_service = mock_service_class.return_value
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_out = context.run(context.on.update_status(), ops.testing.State())
+        mock_service.configure.assert_not_called()
+
+        owner_charm_dir.rmdir()
+        state_out = context.run(context.on.update_status(), state_out)
+
+        mock_service.install.assert_called_once()
+        charm_state = mock_service.configure.call_args.args[0]
+        assert list(charm_state.machine_units) == ["falco/0"]
+        assert owner.owner() == "falco/0"
+        assert state_out.unit_status == ops.testing.ActiveStatus()
+
+
+class TestCharmCustomConfigDistribution:
+    """Test the distribution of the custom config repository by the leader."""
+
+    @patch("charm.FalcoService")
+    def test_leader_publishes_bundle(self, mock_service_class, mock_charm_dir, mock_falco_layout):
+        """Test the leader publishes the bundle of the custom settings to the peers."""
+        bundle = CustomConfigBundle(digest="a" * 64, data="YnVuZGxl")
+        mock_service = mock_service_class.return_value
+        mock_service.custom_config_bundle.return_value = bundle
+        peers = ops.testing.PeerRelation(endpoint="falco-peers")
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_in = ops.testing.State(
+            leader=True,
+            config={
+                "custom-config-repository": "git+ssh://git@github.com/owner/repo.git",
+                "custom-config-distribution": "leader",
+            },
+            relations=[peers],
+        )
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        charm_state = mock_service.configure.call_args.args[0]
+        assert charm_state.fetch_custom_config
+        mock_service.custom_config_bundle.assert_called_once_with(charm_state, fetch=False)
+        assert state_out.get_relation(peers.id).local_app_data == {
+            "custom-config-bundle-digest": bundle.digest,
+            "custom-config-bundle": bundle.data,
+        }
+
+    @patch("charm.FalcoService")
+    def test_unit_applies_bundle(self, mock_service_class, mock_charm_dir, mock_falco_layout):
+        """Test a non leader unit applies the bundle published by the leader."""
+        bundle = CustomConfigBundle(digest="a" * 64, data="YnVuZGxl")
+        mock_service = mock_service_class.return_value
+        peers = ops.testing.PeerRelation(
+            endpoint="falco-peers",
+            local_app_data={
+                "custom-config-bundle-digest": bundle.digest,
+                "custom-config-bundle": bundle.data,
+            },
+            peers_data={1: {}},
+        )
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_in = ops.testing.State(
+            config={
+                "custom-config-repository": "git+ssh://git@github.com/owner/repo.git",
+                "custom-config-distribution": "leader",
+            },
+            relations=[peers],
+        )
+        context.run(context.on.relation_changed(peers, remote_unit=1), state_in)
+
+        charm_state = mock_service.configure.call_args.args[0]
+        assert not charm_state.fetch_custom_config
+        assert charm_state.custom_config_bundle == bundle
+        mock_service.custom_config_bundle.assert_not_called()
+
+
+class TestCharmStagedRollout:
+    """Test the staged rollout of the custom config repository revisions."""
+
+    @patch("charm.FalcoService")
+    def test_leader_starts_rollout(self, mock_service_class, mock_charm_dir, mock_falco_layout):
+        """Test the leader starts the rollout of a new revision, and applies it as canary."""
+        mock_service = mock_service_class.return_value
+        mock_service.custom_config_revision.return_value = "a" * 64
+        peers = ops.testing.PeerRelation(endpoint="falco-peers", peers_data={1: {}})
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_in = ops.testing.State(
+            leader=True,
+            config={
+                "custom-config-repository": "git+ssh://git@github.com/owner/repo.git",
+                "custom-config-rollout": "staged",
+            },
+            relations=[peers],
+        )
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        rollout = Rollout(revision="a" * 64)
+        relation = state_out.get_relation(peers.id)
+        assert relation.local_app_data == {"custom-config-rollout": rollout.model_dump_json()}
+        assert relation.local_unit_data == {
+            **peers.local_unit_data,
+            "custom-config-health": PENDING,
+        }
+        assert mock_service.configure.call_count == 2
+        assert mock_service.configure.call_args.args[0].custom_config_rollout.rollout == rollout
+        assert state_out.unit_status == ops.ActiveStatus(
+            "Custom config rollout at 10% of the units"
+        )
+
+    @patch("charm.FalcoService")
+    def test_leader_rolls_back(self, mock_service_class, mock_charm_dir, mock_falco_layout):
+        """Test the leader rolls the rollout back when a canary regressed."""
+        mock_service = mock_service_class.return_value
+        mock_service.custom_config_revision.return_value = "a" * 64
+        peers = ops.testing.PeerRelation(
+            endpoint="falco-peers",
+            local_app_data={"custom-config-rollout": Rollout(revision="a" * 64).model_dump_json()},
+            local_unit_data={
+                "custom-config-revision": "a" * 64,
+                "custom-config-health": REGRESSED,
+            },
+            peers_data={1: {}},
+        )
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_in = ops.testing.State(
+            leader=True,
+            config={
+                "custom-config-repository": "git+ssh://git@github.com/owner/repo.git",
+                "custom-config-rollout": "staged",
+            },
+            relations=[peers],
+        )
+        state_out = context.run(context.on.relation_changed(peers, remote_unit=1), state_in)
+
+        rollout = Rollout(revision="a" * 64, status=ROLLED_BACK)
+        relation = state_out.get_relation(peers.id)
+        assert relation.local_app_data == {"custom-config-rollout": rollout.model_dump_json()}
+        assert mock_service.configure.call_args.args[0].custom_config_rollout.rollout == rollout
+        assert state_out.unit_status == ops.BlockedStatus(
+            f"Custom config rollout rolled back, revision {'a' * 12}"
+        )
+
+
 class TestCharmConfigHandling:
     """Test charm configuration handling."""
 
@@ -278,6 +490,174 @@ class TestCharmConfigHandling:
 
         assert state_out.unit_status == ops.testing.BlockedStatus("Failed configuring Falco")
 
+    @patch("charm.FalcoService")
+    def test_reconcile_exports_hook_metrics(
+        self, mock_service_class, mock_charm_dir, mock_falco_layout
+    ):
+        """Test reconciling exports the hook phase timings, even when it fails."""
+        mock_service = MagicMock()
+        mock_service.configure.side_effect = FalcoConfigurationError("Clone failed")
+        mock_service_class.return_value = mock_service
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        context.run(context.on.config_changed(), ops.testing.State())
+
+        metrics_file = mock_falco_layout.state_dir / "metrics" / "metrics.txt"
+        assert 'phase="reconcile"' in metrics_file.read_text()
+
+    @patch("charm.FalcoService")
+    def test_config_changed_invalid_rules(
+        self, mock_service_class, mock_charm_dir, mock_falco_layout
+    ):
+        """Test config_changed with an invalid custom rules file."""
+        mock_service = MagicMock()
+        mock_service.configure.side_effect = FalcoRulesValidationError("bad.yaml", "syntax error")
+        mock_service_class.return_value = mock_service
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_in = ops.testing.State(
+            config={"custom-config-repository": "git+ssh://git@github.com/owner/repo.git"}
+        )
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        assert state_out.unit_status == ops.testing.BlockedStatus("Invalid rules file bad.yaml")
+        mock_service.check_active.assert_not_called()
+
+    @patch("charm.FalcoService")
+    def test_config_changed_with_costly_rule(
+        self, mock_service_class, mock_charm_dir, mock_falco_layout
+    ):
+        """Test config_changed with a custom rule estimated to cost more than allowed."""
+        mock_service = mock_service_class.return_value
+        mock_service.configure.side_effect = FalcoRulesCostError("Curl", 1200)
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_in = ops.testing.State(
+            config={
+                "custom-config-repository": "git+ssh://git@github.com/owner/repo.git",
+                "rules-max-cost": 1000,
+            }
+        )
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        assert state_out.unit_status == ops.testing.BlockedStatus(
+            "Rule Curl too costly, estimated 1200"
+        )
+
+    @patch("charm.FalcoCustomSetting")
+    @patch("charm.FalcoService")
+    def test_analyze_rules_action(
+        self,
+        mock_service_class,
+        mock_setting_class,
+        mock_charm_dir,
+        mock_falco_layout,
+        machine_owner,
+    ):
+        """Test the analyze-rules action reports the estimated costs of the active custom rules."""
+        costs = [
+            RuleCost(rule="Curl", cost=1200, findings=["expensive operator contains on x"]),
+            RuleCost(rule="Shell", cost=10, event_types=2),
+        ]
+        mock_setting_class.return_value.rules_cost.return_value = costs
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        context.run(context.on.action("analyze-rules"), ops.testing.State())
+
+        assert context.action_results == {
+            "max-cost": 1200,
+            "rules": json.dumps([cost.model_dump() for cost in costs], indent=2),
+        }
+
+    @patch("charm.FalcoService")
+    def test_analyze_rules_action_passive(
+        self, mock_service_class, mock_charm_dir, mock_falco_layout
+    ):
+        """Test the analyze-rules action fails on a passive unit."""
+        MachineOwnership("other/0", mock_charm_dir).claim()
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        with pytest.raises(ops.testing.ActionFailed, match="Passive, Falco owned by other/0"):
+            context.run(context.on.action("analyze-rules"), ops.testing.State())
+
+    @pytest.mark.parametrize("stepped", [True, False])
+    @patch("charm.OutputsMonitor")
+    @patch("charm.EngineTuner")
+    @patch("charm.FalcoService")
+    def test_update_status_steps_buffer_size(
+        self,
+        mock_service_class,
+        mock_tuner_class,
+        mock_monitor_class,
+        stepped,
+        mock_charm_dir,
+        mock_falco_layout,
+        machine_owner,
+    ):
+        """Test update_status reconciles only when the ring buffer size preset is stepped."""
+        mock_service = MagicMock()
+        mock_service_class.return_value = mock_service
+        mock_tuner_class.return_value.step.return_value = stepped
+        mock_monitor_class.return_value.sample.return_value = 0
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        context.run(context.on.update_status(), ops.testing.State())
+
+        mock_tuner_class.return_value.step.assert_called_once()
+        assert mock_service.configure.called == stepped
+
+    @patch("charm.OutputsMonitor")
+    @patch("charm.EngineTuner")
+    @patch("charm.FalcoService")
+    def test_update_status_warns_on_saturated_outputs(
+        self,
+        mock_service_class,
+        mock_tuner_class,
+        mock_monitor_class,
+        mock_charm_dir,
+        mock_falco_layout,
+        machine_owner,
+    ):
+        """Test update_status warns while Falco drops alerts, and clears the warning after."""
+        mock_tuner_class.return_value.step.return_value = False
+        mock_monitor_class.return_value.sample.return_value = 12
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_out = context.run(
+            context.on.update_status(), ops.testing.State(unit_status=ops.testing.ActiveStatus())
+        )
+
+        assert state_out.unit_status == ops.testing.WaitingStatus(
+            "Falco outputs saturated, 12 alerts dropped"
+        )
+
+        mock_monitor_class.return_value.sample.return_value = 0
+        state_out = context.run(context.on.update_status(), state_out)
+
+        assert state_out.unit_status == ops.testing.ActiveStatus()
+
+    @patch("charm.OutputsMonitor")
+    @patch("charm.EngineTuner")
+    @patch("charm.FalcoService")
+    def test_update_status_keeps_blocked_status(
+        self,
+        mock_service_class,
+        mock_tuner_class,
+        mock_monitor_class,
+        mock_charm_dir,
+        mock_falco_layout,
+        machine_owner,
+    ):
+        """Test the saturation warning does not hide a blocked status."""
+        mock_tuner_class.return_value.step.return_value = False
+        mock_monitor_class.return_value.sample.return_value = 12
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_in = ops.testing.State(unit_status=ops.testing.BlockedStatus("Invalid charm config"))
+        state_out = context.run(context.on.update_status(), state_in)
+
+        assert state_out.unit_status == ops.testing.BlockedStatus("Invalid charm config")
+
 
 class TestCharmWithHttpEndpointRelation:
     """Test Charm behavior with HTTP endpoint relation."""
@@ -332,3 +712,36 @@ class TestCharmWithHttpEndpointRelation:
             # Verify charm does notretrieved http endpoint data from relation
             assert charm_state.http_output == {}
             assert state_out.unit_status == ops.testing.ActiveStatus()
+
+    @patch("charm.FalcoService")
+    def test_charm_publishes_topology(
+        self, mock_service_class, mock_charm_dir, mock_falco_layout, http_endpoint_relation
+    ):
+        """Test the leader publishes the Juju topology only when the events do not carry it.
+
+        Arrange: Set up testing context with the topology enrichment on the relation side.
+        Act: Run config changed event, then switch the topology enrichment back to the events.
+        Assert: The topology is published in the relation, and then withdrawn.
+        """
+        mock_service_class.return_value.check_active.return_value = True
+
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state_in = ops.testing.State(
+            leader=True,
+            config={"topology-enrichment": "relation"},
+            relations=[http_endpoint_relation],
+        )
+
+        with context(context.on.config_changed(), state_in) as mgr:
+            state_out = mgr.run()
+            relation = mgr.charm.model.get_relation("http-endpoint")
+            assert relation is not None
+            topology = relation.load(HttpEndpointTopology, mgr.charm.app)
+            assert topology.application == "falco"
+
+        state_in = dataclasses.replace(state_out, config={"topology-enrichment": "event"})
+        with context(context.on.config_changed(), state_in) as mgr:
+            mgr.run()
+            relation = mgr.charm.model.get_relation("http-endpoint")
+            assert relation is not None
+            assert not relation.data[mgr.charm.app]
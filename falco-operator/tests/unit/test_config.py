@@ -50,3 +50,97 @@ class TestCharmConfig:
         """Test initialization with invalid URL."""
         with pytest.raises(InvalidCharmConfigError):
             CharmConfig(custom_config_repository="git+ssh://github.com/owner/repo.git")
+
+    def test_init_with_host_key_refresh_interval(self):
+        """Test the host key refresh interval defaults to a day and rejects negative values."""
+        assert CharmConfig().custom_config_repo_host_key_refresh_interval == 86400
+        assert (
+            CharmConfig(
+                custom_config_repo_host_key_refresh_interval=0
+            ).custom_config_repo_host_key_refresh_interval
+            == 0
+        )
+        with pytest.raises(ValidationError):
+            CharmConfig(custom_config_repo_host_key_refresh_interval=-1)
+
+    def test_init_with_engine_overrides(self):
+        """Test the engine setting overrides are unset by default and validated when set."""
+        config = CharmConfig()
+        assert config.buf_size_preset is None
+        assert config.snaplen is None
+        assert CharmConfig(buf_size_preset=6, cpus_for_each_buffer=0).buf_size_preset == 6
+        with pytest.raises(ValidationError):
+            CharmConfig(buf_size_preset=11)
+        with pytest.raises(ValidationError):
+            CharmConfig(thread_table_size=0)
+
+    def test_init_with_buf_size_preset_bounds(self):
+        """Test the ring buffer size preset bounds default to all presets and must be ordered."""
+        config = CharmConfig()
+        assert (config.buf_size_preset_min, config.buf_size_preset_max) == (1, 10)
+        with pytest.raises(ValidationError):
+            CharmConfig(buf_size_preset_min=6, buf_size_preset_max=5)
+
+    def test_init_with_metrics(self):
+        """Test the metrics settings default to the hourly output rule and are validated."""
+        config = CharmConfig()
+        assert (config.metrics_interval, config.metrics_mode) == ("1h", "output-rule")
+        assert "kernel_event_counters_per_cpu" not in config.metrics_counters
+        assert CharmConfig(metrics_interval="1m30s").metrics_interval == "1m30s"
+        with pytest.raises(ValidationError):
+            CharmConfig(metrics_interval="hourly")
+        with pytest.raises(ValidationError):
+            CharmConfig(metrics_counters="rules_counters,syscall_counters")
+        with pytest.raises(ValidationError):
+            CharmConfig(metrics_mode="push")
+
+    def test_init_with_outputs(self):
+        """Test the output sinks default to http and syslog and are validated."""
+        assert CharmConfig().outputs == "http,syslog"
+        assert CharmConfig(outputs="http").outputs == "http"
+        with pytest.raises(ValidationError):
+            CharmConfig(outputs=" , ")
+        with pytest.raises(ValidationError):
+            CharmConfig(outputs="http,file")
+
+    def test_init_with_payload_profile(self):
+        """Test the payload profile defaults to the full payload and is validated."""
+        assert CharmConfig().payload_profile == "full"
+        assert CharmConfig(payload_profile="minimal").payload_profile == "minimal"
+        with pytest.raises(ValidationError):
+            CharmConfig(payload_profile="compact")
+
+    def test_init_with_outputs_queue(self):
+        """Test the outputs queue capacity and the minimum priority are validated."""
+        config = CharmConfig()
+        assert (config.outputs_queue_capacity, config.min_priority) == (0, "debug")
+        assert CharmConfig(outputs_queue_capacity=10000).outputs_queue_capacity == 10000
+        with pytest.raises(ValidationError):
+            CharmConfig(outputs_queue_capacity=-1)
+        with pytest.raises(ValidationError):
+            CharmConfig(min_priority="info")
+
+    def test_init_with_plugins(self):
+        """Test the plugins default to all the plugins and are validated."""
+        assert CharmConfig().plugins == "json,k8saudit,container"
+        assert CharmConfig(plugins="auto").plugins == "auto"
+        assert CharmConfig(plugins="container").plugins == "container"
+        assert CharmConfig(plugins="").plugins == ""
+        with pytest.raises(ValidationError):
+            CharmConfig(plugins="container,cloudtrail")
+
+    def test_init_with_custom_config_distribution(self):
+        """Test the custom config repository is fetched by every unit by default."""
+        assert CharmConfig().custom_config_distribution == "unit"
+        assert CharmConfig(custom_config_distribution="leader").custom_config_distribution == (
+            "leader"
+        )
+        with pytest.raises(ValidationError):
+            CharmConfig(custom_config_distribution="relation")
+
+    def test_init_with_custom_config_rollout_steps(self):
+        """Test the staged rollout steps grow up to all the units."""
+        assert CharmConfig(custom_config_rollout_steps="5, 25,100").custom_config_rollout_steps
+        for steps in ("", "10,50", "50,10,100", "0,100", "10,10,100", "half,100"):
+            with pytest.raises(ValidationError):
+                CharmConfig(custom_config_rollout_steps=steps)
@@ -0,0 +1,69 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the charm hook metrics module."""
+
+from unittest.mock import patch
+
+import pytest
+
+from metrics import DURATION_BUCKETS, METRICS_FILE_NAME, HookMetrics
+
+
+class TestHookMetrics:
+    """Test HookMetrics class."""
+
+    @patch("metrics.time.monotonic")
+    def test_span_records_duration(self, mock_monotonic):
+        """Test a span records the duration of the phase, even when it fails."""
+        mock_monotonic.side_effect = [10.0, 10.5, 20.0, 23.0]
+        metrics = HookMetrics()
+
+        with metrics.span("git_sync"):
+            pass
+        with pytest.raises(RuntimeError), metrics.span("restart"):
+            raise RuntimeError("failed")
+
+        assert metrics.durations == [("git_sync", 0.5), ("restart", 3.0)]
+
+    def test_export_without_state_dir(self):
+        """Test exporting without a state directory keeps the durations in memory only."""
+        metrics = HookMetrics()
+        with metrics.span("sync"):
+            pass
+
+        metrics.export()
+
+        assert metrics.metrics_dir is None
+
+    @patch("metrics.time.monotonic")
+    def test_export_accumulates_histograms(self, mock_monotonic, tmp_path):
+        """Test exported histograms accumulate the durations of successive hooks."""
+        mock_monotonic.side_effect = [0.0, 0.2, 0.0, 40.0]
+        for _ in range(2):
+            metrics = HookMetrics(tmp_path)
+            with metrics.span("reconcile"):
+                pass
+            metrics.export({"restarted": 1, "skipped": 1})
+
+        content = (tmp_path / "metrics" / METRICS_FILE_NAME).read_text()
+        name = "falco_charm_hook_phase_duration_seconds"
+        assert "# TYPE falco_charm_hook_phase_duration_seconds histogram" in content
+        assert f'{name}_bucket{{phase="reconcile",le="0.25"}} 1' in content
+        assert f'{name}_bucket{{phase="reconcile",le="60.0"}} 2' in content
+        assert f'{name}_bucket{{phase="reconcile",le="+Inf"}} 2' in content
+        assert f'{name}_count{{phase="reconcile"}} 2' in content
+        assert f'{name}_sum{{phase="reconcile"}} 40.2' in content
+        assert 'falco_charm_reconcile_total{outcome="restarted"} 1' in content
+        assert len([line for line in content.splitlines() if "_bucket" in line]) == (
+            len(DURATION_BUCKETS) + 1
+        )
+
+    def test_export_error(self, tmp_path):
+        """Test failing to export the metrics does not raise."""
+        metrics = HookMetrics(tmp_path)
+        with metrics.span("reconcile"):
+            pass
+
+        with patch("metrics.write_file_atomic", side_effect=PermissionError("denied")):
+            metrics.export()
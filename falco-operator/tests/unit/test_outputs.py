@@ -0,0 +1,35 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the Falco outputs monitoring module."""
+
+from unittest.mock import patch
+
+from outputs import OUTPUTS_DROPS_METRIC, OutputsMonitor
+
+
+class TestOutputsMonitor:
+    """Test OutputsMonitor class."""
+
+    def test_sample_counts_drops_between_samples(self, tmp_path):
+        """Test the drops are counted from the previous sample, across Falco restarts."""
+        monitor = OutputsMonitor(tmp_path, 8765)
+
+        with patch("outputs.scrape_counters") as mock_scrape:
+            mock_scrape.return_value = {OUTPUTS_DROPS_METRIC: 10.0}
+            assert monitor.sample() == 0
+            mock_scrape.return_value = {OUTPUTS_DROPS_METRIC: 10.0}
+            assert monitor.sample() == 0
+            mock_scrape.return_value = {OUTPUTS_DROPS_METRIC: 25.0}
+            assert monitor.sample() == 15
+            mock_scrape.return_value = {OUTPUTS_DROPS_METRIC: 4.0}
+            assert monitor.sample() == 4
+
+    def test_sample_without_metrics(self, tmp_path):
+        """Test no drops are reported when the Falco metrics are not available."""
+        monitor = OutputsMonitor(tmp_path, 8765)
+
+        with patch("outputs.scrape_counters", return_value={}):
+            assert monitor.sample() == 0
+
+        assert not (tmp_path / OutputsMonitor.file_name).exists()
@@ -0,0 +1,84 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the Falco machine ownership module."""
+
+from ownership import MachineOwnership
+
+
+class TestMachineOwnership:
+    """Test MachineOwnership class."""
+
+    def test_claim_single_owner(self, tmp_path):
+        """Test the first unit claiming the Falco service owns it, and the others are passive."""
+        first = MachineOwnership("falco/0", tmp_path)
+        second = MachineOwnership("falco-b/0", tmp_path)
+
+        with first.lock():
+            assert first.claim()
+        with second.lock():
+            assert not second.claim()
+
+        assert first.owner() == second.owner() == "falco/0"
+
+    def test_release_hands_over(self, tmp_path):
+        """Test a passive unit claims the Falco service once the owner releases it."""
+        first = MachineOwnership("falco/0", tmp_path)
+        second = MachineOwnership("falco-b/0", tmp_path)
+        first.claim()
+
+        second.release()
+        assert first.owner() == "falco/0"
+        first.release()
+
+        assert first.owner() is None
+        assert second.claim()
+        assert first.owner() == "falco-b/0"
+
+    def test_claim_from_removed_owner(self, tmp_path):
+        """Test the Falco service of a unit removed without its remove hook is taken over."""
+        removed_charm_dir = tmp_path / "unit-falco-0"
+        removed_charm_dir.mkdir()
+        MachineOwnership("falco/0", removed_charm_dir).claim()
+        removed_charm_dir.rmdir()
+
+        ownership = MachineOwnership("falco-b/0", tmp_path)
+
+        assert ownership.owner() is None
+        assert ownership.claim()
+
+    def test_contributions(self, tmp_path):
+        """Test the labels contributed by the live units, until they withdraw them."""
+        removed_charm_dir = tmp_path / "unit-falco-c-0"
+        removed_charm_dir.mkdir()
+        first = MachineOwnership("falco/0", tmp_path)
+        second = MachineOwnership("falco-b/0", tmp_path)
+        removed = MachineOwnership("falco-c/0", removed_charm_dir)
+        first.contribute({"application": "falco"})
+        second.contribute({"application": "falco-b"})
+        removed.contribute({"application": "falco-c"})
+        removed_charm_dir.rmdir()
+
+        assert first.contributions() == {
+            "falco/0": {"application": "falco"},
+            "falco-b/0": {"application": "falco-b"},
+        }
+
+        second.withdraw()
+        assert first.contributions() == {"falco/0": {"application": "falco"}}
+
+    def test_stale_contributions(self, tmp_path):
+        """Test the owner applies the contributions again once another unit changes them."""
+        owner = MachineOwnership("falco/0", tmp_path)
+        passive = MachineOwnership("falco-b/0", tmp_path)
+        owner.contribute({"application": "falco"})
+        owner.claim()
+        assert not owner.stale()
+
+        passive.contribute({"application": "falco-b"})
+        assert passive.stale()
+
+        owner.applied(owner.contributions())
+        assert not passive.stale()
+        passive.withdraw()
+        assert owner.stale()
@@ -0,0 +1,168 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the staged rollout module."""
+
+from unittest.mock import patch
+
+import pytest
+
+from rollout import (
+    COMPLETE,
+    CPU_METRIC,
+    HEALTHY,
+    PASSIVE,
+    PENDING,
+    REGRESSED,
+    ROLLED_BACK,
+    Rollout,
+    RolloutMonitor,
+    RolloutPlan,
+    advance,
+    source_revision,
+)
+from tuning import DROPS_METRIC, EVENTS_METRIC
+
+UNITS = [f"falco/{number}" for number in (0, 1, 2, 3, 10)]
+
+
+class TestRolloutPlan:
+    """Test the staged rollout admission of the units."""
+
+    def test_first_step(self):
+        """Test the units of the lowest numbers are the canaries."""
+        plan = RolloutPlan(unit="falco/0", units=UNITS, steps=[10, 50, 100])
+
+        assert [plan.first_step(unit) for unit in UNITS] == [0, 1, 1, 2, 2]
+
+    def test_admits(self):
+        """Test a unit applies a revision once the rollout reaches it."""
+        plan = RolloutPlan(unit="falco/3", units=UNITS, rollout=Rollout(revision="a", step=1))
+
+        assert not plan.admits("a")
+        plan.rollout = Rollout(revision="a", step=2)
+        assert plan.admits("a")
+        assert not plan.admits("b")
+        plan.rollout = Rollout(revision="a", step=2, status=ROLLED_BACK)
+        assert not plan.admits("a")
+        plan.rollout = Rollout(revision="a", status=COMPLETE)
+        assert plan.admits("a")
+
+
+class TestAdvance:
+    """Test the leader advances the rollout from the unit health reports."""
+
+    def test_new_revision_starts_rollout(self):
+        """Test a new revision starts a rollout at its first step."""
+        plan = RolloutPlan(unit="falco/0", units=UNITS, rollout=Rollout(revision="a", step=2))
+
+        assert advance(plan, "b", {}) == Rollout(revision="b")
+
+    @pytest.mark.parametrize(
+        "reports, expected",
+        [
+            pytest.param({}, Rollout(revision="a"), id="no report"),
+            pytest.param({"falco/0": ("a", PENDING)}, Rollout(revision="a"), id="pending"),
+            pytest.param({"falco/0": ("", HEALTHY)}, Rollout(revision="a"), id="old revision"),
+            pytest.param({"falco/0": ("a", HEALTHY)}, Rollout(revision="a", step=1), id="healthy"),
+            pytest.param({"falco/0": ("", PASSIVE)}, Rollout(revision="a", step=1), id="passive"),
+            pytest.param(
+                {"falco/0": ("a", REGRESSED)},
+                Rollout(revision="a", status=ROLLED_BACK),
+                id="regressed",
+            ),
+        ],
+    )
+    def test_first_step(self, reports, expected):
+        """Test the canary step is widened once healthy, and rolled back once regressed."""
+        plan = RolloutPlan(unit="falco/0", units=UNITS, rollout=Rollout(revision="a"))
+
+        assert advance(plan, "a", reports) == expected
+
+    def test_last_step_completes(self):
+        """Test the rollout completes once all the units are healthy."""
+        plan = RolloutPlan(unit="falco/0", units=UNITS, rollout=Rollout(revision="a", step=2))
+        reports = dict.fromkeys(UNITS, ("a", HEALTHY))
+
+        assert advance(plan, "a", reports) == Rollout(revision="a", step=2, status=COMPLETE)
+
+        plan.rollout = Rollout(revision="a", step=2, status=COMPLETE)
+        assert advance(plan, "a", {"falco/0": ("a", REGRESSED)}) == plan.rollout
+
+
+def test_source_revision(tmp_path):
+    """Test the revision only depends on the custom settings files."""
+    checkout = tmp_path / "checkout"
+    (checkout / "rules.d").mkdir(parents=True)
+    (checkout / "rules.d/a.yaml").write_text("- list: a")
+    bundle = tmp_path / "bundle"
+    (bundle / "rules.d").mkdir(parents=True)
+    (bundle / "rules.d/a.yaml").write_text("- list: a")
+    (bundle / ".bundle-digest").write_text("digest")
+    keys = ("rules.d", "config.override.d")
+
+    assert source_revision(checkout, keys) == source_revision(bundle, keys)
+
+    (bundle / "rules.d/a.yaml").write_text("- list: b")
+    assert source_revision(checkout, keys) != source_revision(bundle, keys)
+
+
+class TestRolloutMonitor:
+    """Test the Falco health monitor of the staged rollout."""
+
+    @pytest.fixture
+    def plan(self):
+        """Staged rollout settings without soak interval."""
+        return RolloutPlan(unit="falco/0", units=["falco/0"], soak_interval=0)
+
+    @staticmethod
+    def _sample(monitor, revision, cpu, events, drops):
+        """Sample the monitor with the given Falco metrics."""
+        counters = {CPU_METRIC: cpu, EVENTS_METRIC: events, DROPS_METRIC: drops}
+        with patch("rollout.scrape_counters", return_value=counters):
+            monitor.sample(revision)
+
+    def test_health_healthy(self, tmp_path, plan):
+        """Test a revision keeping the Falco CPU usage and drops of its baseline is healthy."""
+        monitor = RolloutMonitor(tmp_path, 8765)
+        self._sample(monitor, "a", 0.10, 1000, 0)
+        self._sample(monitor, "a", 0.10, 2000, 1)
+
+        assert monitor.health("b", plan) == PENDING
+
+        self._sample(monitor, "b", 0.12, 3000, 1)
+        self._sample(monitor, "b", 0.12, 4000, 2)
+        assert monitor.health("b", plan) == HEALTHY
+
+    def test_health_pending_during_soak_interval(self, tmp_path, plan):
+        """Test a revision is pending until it has been sampled for the soak interval."""
+        monitor = RolloutMonitor(tmp_path, 8765)
+        self._sample(monitor, "b", 0.5, 1000, 500)
+
+        assert monitor.health("b", plan.model_copy(update={"soak_interval": 3600})) == PENDING
+
+    def test_health_regressed_cpu(self, tmp_path, plan):
+        """Test a revision growing the Falco CPU usage above the allowed share regressed."""
+        monitor = RolloutMonitor(tmp_path, 8765)
+        self._sample(monitor, "a", 0.10, 1000, 0)
+        self._sample(monitor, "b", 0.20, 2000, 0)
+
+        assert monitor.health("b", plan) == REGRESSED
+
+    def test_health_regressed_drops(self, tmp_path, plan):
+        """Test a revision growing the Falco drop ratio above the allowed ratio regressed."""
+        monitor = RolloutMonitor(tmp_path, 8765)
+        self._sample(monitor, "a", 0.10, 1000, 0)
+        self._sample(monitor, "a", 0.10, 2000, 0)
+        self._sample(monitor, "b", 0.10, 3000, 10)
+
+        assert monitor.health("b", plan) == REGRESSED
+
+    def test_sample_counters_restart(self, tmp_path, plan):
+        """Test the counters restarting with Falco are not counted as negative increments."""
+        monitor = RolloutMonitor(tmp_path, 8765)
+        self._sample(monitor, "b", 0.10, 5000, 100)
+        self._sample(monitor, "b", 0.10, 1000, 0)
+        self._sample(monitor, "b", 0.10, 2000, 0)
+
+        assert monitor.health("b", plan) == HEALTHY
@@ -0,0 +1,245 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the Falco rules analysis module."""
+
+import pytest
+
+from rules import (
+    UNRESTRICTED_EVENT_TYPES,
+    Ruleset,
+    RulesParseError,
+    analyze_rules_cost,
+    derive_base_syscalls,
+    parse_condition,
+    rules_files,
+)
+
+RULES = """
+- list: shell_binaries
+  items: [bash, sh, zsh]
+- list: open_syscalls
+  items: [open, openat]
+- macro: spawned_process
+  condition: (evt.type in (execve, execveat) and evt.dir=<)
+- macro: open_write
+  condition: (evt.type in (open_syscalls) and evt.is_open_write=true and fd.num>=0)
+- rule: Run shell
+  desc: A shell is spawned
+  condition: spawned_process and proc.name in (shell_binaries)
+  output: Shell spawned (user=%user.name)
+  priority: WARNING
+- rule: Write below etc
+  desc: A file below /etc is opened for writing
+  condition: open_write and fd.name startswith "/etc/"
+  output: File below /etc opened for writing (file=%fd.name)
+  priority: ERROR
+- rule: K8s audit
+  desc: Not a syscall rule
+  condition: ka.verb = create
+  output: Created
+  priority: INFO
+  source: k8s_audit
+"""
+
+
+class TestParseCondition:
+    """Test parse_condition function."""
+
+    def test_comparisons(self):
+        """Test the boolean structure, comparisons and macro references are parsed."""
+        assert parse_condition("spawned_process and not proc.name in (bash, 'sh')") == (
+            "and",
+            [("macro", "spawned_process"), ("not", ("cmp", "proc.name", "in", ["bash", "sh"]))],
+        )
+
+    def test_operators_without_spaces(self):
+        """Test operators are split from their operands."""
+        assert parse_condition("evt.dir=< or fd.num>=0") == (
+            "or",
+            [("cmp", "evt.dir", "=", ["<"]), ("cmp", "fd.num", ">=", ["0"])],
+        )
+
+    def test_transformers_and_field_arguments(self):
+        """Test transformers and field arguments are kept in the compared fields."""
+        assert parse_condition("tolower(proc.aname[2]) = val(proc.name) and fd.name exists") == (
+            "and",
+            [
+                ("cmp", "tolower(proc.aname[2])", "=", ["val(proc.name)"]),
+                ("cmp", "fd.name", "exists", []),
+            ],
+        )
+
+    @pytest.mark.parametrize("condition", ["", "evt.type in (open", "and proc.name = a"])
+    def test_invalid(self, condition):
+        """Test invalid conditions raise RulesParseError."""
+        with pytest.raises(RulesParseError):
+            parse_condition(condition)
+
+
+class TestRuleset:
+    """Test Ruleset class."""
+
+    @pytest.mark.parametrize(
+        "condition, expected",
+        [
+            pytest.param("evt.type = open", {"open"}, id="equal"),
+            pytest.param(
+                "evt.type in (open_syscalls, close)", {"open", "openat", "close"}, id="in"
+            ),
+            pytest.param("open_write and proc.name = a", {"open", "openat"}, id="macro"),
+            pytest.param(
+                "(evt.type = open or spawned_process)", {"open", "execve", "execveat"}, id="or"
+            ),
+            pytest.param("evt.type = open and evt.type = openat", set(), id="and"),
+            pytest.param("evt.type != open", None, id="not equal"),
+            pytest.param("not evt.type = open", None, id="not"),
+            pytest.param("evt.type = open or proc.name = a", None, id="or unrestricted"),
+            pytest.param("unknown_macro", None, id="unknown macro"),
+        ],
+    )
+    def test_event_types(self, tmp_path, condition, expected):
+        """Test the event types of conditions."""
+        rules_file = tmp_path / "rules.yaml"
+        rules_file.write_text(RULES)
+        ruleset = Ruleset()
+        ruleset.load(rules_file)
+
+        event_types = ruleset.event_types(parse_condition(condition))
+
+        assert event_types == (None if expected is None else frozenset(expected))
+
+    def test_appends_and_overrides(self, tmp_path):
+        """Test appends and overrides of lists, macros and rules are applied."""
+        (tmp_path / "a.yaml").write_text(RULES)
+        (tmp_path / "b.yaml").write_text(
+            "- list: open_syscalls\n"
+            "  items: [openat2]\n"
+            "  override:\n"
+            "    items: append\n"
+            "- macro: spawned_process\n"
+            "  condition: or evt.type = clone\n"
+            "  append: true\n"
+            "- rule: Run shell\n"
+            "  enabled: false\n"
+            "  override:\n"
+            "    enabled: replace\n"
+        )
+        ruleset = Ruleset()
+        ruleset.load(tmp_path / "a.yaml")
+        ruleset.load(tmp_path / "b.yaml")
+
+        assert ruleset.lists["open_syscalls"] == ["open", "openat", "openat2"]
+        assert ruleset.event_types(("macro", "spawned_process")) == {"execve", "execveat", "clone"}
+        assert ruleset.rules["Run shell"]["enabled"] is False
+        assert "spawned_process" in ruleset.rules["Run shell"]["condition"]
+
+
+class TestDeriveBaseSyscalls:
+    """Test derive_base_syscalls function."""
+
+    def test_derive(self, tmp_path):
+        """Test the syscalls of the enabled syscall rules are derived, in loading order."""
+        (tmp_path / "rules.yaml").write_text(RULES)
+        custom_rules_dir = tmp_path / "rules.d"
+        custom_rules_dir.mkdir()
+        (custom_rules_dir / "a.yaml").write_text(
+            "- rule: Exit\n  condition: evt.type = procexit\n"
+            "- rule: Write below etc\n  enabled: false\n"
+        )
+
+        assert derive_base_syscalls([tmp_path / "rules.yaml", custom_rules_dir]) == [
+            "execve",
+            "execveat",
+        ]
+
+    def test_derive_loaded_files(self, tmp_path):
+        """Test the syscalls of every file Falco loads are derived, whatever its extension."""
+        (tmp_path / "a.yaml").write_text("- rule: Open\n  condition: evt.type = open\n")
+        (tmp_path / "b.yml").write_text("- rule: Connect\n  condition: evt.type = connect\n")
+        (tmp_path / "nested").mkdir()
+        (tmp_path / "nested/c.yaml").write_text("- rule: Bind\n  condition: evt.type = bind\n")
+
+        assert rules_files(tmp_path) == [tmp_path / "a.yaml", tmp_path / "b.yml"]
+        assert derive_base_syscalls([tmp_path]) == ["connect", "open"]
+
+    def test_unrestricted_rule(self, tmp_path):
+        """Test all the syscalls are needed when a rule does not restrict its event types."""
+        (tmp_path / "rules.yaml").write_text(RULES + "- rule: Any\n  condition: proc.name = nc\n")
+
+        assert derive_base_syscalls([tmp_path / "rules.yaml"]) is None
+
+    def test_unparsable_rule(self, tmp_path):
+        """Test all the syscalls are needed when a rule condition cannot be parsed."""
+        (tmp_path / "rules.yaml").write_text(
+            RULES + "- rule: Broken\n  condition: evt.type in (open\n"
+        )
+
+        assert derive_base_syscalls([tmp_path / "rules.yaml"]) is None
+
+    def test_no_syscall_rules(self, tmp_path):
+        """Test all the syscalls are captured without syscall rules."""
+        assert derive_base_syscalls([tmp_path]) is None
+
+
+class TestAnalyzeRulesCost:
+    """Test analyze_rules_cost function."""
+
+    def test_analyze_loaded_files(self, tmp_path):
+        """Test the rules of every file Falco loads are analyzed, whatever its extension."""
+        (tmp_path / "a.yaml").write_text("- rule: Open\n  condition: evt.type = open\n")
+        (tmp_path / "b.yml").write_text("- rule: Connect\n  condition: evt.type = connect\n")
+
+        costs = analyze_rules_cost([], [tmp_path])
+
+        assert sorted(cost.rule for cost in costs) == ["Connect", "Open"]
+
+    def test_analyze(self, tmp_path):
+        """Test only the custom rules are analyzed, the most costly first."""
+        (tmp_path / "rules.yaml").write_text(RULES)
+        custom_rules_dir = tmp_path / "rules.d"
+        custom_rules_dir.mkdir()
+        (custom_rules_dir / "a.yaml").write_text(
+            "- rule: Shell in etc\n"
+            "  condition: spawned_process and proc.name in (shell_binaries)"
+            " and fd.name startswith /etc\n"
+            "- rule: Curl\n  condition: proc.cmdline contains curl\n"
+            "- rule: Write below etc\n  enabled: false\n"
+        )
+
+        costs = analyze_rules_cost([tmp_path / "rules.yaml"], [custom_rules_dir])
+
+        assert [cost.model_dump() for cost in costs] == [
+            {
+                "rule": "Curl",
+                "cost": 4 * UNRESTRICTED_EVENT_TYPES,
+                "event_types": None,
+                "findings": [
+                    "no event type restriction, evaluated for every event",
+                    "expensive operator contains on proc.cmdline",
+                ],
+            },
+            {"rule": "Shell in etc", "cost": 10, "event_types": 2, "findings": []},
+        ]
+
+    def test_large_list(self, tmp_path):
+        """Test the lists of many items add to the cost, and are flagged."""
+        items = ", ".join(f"bin{i}" for i in range(250))
+        (tmp_path / "rules.yaml").write_text(
+            f"- list: many\n  items: [{items}]\n"
+            "- rule: Many\n  condition: evt.type = execve and proc.name in (many)\n"
+        )
+
+        (cost,) = analyze_rules_cost([], [tmp_path / "rules.yaml"])
+
+        assert cost.cost == 1 + 1 + 250 // 50
+        assert cost.findings == ["large list many of 250 items"]
+
+    def test_unparsable_rule(self, tmp_path):
+        """Test a rule whose condition cannot be parsed is reported without cost."""
+        (tmp_path / "rules.yaml").write_text("- rule: Broken\n  condition: evt.type in (open\n")
+
+        (cost,) = analyze_rules_cost([], [tmp_path / "rules.yaml"])
+
+        assert cost.cost is None
+        assert cost.findings[0].startswith("condition not analyzed")
@@ -5,28 +5,61 @@
 
 import os
 import subprocess
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
+import yaml
 from pydantic import AnyUrl
 
 import service
+from bundle import pack
+from metrics import HookMetrics
+from rollout import ROLLED_BACK, Rollout, RolloutPlan
 from service import (
-    CLONE_OUTPUT_DIR,
+    CHARM_METRICS_SERVICE_NAME,
     FALCO_CUSTOM_CONFIGS_KEY,
     FALCO_CUSTOM_RULES_KEY,
+    FALCO_MANAGED_CONFIG_FILE,
     FALCO_SERVICE_NAME,
+    MIRROR_SYNCED_REF,
+    CharmMetricsService,
+    FalcoAppliedState,
+    FalcoConfigFile,
     FalcoConfigurationError,
     FalcoCustomSetting,
+    FalcoFingerprint,
+    FalcoOverrideConfigFile,
+    FalcoRulesCostError,
+    FalcoRulesValidationError,
+    FalcoRulesValidator,
     FalcoService,
+    FalcoServiceFile,
     GitCloneError,
-    RsyncError,
     SshKeyScanError,
     SshKeyWriteError,
     Template,
     TemplateRenderError,
+    _plugin_options,
 )
-from state import CharmState
+from state import PAYLOAD_PROFILES, CharmState, FalcoMetrics, FalcoPayload
+from tuning import EngineTuning
+
+
+def _falco_service_with_layout(falco_layout):
+    """Create a Falco service whose managed files live in the given layout."""
+    mock_config = MagicMock()
+    mock_config.destination = falco_layout.config_file
+    mock_service_file = MagicMock()
+    mock_service_file.service_name = FALCO_SERVICE_NAME
+    mock_service_file.destination = falco_layout.home / "falco.service"
+    mock_custom_setting = MagicMock()
+    mock_custom_setting.digest.return_value = ""
+    applied_state = FalcoAppliedState(falco_layout)
+    service = FalcoService(
+        mock_config, MagicMock(), mock_service_file, mock_custom_setting, applied_state
+    )
+    return service, applied_state
 
 
 class TestTemplate:
@@ -51,6 +84,21 @@ class TestTemplate:
         assert dest.read_text() == "rendered content"
         mock_template.render.assert_called_once_with(context)
 
+    @patch("service.Environment")
+    def test_install_unchanged(self, mock_env_class, tmp_path):
+        """Test installing an unchanged template leaves the file untouched."""
+        mock_template = MagicMock()
+        mock_template.render.return_value = "rendered content"
+        mock_env_class.return_value.get_template.return_value = mock_template
+
+        dest = tmp_path / "output.txt"
+        template = Template("test.j2", dest, {})
+        template.install()
+        inode = dest.stat().st_ino
+        template.install()
+
+        assert dest.stat().st_ino == inode
+
     @patch("service.Environment")
     def test_remove(self, mock_env_class, tmp_path):
         """Test template removal."""
@@ -107,8 +155,8 @@ class TestFalcoCustomSetting:
             custom_setting = FalcoCustomSetting(mock_falco_layout)
 
             # Remove directories to test creation
-            mock_falco_layout.rules_dir.rmdir()
-            mock_falco_layout.configs_dir.rmdir()
+            mock_falco_layout.rules_dir.resolve().rmdir()
+            mock_falco_layout.configs_dir.resolve().rmdir()
 
             custom_setting.install()
 
@@ -117,24 +165,27 @@ class TestFalcoCustomSetting:
             assert test_ssh_dir.exists()
 
     def test_remove_deletes_yaml_files(self, mock_falco_layout):
-        """Test FalcoCustomSetting remove deletes yaml files."""
+        """Test FalcoCustomSetting remove deletes yaml files and the rules files Falco loads."""
         custom_setting = FalcoCustomSetting(mock_falco_layout)
 
         # Create some test files
         rule_file = mock_falco_layout.rules_dir / "test_rule.yaml"
+        other_rule_file = mock_falco_layout.rules_dir / "test.yml"
         config_file = mock_falco_layout.configs_dir / "test_config.yaml"
-        other_file = mock_falco_layout.rules_dir / "test.txt"
+        other_file = mock_falco_layout.configs_dir / "test.txt"
 
         rule_file.write_text("test rule")
+        other_rule_file.write_text("test rule")
         config_file.write_text("test config")
         other_file.write_text("other")
 
         custom_setting.remove()
 
-        # YAML files should be deleted
+        # YAML files and the files Falco loads as rules should be deleted
         assert not rule_file.exists()
+        assert not other_rule_file.exists()
         assert not config_file.exists()
-        # Non-YAML files should remain
+        # Other non-YAML files should remain
         assert other_file.exists()
 
     def test_configure_no_repo(self, mock_falco_layout):
@@ -152,25 +203,31 @@ class TestFalcoCustomSetting:
         assert not rule_file.exists()
 
     @patch("service.subprocess")
-    def test_configure_with_repo(self, mock_subprocess, mock_falco_layout):
+    def test_configure_with_repo(
+        self, mock_subprocess, mock_falco_layout, mock_git_dirs, tmp_path
+    ):
         """Test configure with custom config repo."""
         custom_setting = FalcoCustomSetting(mock_falco_layout)
+        _, clone_dir = mock_git_dirs
 
-        # Setup mock for git commands to simulate repo already cloned
+        # Setup mock for git commands to simulate repo cloned at an outdated commit
         def check_output_side_effect(cmd, *args, **kwargs):
             if "config" in cmd and "--get" in cmd:
                 return b"git+ssh://git@github.com/user/repo.git\n"
-            elif "describe" in cmd:
-                return b"v1.0\n"
+            elif "ls-remote" in cmd:
+                return b"1111111111111111111111111111111111111111\trefs/tags/v1.0\n"
+            elif "rev-parse" in cmd:
+                return b"2222222222222222222222222222222222222222\n"
             return b""
 
         mock_subprocess.check_output.side_effect = check_output_side_effect
 
-        # Create mock directories for rsync
-        clone_rules_dir = CLONE_OUTPUT_DIR / FALCO_CUSTOM_RULES_KEY
-        clone_configs_dir = CLONE_OUTPUT_DIR / FALCO_CUSTOM_CONFIGS_KEY
+        # Create an existing worktree holding the custom settings
+        clone_rules_dir = clone_dir / FALCO_CUSTOM_RULES_KEY
+        clone_configs_dir = clone_dir / FALCO_CUSTOM_CONFIGS_KEY
         clone_rules_dir.mkdir(parents=True, exist_ok=True)
         clone_configs_dir.mkdir(parents=True, exist_ok=True)
+        (clone_dir / ".git").write_text("gitdir: mirror")
 
         # Create test files in clone directory
         (clone_rules_dir / "custom.yaml").write_text("custom rule")
@@ -181,10 +238,143 @@ class TestFalcoCustomSetting:
             custom_config_repo_ref="v1.0",
         )
 
-        custom_setting.configure(charm_state)
+        with patch("service.KNOWN_HOSTS_FILE", tmp_path / "known_hosts"):
+            changes = custom_setting.configure(charm_state)
+
+        # Verify the repository was fetched and the custom settings were synced
+        commands = [call[0][0] for call in mock_subprocess.run.call_args_list]
+        assert any("fetch" in command for command in commands)
+        assert changes.added == ["custom.yaml", "custom.yaml"]
+        assert (mock_falco_layout.rules_dir / "custom.yaml").read_text() == "custom rule"
+        assert (mock_falco_layout.configs_dir / "custom.yaml").read_text() == "custom config"
+
+    @patch("service.subprocess")
+    def test_configure_with_repo_up_to_date(
+        self, mock_subprocess, mock_falco_layout, mock_git_dirs, tmp_path
+    ):
+        """Test configure skips fetching when the remote ref has not moved."""
+        custom_setting = FalcoCustomSetting(mock_falco_layout)
+
+        def check_output_side_effect(cmd, *args, **kwargs):
+            if "config" in cmd and "--get" in cmd:
+                return b"git+ssh://git@github.com/user/repo.git\n"
+            elif "ls-remote" in cmd:
+                return b"1111111111111111111111111111111111111111\trefs/heads/main\n"
+            elif "rev-parse" in cmd:
+                return b"1111111111111111111111111111111111111111\n"
+            return b""
+
+        mock_subprocess.check_output.side_effect = check_output_side_effect
+
+        charm_state = CharmState(
+            custom_config_repo=AnyUrl("git+ssh://git@github.com/user/repo.git"),
+            custom_config_repo_ref="main",
+        )
+        with patch("service.KNOWN_HOSTS_FILE", tmp_path / "known_hosts"):
+            custom_setting.configure(charm_state)
+
+        mock_subprocess.run.assert_not_called()
+
+    @patch("service._git_sync")
+    def test_configure_from_bundle(
+        self, mock_git_sync, mock_falco_layout, mock_git_dirs, tmp_path, monkeypatch
+    ):
+        """Test a unit applies the bundle of the leader instead of fetching the repository."""
+        monkeypatch.setattr("service.BUNDLE_OUTPUT_DIR", tmp_path / "bundle")
+        source = tmp_path / "source"
+        (source / FALCO_CUSTOM_RULES_KEY).mkdir(parents=True)
+        (source / FALCO_CUSTOM_RULES_KEY / "a.yaml").write_text("- list: a")
+        custom_setting = FalcoCustomSetting(mock_falco_layout)
+        charm_state = CharmState(
+            custom_config_repo=AnyUrl("git+ssh://git@github.com/user/repo.git"),
+            fetch_custom_config=False,
+        )
+
+        assert not custom_setting.configure(charm_state)
+
+        charm_state.custom_config_bundle = pack(
+            source, (FALCO_CUSTOM_RULES_KEY, FALCO_CUSTOM_CONFIGS_KEY)
+        )
+        changes = custom_setting.configure(charm_state)
+
+        assert changes.added == ["a.yaml"]
+        assert (mock_falco_layout.rules_dir / "a.yaml").read_text() == "- list: a"
+        mock_git_sync.assert_not_called()
 
-        # Verify rsync was called
-        mock_subprocess.run.assert_called()
+    def test_bundle_packs_checkout(self, mock_falco_layout, mock_git_dirs):
+        """Test the leader bundles the custom settings of its checkout."""
+        _, clone_dir = mock_git_dirs
+        (clone_dir / FALCO_CUSTOM_RULES_KEY).mkdir(parents=True)
+        (clone_dir / FALCO_CUSTOM_RULES_KEY / "a.yaml").write_text("- list: a")
+
+        bundle = FalcoCustomSetting(mock_falco_layout).bundle()
+
+        assert bundle == pack(clone_dir, (FALCO_CUSTOM_RULES_KEY, FALCO_CUSTOM_CONFIGS_KEY))
+
+    @patch("service._git_sync")
+    def test_configure_staged_rollout(self, mock_git_sync, mock_falco_layout, mock_git_dirs):
+        """Test a revision is applied once the rollout reaches the unit, and rolled back."""
+        _, clone_dir = mock_git_dirs
+        (clone_dir / FALCO_CUSTOM_RULES_KEY).mkdir(parents=True)
+        (clone_dir / FALCO_CUSTOM_RULES_KEY / "a.yaml").write_text("- list: a")
+        custom_setting = FalcoCustomSetting(mock_falco_layout)
+        plan = RolloutPlan(unit="falco/1", units=["falco/0", "falco/1"], steps=[50, 100])
+        charm_state = CharmState(
+            custom_config_repo=AnyUrl("git+ssh://git@github.com/user/repo.git"),
+            custom_config_rollout=plan,
+        )
+        revision = custom_setting.revision(charm_state)
+
+        plan.rollout = Rollout(revision=revision)
+        assert not custom_setting.configure(charm_state)
+        assert not (mock_falco_layout.rules_dir / "a.yaml").exists()
+
+        plan.rollout = Rollout(revision=revision, step=1)
+        assert custom_setting.configure(charm_state).added == ["a.yaml"]
+        assert custom_setting.current_revision() == revision
+
+        plan.rollout = Rollout(revision=revision, step=1, status=ROLLED_BACK)
+        assert not custom_setting.configure(charm_state)
+        assert not (mock_falco_layout.rules_dir / "a.yaml").exists()
+        assert custom_setting.current_revision() is None
+
+    @patch("service._git_sync")
+    def test_configure_rejects_costly_rules(self, mock_git_sync, mock_falco_layout, mock_git_dirs):
+        """Test custom rules estimated to cost more than allowed are not applied."""
+        _, clone_dir = mock_git_dirs
+        (clone_dir / FALCO_CUSTOM_RULES_KEY).mkdir(parents=True)
+        (clone_dir / FALCO_CUSTOM_RULES_KEY / "a.yaml").write_text(
+            "- rule: Curl\n  condition: proc.cmdline contains curl\n"
+        )
+        custom_setting = FalcoCustomSetting(mock_falco_layout)
+        charm_state = CharmState(
+            custom_config_repo=AnyUrl("git+ssh://git@github.com/user/repo.git"),
+            rules_max_cost=1000,
+        )
+
+        with pytest.raises(FalcoRulesCostError) as exc_info:
+            custom_setting.configure(charm_state)
+
+        assert exc_info.value.rule == "Curl"
+        assert exc_info.value.cost == 1200
+        assert not (mock_falco_layout.rules_dir / "a.yaml").exists()
+
+        charm_state.rules_max_cost = 1200
+        assert custom_setting.configure(charm_state).added == ["a.yaml"]
+        assert custom_setting.rules_cost(mock_falco_layout.rules_dir)[0].cost == 1200
+
+    def test_rules_cost_loaded_rules_only(self, mock_falco_layout):
+        """Test the cost covers the rules Falco loads, not the unloaded default rules."""
+        (mock_falco_layout.default_rules_dir / "falco_rules.yaml").write_text(
+            "- rule: Default\n  condition: proc.name = bash\n"
+        )
+        (mock_falco_layout.rules_dir / "a.yaml").write_text(
+            "- rule: Shell\n  condition: evt.type = execve and proc.name = bash\n"
+        )
+
+        costs = FalcoCustomSetting(mock_falco_layout).rules_cost(mock_falco_layout.rules_dir)
+
+        assert [cost.rule for cost in costs] == ["Shell"]
 
 
 class TestFalcoServiceEdgeCases:
@@ -197,7 +387,9 @@ class TestFalcoServiceEdgeCases:
         mock_service_file = MagicMock()
         mock_custom_setting = MagicMock()
 
-        falco_service = FalcoService(mock_config, mock_service_file, mock_custom_setting)
+        falco_service = FalcoService(
+            mock_config, MagicMock(), mock_service_file, mock_custom_setting, MagicMock()
+        )
 
         # Mock custom_setting.configure to raise GitCloneError
         mock_custom_setting.configure.side_effect = GitCloneError("Test error")
@@ -219,7 +411,9 @@ class TestFalcoService:
         mock_service_file.service_name = FALCO_SERVICE_NAME
         mock_custom_setting = MagicMock()
 
-        service = FalcoService(mock_config, mock_service_file, mock_custom_setting)
+        service = FalcoService(
+            mock_config, MagicMock(), mock_service_file, mock_custom_setting, MagicMock()
+        )
         service.install()
 
         mock_config.install.assert_called_once()
@@ -234,7 +428,9 @@ class TestFalcoService:
         mock_service_file.service_name = FALCO_SERVICE_NAME
         mock_custom_setting = MagicMock()
 
-        service = FalcoService(mock_config, mock_service_file, mock_custom_setting)
+        service = FalcoService(
+            mock_config, MagicMock(), mock_service_file, mock_custom_setting, MagicMock()
+        )
         service.remove()
 
         mock_systemd.service_stop.assert_called_once_with(FALCO_SERVICE_NAME)
@@ -247,21 +443,203 @@ class TestFalcoService:
     def test_configure(self, mock_systemd):
         """Test Falco service configuration."""
         mock_config = MagicMock()
+        mock_override_config = MagicMock()
+        mock_override_config.install_ca.return_value = None
         mock_service_file = MagicMock()
         mock_service_file.service_name = FALCO_SERVICE_NAME
-        mock_service_file.context = {}
         mock_custom_setting = MagicMock()
+        mock_custom_setting.digest.return_value = ""
+        mock_custom_setting.base_syscalls.return_value = ["execve", "openat"]
 
-        service = FalcoService(mock_config, mock_service_file, mock_custom_setting)
-        charm_state = CharmState()
+        service = FalcoService(
+            mock_config, mock_override_config, mock_service_file, mock_custom_setting, MagicMock()
+        )
+        charm_state = CharmState(
+            http_output={"url": "http://127.0.0.1:8080/"}, derive_base_syscalls=True
+        )
         service.configure(charm_state)
 
         mock_custom_setting.configure.assert_called_once_with(charm_state)
-        mock_service_file.install.assert_not_called()
-        mock_service_file.update.assert_called_once()
+        mock_override_config.update.assert_called_once_with(
+            context={
+                "http_output": {"url": "http://127.0.0.1:8080/"},
+                "base_syscalls": ["execve", "openat"],
+                "metrics": charm_state.metrics.model_dump(),
+                "outputs": ["http", "syslog"],
+                "payload": FalcoPayload().model_dump(),
+                "event_topology": True,
+                "outputs_queue_capacity": 0,
+                "min_priority": "debug",
+                "http_output_keep_alive": False,
+                "http_output_compress_uploads": False,
+                "http_output_ca_file": None,
+                "machine_units": {},
+            }
+        )
+        mock_config.update.assert_called_once_with(
+            context={"plugins": ["json", "k8saudit", "container"]}
+        )
+        mock_service_file.update.assert_called_once_with(
+            context={
+                "engine_options": [],
+                "plugin_options": _plugin_options(
+                    mock_service_file.falco_layout, ["json", "k8saudit", "container"]
+                ),
+            }
+        )
         mock_systemd.daemon_reload.assert_called_once()
         mock_systemd.service_restart.assert_called_once_with(FALCO_SERVICE_NAME)
 
+    @patch("service.systemd")
+    def test_configure_captures_all_syscalls(self, mock_systemd):
+        """Test the rules are not analyzed when the base syscalls are not derived."""
+        mock_override_config = MagicMock()
+        mock_override_config.install_ca.return_value = None
+        mock_service_file = MagicMock()
+        mock_service_file.service_name = FALCO_SERVICE_NAME
+        mock_custom_setting = MagicMock()
+        mock_custom_setting.digest.return_value = ""
+
+        service = FalcoService(
+            MagicMock(), mock_override_config, mock_service_file, mock_custom_setting, MagicMock()
+        )
+        service.configure(CharmState(derive_base_syscalls=False))
+
+        mock_custom_setting.base_syscalls.assert_not_called()
+        mock_override_config.update.assert_called_once_with(
+            context={
+                "http_output": None,
+                "base_syscalls": None,
+                "metrics": FalcoMetrics().model_dump(),
+                "outputs": ["http", "syslog"],
+                "payload": FalcoPayload().model_dump(),
+                "event_topology": True,
+                "outputs_queue_capacity": 0,
+                "min_priority": "debug",
+                "http_output_keep_alive": False,
+                "http_output_compress_uploads": False,
+                "http_output_ca_file": None,
+                "machine_units": {},
+            }
+        )
+
+    @patch("service.systemd")
+    def test_configure_applies_engine_tuning(self, mock_systemd):
+        """Test the engine settings of the tuner are rendered into the service file."""
+        mock_service_file = MagicMock()
+        mock_service_file.service_name = FALCO_SERVICE_NAME
+        mock_custom_setting = MagicMock()
+        mock_custom_setting.digest.return_value = ""
+        mock_tuner = MagicMock()
+        mock_tuner.tune.return_value = EngineTuning(
+            buf_size_preset=5, cpus_for_each_buffer=2, thread_table_size=65536, snaplen=80
+        )
+
+        service = FalcoService(
+            MagicMock(),
+            MagicMock(),
+            mock_service_file,
+            mock_custom_setting,
+            MagicMock(),
+            tuner=mock_tuner,
+        )
+        service.configure(
+            CharmState(engine_overrides={"snaplen": 80}, buf_size_preset_bounds=(3, 8))
+        )
+
+        mock_tuner.tune.assert_called_once_with({"snaplen": 80}, (3, 8))
+        assert mock_service_file.update.call_args.kwargs["context"]["engine_options"] == (
+            mock_tuner.tune.return_value.options()
+        )
+
+    @patch("service.systemd")
+    def test_configure_skips_restart_when_unchanged(self, mock_systemd, mock_falco_layout):
+        """Test Falco service is neither restarted nor reloaded when nothing changed."""
+        mock_systemd.service_running.return_value = True
+        service, applied_state = _falco_service_with_layout(mock_falco_layout)
+
+        service.configure(CharmState())
+        service.configure(CharmState())
+
+        mock_systemd.service_restart.assert_called_once_with(FALCO_SERVICE_NAME)
+        mock_systemd.service_reload.assert_not_called()
+        assert applied_state.fingerprint == service.fingerprint()
+        assert applied_state.count("restarted") == 1
+        assert applied_state.count("skipped") == 1
+
+    @patch("service.systemd")
+    def test_configure_reloads_when_rules_changed(self, mock_systemd, mock_falco_layout):
+        """Test Falco service is reloaded instead of restarted when the rules change."""
+        mock_systemd.service_running.return_value = True
+        service, applied_state = _falco_service_with_layout(mock_falco_layout)
+
+        service.configure(CharmState())
+        service.custom_setting.digest.return_value = "rules changed"
+        service.configure(CharmState())
+
+        mock_systemd.service_restart.assert_called_once_with(FALCO_SERVICE_NAME)
+        mock_systemd.service_reload.assert_called_once_with(
+            FALCO_SERVICE_NAME, restart_on_failure=True
+        )
+        assert applied_state.count("reloaded") == 1
+        assert applied_state.count("skipped") == 0
+
+    @patch("service.systemd")
+    def test_configure_restarts_when_service_file_changed(self, mock_systemd, mock_falco_layout):
+        """Test Falco service is restarted when the service file changes."""
+        mock_systemd.service_running.return_value = True
+        service, applied_state = _falco_service_with_layout(mock_falco_layout)
+
+        service.configure(CharmState())
+        service.service_file.destination.write_text("ExecStart=falco -o engine.kind=ebpf")
+        service.configure(CharmState())
+
+        assert mock_systemd.service_restart.call_count == 2
+        mock_systemd.service_reload.assert_not_called()
+        assert applied_state.count("restarted") == 2
+
+    @patch("service.systemd")
+    def test_configure_restarts_when_not_running(self, mock_systemd, mock_falco_layout):
+        """Test Falco service is restarted when unchanged but not running."""
+        mock_systemd.service_running.return_value = False
+        service, _ = _falco_service_with_layout(mock_falco_layout)
+
+        service.configure(CharmState())
+        service.configure(CharmState())
+
+        assert mock_systemd.service_restart.call_count == 2
+
+    @patch("service.systemd")
+    def test_configure_times_phases(self, mock_systemd, mock_falco_layout):
+        """Test Falco service configuration times its phases."""
+        mock_systemd.service_running.return_value = True
+        service, _ = _falco_service_with_layout(mock_falco_layout)
+        service.metrics = HookMetrics()
+
+        service.configure(CharmState(derive_base_syscalls=True))
+
+        phases = [phase for phase, _ in service.metrics.durations]
+        assert phases == [
+            "custom_settings",
+            "analyze_rules",
+            "render_templates",
+            "fingerprint",
+            "daemon_reload",
+            "restart",
+        ]
+
+    @patch("service.systemd")
+    def test_install_resets_applied_state(self, mock_systemd, mock_falco_layout):
+        """Test Falco service installation forgets the last applied desired state."""
+        applied_state = FalcoAppliedState(mock_falco_layout)
+        applied_state.record("restarted", FalcoFingerprint(restart="abc", reload="def"))
+
+        service = FalcoService(MagicMock(), MagicMock(), MagicMock(), MagicMock(), applied_state)
+        service.install()
+
+        assert applied_state.fingerprint == FalcoFingerprint()
+        assert applied_state.count("restarted") == 1
+
     @patch("service.systemd")
     def test_check_active_running(self, mock_systemd):
         """Test check_active when service is running."""
@@ -272,7 +650,9 @@ class TestFalcoService:
         mock_service_file.service_name = FALCO_SERVICE_NAME
         mock_custom_setting = MagicMock()
 
-        service = FalcoService(mock_config, mock_service_file, mock_custom_setting)
+        service = FalcoService(
+            mock_config, MagicMock(), mock_service_file, mock_custom_setting, MagicMock()
+        )
         assert service.check_active() is True
         mock_systemd.service_running.assert_called_once_with(FALCO_SERVICE_NAME)
 
@@ -286,7 +666,9 @@ class TestFalcoService:
         mock_service_file.service_name = FALCO_SERVICE_NAME
         mock_custom_setting = MagicMock()
 
-        service = FalcoService(mock_config, mock_service_file, mock_custom_setting)
+        service = FalcoService(
+            mock_config, MagicMock(), mock_service_file, mock_custom_setting, MagicMock()
+        )
         assert service.check_active() is False
         mock_systemd.service_running.assert_called_once_with(FALCO_SERVICE_NAME)
 
@@ -294,47 +676,69 @@ class TestFalcoService:
 class TestUtilityFunctions:
     """Test utility functions in service module."""
 
-    @patch("service.subprocess.run")
-    def test_pull_falco_rule_files_rsync_error(self, mock_run):
-        """Test _pull_falco_rule_files handles rsync error."""
-        mock_run.side_effect = subprocess.CalledProcessError(1, "rsync")
-
-        with pytest.raises(RsyncError):
-            service._pull_falco_rule_files("/dummy/destination")
+    @patch("service.subprocess")
+    def test_git_fetch_success(self, mock_subprocess, mock_git_dirs):
+        """Test _git_fetch creates the mirror and fetches only the requested ref."""
+        service._git_fetch("git+ssh://git@github.com/user/repo.git", ref="main")
+
+        commands = [call[0][0] for call in mock_subprocess.run.call_args_list]
+        assert "init" in commands[0]
+        assert commands[1][-2:] == ["remote.origin.url", "git+ssh://git@github.com/user/repo.git"]
+        assert "fetch" in commands[2]
+        assert commands[2][-5:] == [
+            "--depth",
+            "1",
+            "--force",
+            "origin",
+            f"+main:{MIRROR_SYNCED_REF}",
+        ]
 
     @patch("service.subprocess.run")
-    def test_pull_falco_config_files_rsync_error(self, mock_run):
-        """Test _pull_falco_config_files handles rsync error."""
-        mock_run.side_effect = subprocess.CalledProcessError(1, "rsync")
-
-        with pytest.raises(RsyncError):
-            service._pull_falco_config_files("/dummy/destination")
+    def test_git_fetch_error(self, mock_run, mock_git_dirs):
+        """Test _git_fetch handles fetch error."""
+        mock_run.side_effect = subprocess.CalledProcessError(1, "git")
 
-    @patch("service.subprocess")
-    @patch("service.shutil")
-    def test_git_clone_success(self, mock_shutil, mock_subprocess):
-        """Test _git_clone with successful clone."""
-        service._git_clone("git+ssh://git@github.com/user/repo.git", ref="main")
-
-        mock_shutil.rmtree.assert_called_once()
-        mock_subprocess.run.assert_called_once()
-
-        # Verify git clone command
-        call_args = mock_subprocess.run.call_args[0][0]
-        assert "clone" in call_args
-        assert "--depth" in call_args
-        assert "1" in call_args
-        assert "-b" in call_args
-        assert "main" in call_args
+        with pytest.raises(GitCloneError):
+            service._git_fetch("git+ssh://git@github.com/user/repo.git")
 
     @patch("service.subprocess.run")
-    @patch("service.shutil")
-    def test_git_clone_error(self, mock_shutil, mock_run):
-        """Test _git_clone handles clone error."""
+    def test_git_checkout_error(self, mock_run, mock_git_dirs):
+        """Test _git_checkout handles checkout error."""
         mock_run.side_effect = subprocess.CalledProcessError(1, "git")
 
         with pytest.raises(GitCloneError):
-            service._git_clone("git+ssh://git@github.com/user/repo.git")
+            service._git_checkout()
+
+    def test_git_fetch_and_checkout_reuse_mirror(self, mock_git_dirs, local_git_repo):
+        """Test the mirror is kept and the worktree follows the fetched ref."""
+        mirror_dir, clone_dir = mock_git_dirs
+        repo = local_git_repo.as_uri()
+
+        service._git_fetch(repo, ref="v1")
+        service._git_checkout()
+        assert sorted(p.name for p in (clone_dir / FALCO_CUSTOM_RULES_KEY).iterdir()) == ["a.yaml"]
+        assert service._get_cloned_repo_url() == repo
+        mirror_inode = (mirror_dir / "HEAD").stat().st_ino
+
+        service._git_fetch(repo, ref="main")
+        service._git_checkout()
+        assert sorted(p.name for p in (clone_dir / FALCO_CUSTOM_RULES_KEY).iterdir()) == [
+            "a.yaml",
+            "b.yaml",
+        ]
+        assert (mirror_dir / "HEAD").stat().st_ino == mirror_inode
+        assert (clone_dir / ".git").is_file()
+
+    def test_git_checkout_replaces_legacy_clone(self, mock_git_dirs, local_git_repo):
+        """Test a full clone left by an older charm revision is replaced by a worktree."""
+        _, clone_dir = mock_git_dirs
+        (clone_dir / ".git").mkdir(parents=True)
+
+        service._git_fetch(local_git_repo.as_uri())
+        service._git_checkout()
+
+        assert (clone_dir / ".git").is_file()
+        assert (clone_dir / FALCO_CUSTOM_RULES_KEY / "b.yaml").exists()
 
     @patch("service.subprocess")
     def test_setup_ssh_key_success(self, mock_subprocess, tmp_path):
@@ -403,6 +807,51 @@ class TestUtilityFunctions:
         # Cleanup
         readonly_dir.chmod(0o755)
 
+    @patch("service.subprocess.check_output")
+    def test_add_known_hosts_uses_cache(self, mock_check_output, tmp_path):
+        """Test _add_known_hosts only scans again once the cached key is too old."""
+        test_known_hosts = tmp_path / "known_hosts"
+        mock_check_output.return_value = b"github.com ssh-rsa AAAA...\n"
+
+        with patch("service.KNOWN_HOSTS_FILE", test_known_hosts):
+            service._add_known_hosts("github.com", refresh_interval=3600)
+            service._add_known_hosts("github.com", refresh_interval=3600)
+            assert mock_check_output.call_count == 1
+
+            # The cached key is restored if known_hosts is overwritten
+            test_known_hosts.write_text("")
+            service._add_known_hosts("github.com", refresh_interval=3600)
+            assert mock_check_output.call_count == 1
+            assert test_known_hosts.read_text() == "github.com ssh-rsa AAAA...\n"
+
+            service._add_known_hosts("github.com", refresh_interval=0)
+            assert mock_check_output.call_count == 2
+
+    @patch("service.subprocess.check_output")
+    def test_add_known_hosts_keeps_other_hosts(self, mock_check_output, tmp_path):
+        """Test _add_known_hosts keeps the known_hosts entries of other hosts."""
+        test_known_hosts = tmp_path / "known_hosts"
+        test_known_hosts.write_text("gitlab.com ssh-rsa BBBB...\ngithub.com ssh-rsa OLD...\n")
+        mock_check_output.return_value = b"github.com ssh-rsa AAAA...\n"
+
+        with patch("service.KNOWN_HOSTS_FILE", test_known_hosts):
+            service._add_known_hosts("github.com")
+
+        assert test_known_hosts.read_text() == (
+            "gitlab.com ssh-rsa BBBB...\ngithub.com ssh-rsa AAAA...\n"
+        )
+
+    @patch("service.subprocess.check_output")
+    def test_add_known_hosts_pinned(self, mock_check_output, tmp_path):
+        """Test _add_known_hosts writes a pinned host key without scanning."""
+        test_known_hosts = tmp_path / "known_hosts"
+
+        with patch("service.KNOWN_HOSTS_FILE", test_known_hosts):
+            service._add_known_hosts("github.com", host_key="ssh-ed25519 CCCC...\n")
+
+        mock_check_output.assert_not_called()
+        assert test_known_hosts.read_text() == "github.com ssh-ed25519 CCCC...\n"
+
     @patch("service.subprocess")
     def test_get_cloned_repo_url_success(self, mock_subprocess):
         """Test _get_cloned_repo_url returns URL."""
@@ -420,40 +869,89 @@ class TestUtilityFunctions:
         assert url == ""
 
     @patch("service.subprocess")
-    def test_get_cloned_repo_tag_success(self, mock_subprocess):
-        """Test _get_cloned_repo_tag returns tag."""
-        mock_subprocess.check_output.return_value = b"v1.0.0\n"
+    def test_get_cloned_repo_commit_success(self, mock_subprocess):
+        """Test _get_cloned_repo_commit returns the checked out commit."""
+        mock_subprocess.check_output.return_value = b"1111111111111111111111111111111111111111\n"
 
-        tag = service._get_cloned_repo_tag()
-        assert tag == "v1.0.0"
+        commit = service._get_cloned_repo_commit()
+        assert commit == "1111111111111111111111111111111111111111"
 
     @patch("service.subprocess.check_output")
-    def test_get_cloned_repo_tag_no_tag(self, mock_check_output):
-        """Test _get_cloned_repo_tag when no tag exists."""
+    def test_get_cloned_repo_commit_not_cloned(self, mock_check_output):
+        """Test _get_cloned_repo_commit when repo not cloned."""
         mock_check_output.side_effect = subprocess.CalledProcessError(1, "git")
 
-        tag = service._get_cloned_repo_tag()
-        assert tag == ""
+        commit = service._get_cloned_repo_commit()
+        assert commit == ""
+
+    def test_get_remote_commit(self, local_git_repo):
+        """Test _get_remote_commit resolves branches, peeled tags and the remote HEAD."""
+
+        def rev_parse(rev):
+            cmd = ["git", "-C", str(local_git_repo), "rev-parse", rev]
+            return subprocess.check_output(cmd).decode().strip()
+
+        repo = local_git_repo.as_uri()
+        assert service._get_remote_commit(repo, ref="main") == rev_parse("main")
+        assert service._get_remote_commit(repo, ref="v1") == rev_parse("v1^{commit}")
+        assert service._get_remote_commit(repo) == rev_parse("HEAD")
+
+    def test_get_remote_commit_ref_not_found(self, local_git_repo):
+        """Test _get_remote_commit raises when the ref does not exist."""
+        with pytest.raises(GitCloneError, match="not found"):
+            service._get_remote_commit(local_git_repo.as_uri(), ref="missing")
+
+    @patch("service.subprocess.check_output")
+    def test_get_remote_commit_error(self, mock_check_output):
+        """Test _get_remote_commit handles ls-remote error."""
+        mock_check_output.side_effect = subprocess.CalledProcessError(128, "git")
+
+        with pytest.raises(GitCloneError):
+            service._get_remote_commit("git+ssh://git@github.com/user/repo.git", ref="main")
 
     @patch("service.subprocess")
-    def test_git_sync_already_synced(self, mock_subprocess):
-        """Test _git_sync returns early if repo already synced."""
+    def test_git_sync_already_synced(self, mock_subprocess, tmp_path):
+        """Test _git_sync returns early if the remote ref is already checked out."""
 
-        # Mock that repo is already cloned with same URL and tag
+        # Mock that repo is already cloned with same URL and commit
         def check_output_side_effect(cmd, *args, **kwargs):
             if "config" in cmd:
                 return b"git+ssh://git@github.com/user/repo.git\n"
-            elif "describe" in cmd:
-                return b"v1.0\n"
+            elif "ls-remote" in cmd:
+                return b"1111111111111111111111111111111111111111\trefs/heads/main\n"
+            elif "rev-parse" in cmd:
+                return b"1111111111111111111111111111111111111111\n"
             return b""
 
         mock_subprocess.check_output.side_effect = check_output_side_effect
 
-        service._git_sync("git+ssh://git@github.com/user/repo.git", "github.com", ref="v1.0")
+        with patch("service.KNOWN_HOSTS_FILE", tmp_path / "known_hosts"):
+            synced = service._git_sync(
+                "git+ssh://git@github.com/user/repo.git", "github.com", ref="main"
+            )
 
-        # Should not call run (git clone) if already synced
+        # Should not call run (git fetch) if already synced
+        assert not synced
         mock_subprocess.run.assert_not_called()
 
+    def test_git_sync_follows_branch(self, mock_git_dirs, local_git_repo, tmp_path):
+        """Test _git_sync fetches only when the branch head has moved."""
+        repo = local_git_repo.as_uri()
+        with patch("service._add_known_hosts"):
+            assert service._git_sync(repo, "localhost", ref="main")
+            assert not service._git_sync(repo, "localhost", ref="main")
+
+            (local_git_repo / "rules.d/c.yaml").write_text("- list: c\n  items: []\n")
+            subprocess.run(["git", "-C", str(local_git_repo), "add", "."], check=True)
+            subprocess.run(
+                ["git", "-C", str(local_git_repo), "commit", "--quiet", "--message", "third"],
+                check=True,
+            )
+            assert service._git_sync(repo, "localhost", ref="main")
+
+        _, clone_dir = mock_git_dirs
+        assert (clone_dir / FALCO_CUSTOM_RULES_KEY / "c.yaml").exists()
+
     @patch("service.subprocess.check_output")
     @patch("service.subprocess.run")
     def test_git_sync_with_ssh_key(self, mock_run, mock_check_output, tmp_path):
@@ -465,12 +963,12 @@ class TestUtilityFunctions:
             patch("service.SSH_KEY_FILE", test_ssh_key_file),
             patch("service.KNOWN_HOSTS_FILE", test_known_hosts),
         ):
-            # Mock check_output calls: repo URL check, tag check, and keyscan
-            # _git_sync calls _get_cloned_repo_url, _get_cloned_repo_tag, and _add_known_hosts
+            # Mock check_output calls: keyscan, remote probe, repo URL and commit checks
             mock_check_output.side_effect = [
-                subprocess.CalledProcessError(1, "git"),  # get_cloned_repo_url
-                subprocess.CalledProcessError(1, "git"),  # get_cloned_repo_tag
                 b"github.com ssh-rsa AAAA...\n",  # add_known_hosts
+                b"1111111111111111111111111111111111111111\tHEAD\n",  # get_remote_commit
+                subprocess.CalledProcessError(1, "git"),  # get_cloned_repo_url
+                b"1111111111111111111111111111111111111111\n",  # get_cloned_repo_commit
             ]
 
             service._git_sync(
@@ -490,13 +988,539 @@ class TestUtilityFunctions:
         with patch("service.KNOWN_HOSTS_FILE", test_known_hosts):
             # Mock check_output calls
             mock_check_output.side_effect = [
-                subprocess.CalledProcessError(1, "git"),  # get_cloned_repo_url
-                subprocess.CalledProcessError(1, "git"),  # get_cloned_repo_tag
                 b"github.com ssh-rsa AAAA...\n",  # add_known_hosts
+                b"1111111111111111111111111111111111111111\tHEAD\n",  # get_remote_commit
+                subprocess.CalledProcessError(1, "git"),  # get_cloned_repo_url
+                b"1111111111111111111111111111111111111111\n",  # get_cloned_repo_commit
             ]
 
             # Call without ssh_private_key parameter
             service._git_sync("https://github.com/user/repo.git", "github.com")
 
-            # Verify git clone was called
-            mock_run.assert_called_once()
+            # Verify git fetch was called
+            commands = [call[0][0] for call in mock_run.call_args_list]
+            assert any("fetch" in command for command in commands)
+
+
+class TestFalcoConfigFile:
+    """Test FalcoConfigFile and FalcoServiceFile plugin rendering."""
+
+    def test_update_renders_plugins(self, mock_falco_layout, monkeypatch):
+        """Test only the selected plugins are configured and loaded."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        config_file = FalcoConfigFile(mock_falco_layout)
+        service_file = FalcoServiceFile(mock_falco_layout)
+        service_file.service_file = mock_falco_layout.home / "falco.service"
+        service_file.destination = service_file.service_file
+
+        config_file.update(context={"plugins": ["container"]})
+        service_file.update(
+            context={"plugin_options": _plugin_options(mock_falco_layout, ["container"])}
+        )
+
+        content = yaml.safe_load(config_file.destination.read_text())
+        assert [plugin["name"] for plugin in content["plugins"]] == ["container"]
+        unit = service_file.destination.read_text()
+        assert "-o load_plugins[0]=container" in unit
+        assert "k8saudit" not in unit
+
+        config_file.update(context={"plugins": []})
+        assert yaml.safe_load(config_file.destination.read_text())["plugins"] == []
+
+
+class TestFalcoOverrideConfigFile:
+    """Test FalcoOverrideConfigFile class."""
+
+    def test_update_renders_http_output(self, mock_falco_layout, monkeypatch):
+        """Test the override file holds the http output settings."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        mock_charm = MagicMock()
+        with patch("service.JujuTopology") as mock_topology:
+            mock_topology.from_charm.return_value.as_dict.return_value = {
+                "unit": "falco/0",
+                "charm_name": "falco",
+                "model": "test",
+                "model_uuid": "00000000-0000-0000-0000-000000000000",
+                "application": "falco",
+            }
+            override_file = FalcoOverrideConfigFile(mock_falco_layout, mock_charm)
+
+        override_file.update(context={"http_output": {"url": "http://10.0.0.1:2801/"}})
+
+        assert override_file.destination.parent == mock_falco_layout.configs_dir
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["http_output"] == {
+            "enabled": True,
+            "url": "http://10.0.0.1:2801/",
+            "keep_alive": False,
+            "compress_uploads": False,
+        }
+        assert {"juju_unit": "falco/0"} in content["append_output"][1]["extra_fields"]
+
+        override_file.update(context={"http_output": {}})
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["http_output"] == {"enabled": False}
+
+    def test_update_renders_http_output_tls(self, mock_falco_layout, monkeypatch):
+        """Test the http output reuses connections and verifies the endpoint with its CA."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        with patch("service.JujuTopology") as mock_topology:
+            mock_topology.from_charm.return_value.as_dict.return_value = dict.fromkeys(
+                ("unit", "charm_name", "model", "model_uuid", "application"), "falco"
+            )
+            override_file = FalcoOverrideConfigFile(mock_falco_layout, MagicMock())
+
+        ca_file = override_file.install_ca("-----BEGIN CERTIFICATE-----\n")
+        override_file.update(
+            context={
+                "http_output": {"url": "https://10.0.0.1:2801/"},
+                "http_output_keep_alive": True,
+                "http_output_compress_uploads": True,
+                "http_output_ca_file": str(ca_file),
+            }
+        )
+
+        assert ca_file == mock_falco_layout.http_output_ca_file
+        assert ca_file.read_text() == "-----BEGIN CERTIFICATE-----\n"
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["http_output"]["keep_alive"] is True
+        assert content["http_output"]["compress_uploads"] is True
+        assert content["http_output"]["ca_cert"] == str(ca_file)
+
+        assert override_file.install_ca(None) is None
+        assert not ca_file.exists()
+
+    def test_update_renders_machine_units(self, mock_falco_layout, monkeypatch):
+        """Test the events name the falco units of the machine when several share it."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        with patch("service.JujuTopology") as mock_topology:
+            mock_topology.from_charm.return_value.as_dict.return_value = dict.fromkeys(
+                ("unit", "charm_name", "model", "model_uuid", "application"), "falco"
+            )
+            override_file = FalcoOverrideConfigFile(mock_falco_layout, MagicMock())
+
+        override_file.update(context={"machine_units": {"falco/0": {"application": "falco"}}})
+        extra_fields = yaml.safe_load(override_file.destination.read_text())["append_output"][1]
+        assert "juju_machine_units" not in str(extra_fields)
+
+        override_file.update(
+            context={
+                "machine_units": {
+                    "falco-b/0": {"application": "falco-b"},
+                    "falco/0": {"application": "falco"},
+                }
+            }
+        )
+        extra_fields = yaml.safe_load(override_file.destination.read_text())["append_output"][1]
+        assert {"juju_machine_units": "falco-b/0,falco/0"} in extra_fields["extra_fields"]
+        assert {"juju_machine_applications": "falco,falco-b"} in extra_fields["extra_fields"]
+
+    def test_update_renders_outputs(self, mock_falco_layout, monkeypatch):
+        """Test the override file enables only the requested output sinks."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        with patch("service.JujuTopology") as mock_topology:
+            mock_topology.from_charm.return_value.as_dict.return_value = dict.fromkeys(
+                ("unit", "charm_name", "model", "model_uuid", "application"), "falco"
+            )
+            override_file = FalcoOverrideConfigFile(mock_falco_layout, MagicMock())
+
+        override_file.update(context={"http_output": {"url": "http://10.0.0.1:2801/"}})
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["stdout_output"] == {"enabled": False}
+        assert content["syslog_output"] == {"enabled": True}
+        assert content["http_output"]["enabled"] is True
+
+        override_file.update(context={"outputs": ["syslog"]})
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["syslog_output"] == {"enabled": True}
+        assert content["http_output"]["enabled"] is False
+
+        override_file.update(context={"outputs_queue_capacity": 10000, "min_priority": "notice"})
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["outputs_queue"] == {"capacity": 10000}
+        assert content["priority"] == "notice"
+
+    def test_update_renders_payload(self, mock_falco_layout, monkeypatch):
+        """Test the override file sets the JSON event properties of the payload profile."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        with patch("service.JujuTopology") as mock_topology:
+            mock_topology.from_charm.return_value.as_dict.return_value = dict.fromkeys(
+                ("unit", "charm_name", "model", "model_uuid", "application"), "falco"
+            )
+            override_file = FalcoOverrideConfigFile(mock_falco_layout, MagicMock())
+
+        override_file.update(context={"payload": PAYLOAD_PROFILES["minimal"].model_dump()})
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["json_include_output_property"] is False
+        assert content["json_include_output_fields_property"] is True
+        assert content["json_include_tags_property"] is False
+        assert content["append_output"][0] == {"suggested_output": False}
+        assert {"juju_unit": "falco"} in content["append_output"][1]["extra_fields"]
+
+    def test_update_renders_event_topology(self, mock_falco_layout, monkeypatch):
+        """Test the events only carry the unit when the topology is sent through the relation."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        with patch("service.JujuTopology") as mock_topology:
+            mock_topology.from_charm.return_value.as_dict.return_value = dict.fromkeys(
+                ("unit", "charm_name", "model", "model_uuid", "application"), "falco"
+            )
+            override_file = FalcoOverrideConfigFile(mock_falco_layout, MagicMock())
+
+        override_file.install()
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert len(content["append_output"][1]["extra_fields"]) == 5
+
+        override_file.update(context={"event_topology": False})
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["append_output"][1]["extra_fields"] == [{"juju_unit": "falco"}]
+
+    def test_update_renders_base_syscalls(self, mock_falco_layout, monkeypatch):
+        """Test the override file holds the base syscalls only when they are derived."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        with patch("service.JujuTopology") as mock_topology:
+            mock_topology.from_charm.return_value.as_dict.return_value = dict.fromkeys(
+                ("unit", "charm_name", "model", "model_uuid", "application"), "falco"
+            )
+            override_file = FalcoOverrideConfigFile(mock_falco_layout, MagicMock())
+
+        override_file.update(context={"base_syscalls": ["execve", "openat"]})
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["base_syscalls"] == {"custom_set": ["execve", "openat"], "repair": True}
+
+        override_file.update(context={"base_syscalls": None})
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert "base_syscalls" not in content
+
+    def test_update_renders_metrics(self, mock_falco_layout, monkeypatch):
+        """Test the override file holds the metrics interval, output rule and counters."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        with patch("service.JujuTopology") as mock_topology:
+            mock_topology.from_charm.return_value.as_dict.return_value = dict.fromkeys(
+                ("unit", "charm_name", "model", "model_uuid", "application"), "falco"
+            )
+            override_file = FalcoOverrideConfigFile(mock_falco_layout, MagicMock())
+
+        override_file.install()
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["metrics"]["interval"] == "1h"
+        assert content["metrics"]["output_rule"] is True
+        assert content["metrics"]["kernel_event_counters_enabled"] is True
+        assert content["metrics"]["kernel_event_counters_per_cpu_enabled"] is False
+
+        metrics = FalcoMetrics(
+            interval="1m", output_rule=False, counters=["kernel_event_counters_per_cpu"]
+        )
+        override_file.update(context={"metrics": metrics.model_dump()})
+
+        content = yaml.safe_load(override_file.destination.read_text())
+        assert content["metrics"]["interval"] == "1m"
+        assert content["metrics"]["output_rule"] is False
+        assert content["metrics"]["kernel_event_counters_enabled"] is False
+        assert content["metrics"]["kernel_event_counters_per_cpu_enabled"] is True
+
+    def test_custom_setting_base_syscalls(self, mock_falco_layout, tmp_path):
+        """Test the base syscalls cover the loaded custom rules only, and are cached."""
+        (mock_falco_layout.default_rules_dir / "falco_rules.yaml").write_text(
+            "- rule: Shell\n  condition: evt.type = execve and proc.name = bash\n"
+        )
+        source = tmp_path / "source"
+        (source / FALCO_CUSTOM_RULES_KEY).mkdir(parents=True)
+        (source / FALCO_CUSTOM_RULES_KEY / "a.yaml").write_text(
+            "- macro: outbound\n"
+            "  condition: (evt.type in (connect, sendto) and evt.dir=<)\n"
+            "- rule: Connect\n"
+            "  condition: outbound and fd.sip = 10.0.0.1\n"
+        )
+        custom_setting = FalcoCustomSetting(mock_falco_layout)
+        custom_setting._sync(source)
+
+        assert custom_setting.base_syscalls() == ["connect", "sendto"]
+        with patch("service.derive_base_syscalls") as mock_derive:
+            assert custom_setting.base_syscalls() == ["connect", "sendto"]
+        mock_derive.assert_not_called()
+
+        (source / FALCO_CUSTOM_RULES_KEY / "a.yaml").write_text(
+            "- rule: Any\n  condition: proc.name = nc\n"
+        )
+        custom_setting._sync(source)
+        assert custom_setting.base_syscalls() is None
+
+    def test_custom_setting_remove_keeps_override_file(self, mock_falco_layout):
+        """Test removing the custom settings keeps the charm managed override file."""
+        managed_file = mock_falco_layout.configs_dir / FALCO_MANAGED_CONFIG_FILE
+        managed_file.write_text("http_output: {}")
+
+        FalcoCustomSetting(mock_falco_layout).remove()
+
+        assert managed_file.exists()
+
+    def test_custom_setting_digest_follows_synced_files(self, mock_falco_layout, tmp_path):
+        """Test the custom settings digest changes only when the synced files change."""
+        source = tmp_path / "source"
+        (source / FALCO_CUSTOM_RULES_KEY).mkdir(parents=True)
+        rule_file = source / FALCO_CUSTOM_RULES_KEY / "a.yaml"
+        rule_file.write_text("- rule: a")
+        custom_setting = FalcoCustomSetting(mock_falco_layout)
+
+        custom_setting._sync(source)
+        digest = custom_setting.digest()
+        custom_setting._sync(source)
+        assert custom_setting.digest() == digest
+
+        rule_file.write_text("- rule: b")
+        custom_setting._sync(source)
+        assert custom_setting.digest() != digest
+
+
+class TestFalcoCustomSettingGenerations:
+    """Test the generations of the Falco custom settings."""
+
+    def test_layout_links_generation(self, mock_falco_layout):
+        """Test the rules and config directories are links into the active generation."""
+        assert mock_falco_layout.current_dir.is_symlink()
+        assert mock_falco_layout.rules_dir.is_symlink()
+        assert mock_falco_layout.configs_dir.is_symlink()
+        assert mock_falco_layout.rules_dir.resolve() == (
+            mock_falco_layout.generations_dir / "0" / FALCO_CUSTOM_RULES_KEY
+        )
+
+    def test_layout_migrates_legacy_directories(self, mock_falco_base_dir):
+        """Test rules left in a plain rules directory are moved into the active generation."""
+        legacy_rules_dir = mock_falco_base_dir / "etc/falco/rules.d"
+        legacy_rules_dir.mkdir(parents=True)
+        (legacy_rules_dir / "a.yaml").write_text("- rule: a")
+
+        falco_layout = service.FalcoLayout(base_dir=mock_falco_base_dir)
+
+        assert falco_layout.rules_dir.is_symlink()
+        assert (falco_layout.rules_dir / "a.yaml").read_text() == "- rule: a"
+
+    def test_sync_activates_new_generation(self, mock_falco_layout, tmp_path):
+        """Test a sync activates a new generation and keeps the previous one untouched."""
+        source = tmp_path / "source"
+        (source / FALCO_CUSTOM_RULES_KEY).mkdir(parents=True)
+        (source / FALCO_CUSTOM_RULES_KEY / "a.yaml").write_text("- rule: a")
+        managed_file = mock_falco_layout.configs_dir / FALCO_MANAGED_CONFIG_FILE
+        managed_file.write_text("http_output: {}")
+        custom_setting = FalcoCustomSetting(mock_falco_layout)
+        previous = mock_falco_layout.current_dir.resolve()
+
+        changes = custom_setting._sync(source)
+
+        assert changes.added == ["a.yaml"]
+        assert mock_falco_layout.current_dir.resolve() != previous
+        assert (mock_falco_layout.rules_dir / "a.yaml").read_text() == "- rule: a"
+        assert managed_file.read_text() == "http_output: {}"
+        assert not (previous / FALCO_CUSTOM_RULES_KEY / "a.yaml").exists()
+
+    def test_sync_unchanged_keeps_generation(self, mock_falco_layout, tmp_path):
+        """Test a sync without changes neither stages nor activates a generation."""
+        source = tmp_path / "source"
+        (source / FALCO_CUSTOM_RULES_KEY).mkdir(parents=True)
+        (source / FALCO_CUSTOM_RULES_KEY / "a.yaml").write_text("- rule: a")
+        custom_setting = FalcoCustomSetting(mock_falco_layout)
+        custom_setting._sync(source)
+        current = mock_falco_layout.current_dir.resolve()
+
+        with patch.object(custom_setting.generations, "stage") as mock_stage:
+            changes = custom_setting._sync(source)
+
+        assert not changes
+        mock_stage.assert_not_called()
+        assert mock_falco_layout.current_dir.resolve() == current
+
+    def test_sync_error_keeps_generation(self, mock_falco_layout, tmp_path):
+        """Test a failed sync discards the staged generation and keeps the active one."""
+        source = tmp_path / "source"
+        (source / FALCO_CUSTOM_RULES_KEY).mkdir(parents=True)
+        (source / FALCO_CUSTOM_RULES_KEY / "a.yaml").write_text("- rule: a")
+        custom_setting = FalcoCustomSetting(mock_falco_layout)
+        current = mock_falco_layout.current_dir.resolve()
+
+        with (
+            patch("sync.TreeSync._write", side_effect=PermissionError("denied")),
+            pytest.raises(service.SyncError),
+        ):
+            custom_setting._sync(source)
+
+        assert mock_falco_layout.current_dir.resolve() == current
+        assert not (mock_falco_layout.generations_dir / "staging").exists()
+
+
+@pytest.fixture
+def fake_falco(mock_falco_layout):
+    """Replace the Falco binary with a script rejecting rules files containing "invalid".
+
+    The script logs its invocations, and a file is only accepted if the rules it uses are defined
+    in a file validated before it in the same invocation.
+    """
+    log_file = mock_falco_layout.home / "falco.log"
+    mock_falco_layout.cmd.write_text(
+        "#!/bin/sh\n"
+        f'echo "$@" >> {log_file}\n'
+        "defined=''\n"
+        "while [ $# -gt 0 ]; do\n"
+        '  if [ "$1" = "-V" ]; then\n'
+        '    grep -q invalid "$2" && { echo "$2: Invalid rule"; exit 1; }\n'
+        '    need=$(sed -n "s/^use: //p" "$2")\n'
+        '    if [ -n "$need" ] && ! echo "$defined" | grep -q "$need"; then\n'
+        '      echo "$2: Undefined macro $need"; exit 1\n'
+        "    fi\n"
+        '    defined="$defined $(sed -n "s/^macro: //p" "$2")"\n'
+        "  fi\n"
+        "  shift\n"
+        "done\n"
+    )
+    mock_falco_layout.cmd.chmod(0o755)
+    return log_file
+
+
+class TestFalcoRulesValidator:
+    """Test FalcoRulesValidator class."""
+
+    def test_validate_valid_files(self, mock_falco_layout, fake_falco, tmp_path):
+        """Test valid files pass, each validated once with the plugins loaded."""
+        (tmp_path / "a.yaml").write_text("- rule: a")
+        (tmp_path / "b.yaml").write_text("- rule: b")
+        validator = FalcoRulesValidator(mock_falco_layout)
+
+        validator.validate(tmp_path)
+
+        invocations = fake_falco.read_text().splitlines()
+        assert len(invocations) == 2
+        assert all("load_plugins[0]=json" in invocation for invocation in invocations)
+        assert all(f"-c {mock_falco_layout.config_file}" in line for line in invocations)
+
+    def test_validate_with_selected_plugins(self, mock_falco_layout, fake_falco, tmp_path):
+        """Test the files are validated again with the plugins the service loads."""
+        (tmp_path / "a.yaml").write_text("- rule: a")
+        validator = FalcoRulesValidator(mock_falco_layout)
+        validator.validate(tmp_path)
+
+        validator.plugins = ["container"]
+        validator.validate(tmp_path)
+
+        invocations = fake_falco.read_text().splitlines()
+        assert len(invocations) == 2
+        assert "load_plugins[0]=container" in invocations[-1]
+        assert "k8saudit" not in invocations[-1]
+
+    def test_validate_uses_cache(self, mock_falco_layout, fake_falco, tmp_path):
+        """Test only changed files are validated again."""
+        (tmp_path / "a.yaml").write_text("- rule: a")
+        (tmp_path / "b.yaml").write_text("- rule: b")
+        validator = FalcoRulesValidator(mock_falco_layout)
+        validator.validate(tmp_path)
+
+        (tmp_path / "b.yaml").write_text("- rule: b2")
+        validator.validate(tmp_path)
+
+        invocations = fake_falco.read_text().splitlines()
+        assert len(invocations) == 3
+        assert invocations[-1].endswith(f"-V {tmp_path / 'b.yaml'}")
+
+    def test_validate_invalid_file(self, mock_falco_layout, fake_falco, tmp_path):
+        """Test an invalid file is named in the error, and the result is cached."""
+        (tmp_path / "a.yaml").write_text("- rule: a")
+        (tmp_path / "b.yaml").write_text("invalid")
+        validator = FalcoRulesValidator(mock_falco_layout)
+
+        with pytest.raises(FalcoRulesValidationError, match="Invalid rule") as exc_info:
+            validator.validate(tmp_path)
+        assert exc_info.value.file_name == "b.yaml"
+        invocations = len(fake_falco.read_text().splitlines())
+
+        with pytest.raises(FalcoRulesValidationError):
+            validator.validate(tmp_path)
+        assert len(fake_falco.read_text().splitlines()) == invocations
+
+    def test_validate_dependent_files(self, mock_falco_layout, fake_falco, tmp_path):
+        """Test a file using a macro defined in another file is valid in the whole set."""
+        (tmp_path / "a.yaml").write_text("macro: shell")
+        (tmp_path / "b.yaml").write_text("use: shell")
+        validator = FalcoRulesValidator(mock_falco_layout)
+
+        validator.validate(tmp_path)
+
+        assert (
+            fake_falco.read_text()
+            .splitlines()[-1]
+            .endswith(f"-V {tmp_path / 'a.yaml'} -V {tmp_path / 'b.yaml'}")
+        )
+
+    def test_validate_with_staged_configs(self, mock_falco_layout, fake_falco, tmp_path):
+        """Test the files are validated with the config overrides they are activated with."""
+        (tmp_path / "a.yaml").write_text("- rule: a")
+        configs_dir = tmp_path / "config.override.d"
+        configs_dir.mkdir()
+        validator = FalcoRulesValidator(mock_falco_layout)
+        validator.validate(tmp_path, configs_dir)
+
+        (configs_dir / "a.yaml").write_text("json_output: true\n")
+        validator.validate(tmp_path, configs_dir)
+
+        config_file = mock_falco_layout.state_dir / FalcoRulesValidator.config_file_name
+        assert f"  - {configs_dir}\n" in config_file.read_text()
+        invocations = fake_falco.read_text().splitlines()
+        assert len(invocations) == 2
+        assert all(f"-c {config_file}" in line for line in invocations)
+
+    def test_invalid_rules_keep_active_generation(self, mock_falco_layout, fake_falco, tmp_path):
+        """Test custom settings with an invalid rules file are not activated."""
+        source = tmp_path / "source"
+        (source / FALCO_CUSTOM_RULES_KEY).mkdir(parents=True)
+        (source / FALCO_CUSTOM_RULES_KEY / "a.yaml").write_text("invalid")
+        custom_setting = FalcoCustomSetting(
+            mock_falco_layout, FalcoRulesValidator(mock_falco_layout)
+        )
+        current = mock_falco_layout.current_dir.resolve()
+
+        with pytest.raises(FalcoRulesValidationError):
+            custom_setting._sync(source)
+
+        assert mock_falco_layout.current_dir.resolve() == current
+        assert not (mock_falco_layout.rules_dir / "a.yaml").exists()
+
+
+class TestCharmMetricsService:
+    """Test CharmMetricsService class."""
+
+    @patch("service.systemd")
+    def test_install(self, mock_systemd, tmp_path, monkeypatch):
+        """Test the charm metrics service serves the metrics directory on the loopback."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        metrics_service = CharmMetricsService(HookMetrics(tmp_path / "state"), 8766)
+        metrics_service.unit_file.destination = tmp_path / "falco-charm-metrics.service"
+
+        metrics_service.install()
+
+        unit = metrics_service.unit_file.destination.read_text()
+        assert f"--directory {tmp_path / 'state' / 'metrics'}" in unit
+        assert "http.server 8766 --bind 127.0.0.1" in unit
+        assert (tmp_path / "state" / "metrics").is_dir()
+        mock_systemd.service_enable.assert_called_once_with(CHARM_METRICS_SERVICE_NAME)
+        mock_systemd.service_restart.assert_called_once_with(CHARM_METRICS_SERVICE_NAME)
+
+    @patch("service.systemd")
+    def test_remove(self, mock_systemd, tmp_path, monkeypatch):
+        """Test removing the charm metrics service stops it and removes its unit."""
+        monkeypatch.chdir(Path(__file__).parents[2])
+        metrics_service = CharmMetricsService(HookMetrics(tmp_path / "state"), 8766)
+        metrics_service.unit_file.destination = tmp_path / "falco-charm-metrics.service"
+        metrics_service.unit_file.destination.touch()
+
+        metrics_service.remove()
+
+        assert not metrics_service.unit_file.destination.exists()
+        mock_systemd.service_stop.assert_called_once_with(CHARM_METRICS_SERVICE_NAME)
+        mock_systemd.service_disable.assert_called_once_with(CHARM_METRICS_SERVICE_NAME)
@@ -12,6 +12,8 @@ from pydantic import AnyUrl
 
 from charm import Falco
 from config import InvalidCharmConfigError
+from rollout import Rollout
+from state import PAYLOAD_PROFILES, FalcoMetrics
 
 
 class TestCharmState:
@@ -65,3 +67,145 @@ class TestCharmState:
             charm = manager.charm
             with pytest.raises(InvalidCharmConfigError):
                 _ = charm.state  # trigger the load of state
+
+    @patch("charm.FalcoService")
+    def test_charm_state_engine_overrides(self, mock_service, mock_charm_dir, mock_falco_layout):
+        """Test only the engine settings set in the config are overridden."""
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state = ops.testing.State(config={"buf-size-preset": 7, "snaplen": 64})
+
+        with context(context.on.install(), state) as manager:
+            charm = manager.charm
+            assert charm.state.engine_overrides == {"buf_size_preset": 7, "snaplen": 64}
+
+    @patch("charm.FalcoService")
+    def test_charm_state_metrics(self, mock_service, mock_charm_dir, mock_falco_layout):
+        """Test the scrape-first metrics mode turns the metrics output rule off."""
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state = ops.testing.State(
+            config={
+                "metrics-interval": "1m",
+                "metrics-counters": "kernel_event_counters, kernel_event_counters_per_cpu",
+                "metrics-mode": "scrape-first",
+            }
+        )
+
+        with context(context.on.install(), state) as manager:
+            charm = manager.charm
+            assert charm.state.metrics == FalcoMetrics(
+                interval="1m",
+                output_rule=False,
+                counters=["kernel_event_counters", "kernel_event_counters_per_cpu"],
+            )
+
+    @patch("charm.FalcoService")
+    def test_charm_state_outputs(self, mock_service, mock_charm_dir, mock_falco_layout):
+        """Test the http sink is only enabled with an http endpoint, falling back to syslog."""
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        relation = ops.testing.Relation(
+            endpoint="http-endpoint",
+            interface="http_endpoint",
+            remote_app_data={"url": '"http://127.0.0.1:8080/"'},
+        )
+
+        state = ops.testing.State(config={"outputs": "http,stdout"})
+        with context(context.on.install(), state) as manager:
+            assert manager.charm.state.outputs == ["stdout"]
+
+        state = ops.testing.State(config={"outputs": "http"})
+        with context(context.on.install(), state) as manager:
+            assert manager.charm.state.outputs == ["syslog"]
+
+        state = ops.testing.State(config={"outputs": "http"}, relations=[relation])
+        with context(context.on.install(), state) as manager:
+            assert manager.charm.state.outputs == ["http"]
+
+    @patch("charm.FalcoService")
+    def test_charm_state_http_output_ca(self, mock_service, mock_charm_dir, mock_falco_layout):
+        """Test the http output carries the CA sent by falcosidekick with its url."""
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        relation = ops.testing.Relation(
+            endpoint="http-endpoint",
+            interface="http_endpoint",
+            remote_app_data={
+                "url": '"https://127.0.0.1:8080/"',
+                "ca": '"-----BEGIN CERTIFICATE-----\\n"',
+            },
+        )
+        state = ops.testing.State(config={"http-output-keep-alive": True}, relations=[relation])
+
+        with context(context.on.install(), state) as manager:
+            charm = manager.charm
+            assert charm.state.http_output == {
+                "url": "https://127.0.0.1:8080/",
+                "ca": "-----BEGIN CERTIFICATE-----\n",
+            }
+            assert charm.state.http_output_keep_alive
+            assert not charm.state.http_output_compress_uploads
+
+    @patch("charm.FalcoService")
+    def test_charm_state_plugins(
+        self, mock_service, mock_charm_dir, mock_falco_layout, tmp_path, monkeypatch
+    ):
+        """Test the plugins are detected on the machine, and loaded with their dependencies."""
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        apiserver = tmp_path / "kube-apiserver.yaml"
+        monkeypatch.setattr("state.KUBE_APISERVER_PATHS", (apiserver,))
+
+        with context(context.on.install(), ops.testing.State()) as manager:
+            assert manager.charm.state.plugins == ["json", "k8saudit", "container"]
+
+        state = ops.testing.State(config={"plugins": "auto"})
+        with context(context.on.install(), state) as manager:
+            assert manager.charm.state.plugins == ["container"]
+
+        apiserver.touch()
+        with context(context.on.install(), state) as manager:
+            assert manager.charm.state.plugins == ["json", "k8saudit", "container"]
+
+        state = ops.testing.State(config={"plugins": "k8saudit"})
+        with context(context.on.install(), state) as manager:
+            assert manager.charm.state.plugins == ["json", "k8saudit"]
+
+        state = ops.testing.State(config={"plugins": ""})
+        with context(context.on.install(), state) as manager:
+            assert manager.charm.state.plugins == []
+
+    @patch("charm.FalcoService")
+    def test_charm_state_payload(self, mock_service, mock_charm_dir, mock_falco_layout):
+        """Test the payload settings follow the payload profile."""
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        state = ops.testing.State(config={"payload-profile": "fields-only"})
+
+        with context(context.on.install(), state) as manager:
+            charm = manager.charm
+            assert charm.state.payload == PAYLOAD_PROFILES["fields-only"]
+            assert not charm.state.payload.output
+            assert charm.state.payload.output_fields
+
+    @patch("charm.FalcoService")
+    def test_charm_state_custom_config_rollout(
+        self, mock_service, mock_charm_dir, mock_falco_layout
+    ):
+        """Test the staged rollout ranks the units by number, with the leader rollout."""
+        context = ops.testing.Context(charm_type=Falco, charm_root=mock_charm_dir)
+        rollout = Rollout(revision="a", step=1)
+        peers = ops.testing.PeerRelation(
+            endpoint="falco-peers",
+            local_app_data={"custom-config-rollout": rollout.model_dump_json()},
+            peers_data={10: {}, 2: {}},
+        )
+        state = ops.testing.State(
+            config={"custom-config-rollout": "staged", "custom-config-rollout-steps": "50,100"},
+            relations=[peers],
+        )
+
+        with context(context.on.install(), state) as manager:
+            plan = manager.charm.state.custom_config_rollout
+            assert plan.units == ["falco/0", "falco/2", "falco/10"]
+            assert plan.steps == [50, 100]
+            assert plan.rollout == rollout
+
+        state = ops.testing.State(relations=[peers])
+        with context(context.on.install(), state) as manager:
+            assert manager.charm.state.custom_config_rollout is None
@@ -0,0 +1,227 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the tree sync module."""
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from rules import rules_files
+from sync import ChangeSet, Generations, SyncError, TreeSync, write_file_atomic
+
+
+@pytest.fixture
+def source(tmp_path):
+    """Create a source directory with rules files."""
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.yaml").write_text("- rule: a")
+    (source / "b.yaml").write_text("- rule: b")
+    return source
+
+
+@pytest.fixture
+def tree_sync(tmp_path):
+    """Create a tree sync to a destination directory."""
+    return TreeSync(
+        tmp_path / "destination", tmp_path / "manifest.json", exclude=("zz-managed.yaml",)
+    )
+
+
+class TestTreeSync:
+    """Test TreeSync class."""
+
+    def test_sync_adds_files(self, tree_sync, source):
+        """Test the first sync adds the source files."""
+        changes = tree_sync.sync(source)
+
+        assert changes == ChangeSet(added=["a.yaml", "b.yaml"])
+        assert sorted(p.name for p in tree_sync.destination.iterdir()) == ["a.yaml", "b.yaml"]
+        assert (tree_sync.destination / "a.yaml").read_text() == "- rule: a"
+
+    def test_sync_unchanged(self, tree_sync, source):
+        """Test syncing an unchanged source does not write anything."""
+        tree_sync.sync(source)
+        manifest_mtime = tree_sync.manifest_file.stat().st_mtime_ns
+
+        with patch.object(tree_sync, "_write") as mock_write:
+            changes = tree_sync.sync(source)
+
+        assert not changes
+        mock_write.assert_not_called()
+        assert tree_sync.manifest_file.stat().st_mtime_ns == manifest_mtime
+
+    def test_sync_modifies_and_removes_files(self, tree_sync, source):
+        """Test the sync mirrors modified and removed source files."""
+        tree_sync.sync(source)
+        (source / "a.yaml").write_text("- rule: a2")
+        (source / "b.yaml").unlink()
+
+        changes = tree_sync.sync(source)
+
+        assert changes == ChangeSet(modified=["a.yaml"], removed=["b.yaml"])
+        assert (tree_sync.destination / "a.yaml").read_text() == "- rule: a2"
+        assert not (tree_sync.destination / "b.yaml").exists()
+
+    def test_sync_repairs_tampered_destination(self, tree_sync, source):
+        """Test the sync rewrites a destination file modified outside the sync."""
+        tree_sync.sync(source)
+        tampered = tree_sync.destination / "a.yaml"
+        tampered.write_text("- rule: tampered")
+        os.utime(tampered, ns=(0, 0))
+
+        changes = tree_sync.sync(source)
+
+        assert changes == ChangeSet(modified=["a.yaml"])
+        assert tampered.read_text() == "- rule: a"
+
+    def test_sync_nested_files(self, tree_sync, source):
+        """Test the sync copies the files of any name in nested directories, like rsync."""
+        (source / "extra").mkdir()
+        (source / "extra/c.yml").write_text("- rule: c")
+        (source / "README.md").write_text("notes")
+
+        changes = tree_sync.sync(source)
+
+        assert changes == ChangeSet(added=["README.md", "a.yaml", "b.yaml", "extra/c.yml"])
+        assert (tree_sync.destination / "extra/c.yml").read_text() == "- rule: c"
+
+        (source / "extra/c.yml").unlink()
+        changes = tree_sync.sync(source)
+
+        assert changes == ChangeSet(removed=["extra/c.yml"])
+        assert not (tree_sync.destination / "extra").exists()
+
+    def test_sync_none_empties_destination(self, tree_sync, source):
+        """Test syncing no source removes the synced files but the excluded and other files."""
+        tree_sync.sync(source)
+        (tree_sync.destination / "zz-managed.yaml").write_text("managed")
+        (tree_sync.destination / "notes.txt").write_text("other")
+
+        changes = tree_sync.sync(None)
+
+        assert changes == ChangeSet(removed=["a.yaml", "b.yaml"])
+        assert sorted(p.name for p in tree_sync.destination.iterdir()) == [
+            "notes.txt",
+            "zz-managed.yaml",
+        ]
+        assert tree_sync.manifest == {}
+
+    def test_sync_removes_loaded_files(self, source, tmp_path):
+        """Test syncing removes the files the consumer loads, even if not written by the sync."""
+        tree_sync = TreeSync(
+            tmp_path / "destination", tmp_path / "manifest.json", loaded=rules_files
+        )
+        tree_sync.destination.mkdir()
+        (tree_sync.destination / "old.yml").write_text("- rule: old")
+        (tree_sync.destination / "nested").mkdir()
+        (tree_sync.destination / "nested/other.yaml").write_text("other")
+
+        changes = tree_sync.sync(source)
+
+        assert changes == ChangeSet(added=["a.yaml", "b.yaml"], removed=["old.yml"])
+        assert (tree_sync.destination / "nested/other.yaml").is_file()
+
+    def test_sync_missing_source_empties_destination(self, tree_sync, source, tmp_path):
+        """Test syncing a missing source directory removes the synced files."""
+        tree_sync.sync(source)
+
+        changes = tree_sync.sync(tmp_path / "missing")
+
+        assert changes.removed == ["a.yaml", "b.yaml"]
+
+    def test_sync_write_error(self, tree_sync, source):
+        """Test the sync raises SyncError when writing fails."""
+        with (
+            patch.object(tree_sync, "_write", side_effect=PermissionError("denied")),
+            pytest.raises(SyncError),
+        ):
+            tree_sync.sync(source)
+
+    def test_digest(self, tree_sync, source):
+        """Test the digest follows the synced content."""
+        empty_digest = tree_sync.digest()
+        tree_sync.sync(source)
+        digest = tree_sync.digest()
+
+        assert digest != empty_digest
+        tree_sync.sync(source)
+        assert tree_sync.digest() == digest
+        (source / "b.yaml").write_text("- rule: b2")
+        tree_sync.sync(source)
+        assert tree_sync.digest() != digest
+
+
+def test_change_set_add():
+    """Test merging change sets."""
+    merged = ChangeSet(added=["a.yaml"]) + ChangeSet(removed=["b.yaml"])
+
+    assert merged == ChangeSet(added=["a.yaml"], removed=["b.yaml"])
+    assert merged
+    assert not ChangeSet()
+
+
+class TestGenerations:
+    """Test Generations class."""
+
+    @pytest.fixture
+    def generations(self, tmp_path):
+        """Create generations keeping two of them."""
+        return Generations(tmp_path / "generations", tmp_path / "current", keep=2)
+
+    def _activate(self, generations, content):
+        """Stage and activate a generation holding a file with the given content."""
+        staged = generations.stage()
+        write_file_atomic(staged / "a.yaml", content.encode())
+        return generations.activate(staged)
+
+    def test_ensure(self, generations):
+        """Test ensure creates the first generation and links it."""
+        current = generations.ensure(("rules.d",))
+
+        assert current == generations.directory / "0"
+        assert (generations.link / "rules.d").is_dir()
+        assert generations.current == current
+
+    def test_activate_swaps_link(self, generations):
+        """Test activating a staged generation swaps the link, leaving the previous untouched."""
+        first = self._activate(generations, "first")
+        second = self._activate(generations, "second")
+
+        assert generations.current == second
+        assert (generations.link / "a.yaml").read_text() == "second"
+        assert (first / "a.yaml").read_text() == "first"
+
+    def test_activate_prunes_old_generations(self, generations):
+        """Test activating keeps the configured number of generations."""
+        for content in ("first", "second", "third"):
+            last = self._activate(generations, content)
+
+        assert [generation.name for generation in generations.list()] == ["2", "3"]
+        assert generations.current == last
+
+    def test_rollback(self, generations):
+        """Test rolling back activates the previous generation."""
+        first = self._activate(generations, "first")
+        self._activate(generations, "second")
+
+        assert generations.rollback() == first
+        assert (generations.link / "a.yaml").read_text() == "first"
+
+    def test_rollback_without_previous_generation(self, generations):
+        """Test rolling back fails when there is no previous generation."""
+        generations.ensure()
+
+        with pytest.raises(SyncError):
+            generations.rollback()
+
+    def test_stage_discards_leftover(self, generations):
+        """Test staging drops a staged generation left over by an interrupted sync."""
+        staged = generations.stage()
+        (staged / "leftover.yaml").write_text("leftover")
+
+        staged = generations.stage()
+
+        assert not (staged / "leftover.yaml").exists()
@@ -0,0 +1,255 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the Falco engine tuning module."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+
+import pytest
+
+import tuning
+from tuning import EngineTuner, HostProfile, derive_tuning
+
+GIB = 1024**3
+
+
+class TestDeriveTuning:
+    """Test derive_tuning function."""
+
+    def test_small_host(self):
+        """Test a small host shares a single small buffer and a smaller thread table."""
+        result = derive_tuning(HostProfile(cpus=2, memory_bytes=2 * GIB, pid_max=4194304))
+
+        assert result.cpus_for_each_buffer == 2
+        assert result.buf_size_preset == 3
+        assert result.thread_table_size == 65536
+        assert result.snaplen == 80
+
+    def test_large_host(self):
+        """Test a large host gets larger buffers and the largest thread table."""
+        result = derive_tuning(HostProfile(cpus=128, memory_bytes=512 * GIB, pid_max=4194304))
+
+        assert result.cpus_for_each_buffer == 2
+        assert result.buf_size_preset == 6
+        assert result.thread_table_size == 262144
+
+    @pytest.mark.parametrize(
+        "syscall_rate, expected_preset",
+        [
+            pytest.param(1000.0, 1, id="idle"),
+            pytest.param(100000.0, 4, id="busy"),
+            pytest.param(1000000.0, 7, id="very busy"),
+        ],
+    )
+    def test_syscall_rate(self, syscall_rate, expected_preset):
+        """Test the buffers are sized to hold two seconds of the observed events."""
+        result = derive_tuning(
+            HostProfile(cpus=16, memory_bytes=64 * GIB, pid_max=32768, syscall_rate=syscall_rate)
+        )
+
+        # 8 buffers, each receiving an eighth of the events of 200 bytes
+        assert result.buf_size_preset == expected_preset
+        assert result.snaplen == 80
+
+    def test_memory_cap_reduces_snaplen(self):
+        """Test the buffers stay within the memory cap, and the snaplen shrinks instead."""
+        result = derive_tuning(
+            HostProfile(cpus=4, memory_bytes=1 * GIB, pid_max=32768, syscall_rate=500000.0)
+        )
+
+        # A single buffer within 2% of 1 GiB
+        assert result.buf_size_preset == 5
+        assert result.snaplen == 32
+
+    def test_memory_cap_snaplen_steps(self):
+        """Test the reduced snaplen is rounded down to a multiple of 16 bytes."""
+        result = derive_tuning(
+            HostProfile(cpus=2, memory_bytes=2 * GIB, pid_max=32768, syscall_rate=90000.0)
+        )
+
+        assert result.snaplen == 64
+
+
+class TestEngineTuner:
+    """Test EngineTuner class."""
+
+    @patch.object(tuning, "scrape_counters", return_value={})
+    def test_tune_records_profile(self, _, tmp_path):
+        """Test the profile, derived settings, overrides and applied settings are recorded."""
+        tuner = EngineTuner(tmp_path, 8765)
+
+        result = tuner.tune({"snaplen": 256})
+
+        record = json.loads((tmp_path / EngineTuner.file_name).read_text())
+        assert result.snaplen == 256
+        assert record["derived"]["snaplen"] == 80
+        assert record["overrides"] == {"snaplen": 256}
+        assert record["applied"] == result.model_dump()
+        assert record["host"]["syscall_rate"] is None
+
+    @patch.object(tuning, "time")
+    @patch.object(tuning, "scrape_counters")
+    def test_profile_syscall_rate(self, mock_scrape, mock_time, tmp_path):
+        """Test the syscall rate is measured between samples, and kept when unavailable."""
+        tuner = EngineTuner(tmp_path, 8765)
+
+        mock_scrape.return_value = {tuning.EVENTS_METRIC: 1000.0}
+        mock_time.time.return_value = 100.0
+        assert tuner.tune() and tuner.profile().syscall_rate is None
+        mock_scrape.return_value = {tuning.EVENTS_METRIC: 31000.0}
+        mock_time.time.return_value = 110.0
+        tuner.tune()
+        assert json.loads(tuner.path.read_text())["host"]["syscall_rate"] == 3000.0
+        mock_scrape.return_value = {}
+        tuner.tune()
+        assert json.loads(tuner.path.read_text())["host"]["syscall_rate"] == 3000.0
+
+    @patch.object(tuning, "time")
+    @patch.object(tuning, "scrape_counters")
+    def test_profile_syscall_rate_hysteresis(self, mock_scrape, mock_time, tmp_path):
+        """Test small syscall rate changes keep the recorded rate and the applied settings."""
+        tuner = EngineTuner(tmp_path, 8765)
+        applied, events = [], 0.0
+        for now, rate in enumerate((90000.0, 90000.0, 95000.0, 100000.0, 40000.0)):
+            events += rate
+            mock_scrape.return_value = {tuning.EVENTS_METRIC: events}
+            mock_time.time.return_value = float(now)
+            applied.append(tuner.tune())
+
+        assert applied[1] == applied[2] == applied[3]
+        assert json.loads(tuner.path.read_text())["host"]["syscall_rate"] == 40000.0
+
+    @patch.object(tuning, "scrape_counters", return_value={})
+    def test_tune_record_write_error(self, _, tmp_path):
+        """Test failing to record the tuning does not fail the tuning."""
+        (tmp_path / "file").touch()
+        tuner = EngineTuner(tmp_path / "file", 8765)
+
+        assert tuner.tune().snaplen == 80
+
+
+class TestEngineTunerStep:
+    """Test the drop feedback loop of EngineTuner class."""
+
+    @staticmethod
+    def _sample(tuner, mock_scrape, mock_time, now, events, drops):
+        mock_scrape.return_value = {tuning.EVENTS_METRIC: events, tuning.DROPS_METRIC: drops}
+        mock_time.time.return_value = now
+        return tuner.step()
+
+    @patch.object(tuning, "time")
+    @patch.object(tuning, "scrape_counters")
+    def test_step_up_on_drops(self, mock_scrape, mock_time, tmp_path):
+        """Test the preset is stepped up when Falco drops events, and applied by the tuning."""
+        tuner = EngineTuner(tmp_path, 8765)
+        mock_scrape.return_value = {}
+        derived = tuner.tune().buf_size_preset
+
+        assert not self._sample(tuner, mock_scrape, mock_time, 1000.0, 0.0, 0.0)
+        assert not self._sample(tuner, mock_scrape, mock_time, 1300.0, 1e6, 10.0)
+        assert self._sample(tuner, mock_scrape, mock_time, 1600.0, 2e6, 5000.0)
+
+        mock_scrape.return_value = {}
+        assert tuner.tune().buf_size_preset == derived + 1
+        record = json.loads(tuner.path.read_text())
+        assert record["adjustment"] == 1
+        assert record["window"] == []
+
+    @patch.object(tuning, "time")
+    @patch.object(tuning, "scrape_counters")
+    def test_step_down_after_a_day_without_drops(self, mock_scrape, mock_time, tmp_path):
+        """Test the preset is stepped back down to the derived one after a day without drops."""
+        tuner = EngineTuner(tmp_path, 8765)
+        mock_scrape.return_value = {}
+        derived = tuner.tune().buf_size_preset
+        self._sample(tuner, mock_scrape, mock_time, 0.0, 0.0, 0.0)
+        assert self._sample(tuner, mock_scrape, mock_time, 600.0, 1e6, 5000.0)
+        mock_scrape.return_value = {}
+        tuner.tune()
+
+        assert not self._sample(tuner, mock_scrape, mock_time, 3600.0, 0.0, 0.0)
+        assert not self._sample(tuner, mock_scrape, mock_time, 4200.0, 1e6, 0.0)
+        assert not self._sample(tuner, mock_scrape, mock_time, 86000.0, 3e6, 0.0)
+        assert not self._sample(tuner, mock_scrape, mock_time, 86500.0, 4e6, 0.0)
+        assert self._sample(tuner, mock_scrape, mock_time, 87100.0, 5e6, 0.0)
+        mock_scrape.return_value = {}
+        assert tuner.tune().buf_size_preset == derived
+        # Never below the derived preset
+        self._sample(tuner, mock_scrape, mock_time, 200000.0, 0.0, 0.0)
+        assert not self._sample(tuner, mock_scrape, mock_time, 200600.0, 1e6, 0.0)
+
+    @patch.object(tuning, "time")
+    @patch.object(tuning, "scrape_counters")
+    def test_step_within_bounds(self, mock_scrape, mock_time, tmp_path):
+        """Test the preset is not stepped above the upper bound, nor when overridden."""
+        tuner = EngineTuner(tmp_path, 8765)
+        mock_scrape.return_value = {}
+        assert tuner.tune(bounds=(2, 2)).buf_size_preset == 2
+
+        self._sample(tuner, mock_scrape, mock_time, 0.0, 0.0, 0.0)
+        assert not self._sample(tuner, mock_scrape, mock_time, 600.0, 1e6, 5000.0)
+        mock_scrape.return_value = {}
+        tuner.tune({"buf_size_preset": 1})
+        self._sample(tuner, mock_scrape, mock_time, 1000.0, 0.0, 0.0)
+        assert not self._sample(tuner, mock_scrape, mock_time, 1600.0, 1e6, 5000.0)
+
+    @patch.object(tuning, "time")
+    @patch.object(tuning, "scrape_counters")
+    def test_step_forgets_samples_before_restart(self, mock_scrape, mock_time, tmp_path):
+        """Test the drop window restarts when the Falco counters restart."""
+        tuner = EngineTuner(tmp_path, 8765)
+        mock_scrape.return_value = {}
+        tuner.tune()
+
+        self._sample(tuner, mock_scrape, mock_time, 0.0, 1e6, 5000.0)
+        assert not self._sample(tuner, mock_scrape, mock_time, 600.0, 1e3, 0.0)
+        assert len(json.loads(tuner.path.read_text())["window"]) == 1
+
+    @patch.object(tuning, "scrape_counters", return_value={})
+    def test_step_without_metrics(self, _, tmp_path):
+        """Test the preset is not stepped when the Falco metrics are not available."""
+        tuner = EngineTuner(tmp_path, 8765)
+        tuner.tune()
+
+        assert not tuner.step()
+
+
+def test_scrape_counters_unavailable():
+    """Test scraping counters without a Falco webserver returns no counters."""
+    assert tuning.scrape_counters(1, (tuning.EVENTS_METRIC,)) == {}
+
+
+def test_scrape_counters():
+    """Test scraping counters sums them over their labels, and skips the other metrics."""
+    metrics = (
+        b"# TYPE falcosecurity_scap_n_drops_total counter\n"
+        b'falcosecurity_scap_n_drops_total{raw_name="n_drops"} 3\n'
+        b'falcosecurity_scap_n_drops_total{raw_name="n_drops_buffer"} 4\n'
+        b"falcosecurity_scap_n_drops_total_other 100\n"
+        b"falcosecurity_scap_n_evts_total 1000\n"
+    )
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(metrics)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.handle_request)
+    thread.start()
+    try:
+        counters = tuning.scrape_counters(
+            server.server_address[1], (tuning.EVENTS_METRIC, tuning.DROPS_METRIC)
+        )
+    finally:
+        thread.join()
+        server.server_close()
+
+    assert counters == {tuning.EVENTS_METRIC: 1000.0, tuning.DROPS_METRIC: 7.0}
@@ -80,6 +80,15 @@ class TlsCertificateRequirer:
 
         return update_required
 
+    def get_ca(self) -> Optional[str]:
+        """Get the CA certificate signing the assigned certificate.
+
+        Returns:
+            The PEM encoded CA certificate, or None if no certificate is assigned.
+        """
+        cert, _ = self._get_assigned_cert_and_key()
+        return str(cert.ca) if cert else None
+
     def _get_assigned_cert_and_key(
         self,
     ) -> tuple[Optional[ProviderCertificate], Optional[PrivateKey]]:
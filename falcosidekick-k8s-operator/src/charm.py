@@ -90,6 +90,9 @@ class FalcosidekickCharm(CharmBaseWithState):
         self.framework.observe(
             self.on[HTTP_ENDPOINT_RELATION_NAME].relation_changed, self.reconcile
         )
+        self.framework.observe(
+            self.on[HTTP_ENDPOINT_RELATION_NAME].relation_broken, self.reconcile
+        )
 
         self.framework.observe(self.on[CERTIFICATE_RELATION_NAME].relation_broken, self.reconcile)
         self.framework.observe(self.on[CERTIFICATE_RELATION_NAME].relation_changed, self.reconcile)
@@ -111,6 +114,7 @@ class FalcosidekickCharm(CharmBaseWithState):
                 self,
                 self.loki_push_api_consumer,
                 self.ingress_requirer,
+                self.http_endpoint_provider,
             )
         return self._state
 
@@ -11,6 +11,7 @@ from typing import Optional
 import ops
 from charms.loki_k8s.v1.loki_push_api import LokiPushApiConsumer
 from charms.traefik_k8s.v2.ingress import IngressPerAppRequirer
+from pfe.interfaces.falcosidekick_http_endpoint import HttpEndpointProvider
 from pydantic import BaseModel, HttpUrl, ValidationError
 
 from config import CharmConfig, InvalidCharmConfigError
@@ -30,6 +31,7 @@ class CharmState(BaseModel):
         falcosidekick_listenport: The port on which Falcosidekick listens.
         falcosidekick_loki_endpoint: The URL of the Loki push API endpoint.
         falcosidekick_loki_hostport: The host and port of the Loki push API endpoint.
+        falcosidekick_custom_fields: The fields Falcosidekick adds to every event.
     """
 
     enable_tls: bool
@@ -37,6 +39,7 @@ class CharmState(BaseModel):
     falcosidekick_listenport: int
     falcosidekick_loki_endpoint: str
     falcosidekick_loki_hostport: str
+    falcosidekick_custom_fields: dict[str, str] = {}
 
     @classmethod
     def from_charm(
@@ -44,6 +47,7 @@ class CharmState(BaseModel):
         charm: ops.CharmBase,
         loki_push_api_consumer: LokiPushApiConsumer,
         ingress_requirer: IngressPerAppRequirer,
+        http_endpoint_provider: HttpEndpointProvider,
     ) -> "CharmState":
         """Create a CharmState from a charm instance.
 
@@ -54,6 +58,7 @@ class CharmState(BaseModel):
             charm: The charm instance from which to extract state.
             loki_push_api_consumer: The LokiPushApiConsumer instance to get Loki relation data.
             ingress_requirer: The IngressPerAppRequirer instance to get ingress relation data.
+            http_endpoint_provider: The HttpEndpointProvider instance to get the Juju topologies.
 
         Returns:
             CharmState: A validated CharmState instance.
@@ -98,9 +103,39 @@ class CharmState(BaseModel):
             falcosidekick_listenport=charm_config.port,
             falcosidekick_loki_endpoint=loki_endpoint,
             falcosidekick_loki_hostport=loki_hostport,
+            falcosidekick_custom_fields=_get_topology_fields(http_endpoint_provider),
         )
 
 
+def _get_topology_fields(http_endpoint_provider: HttpEndpointProvider) -> dict[str, str]:
+    """Get the Juju topology fields to add to every event.
+
+    The Falco applications sending their topology through the relation only add the unit to
+    their events. The custom fields apply to the events of every related application and
+    override the fields of the events, so they are only set when all the related applications
+    send the same topology.
+
+    Args:
+        http_endpoint_provider: The HttpEndpointProvider instance to get the Juju topologies.
+
+    Returns:
+        The Juju topology fields, or no field when they would not apply to all the events.
+    """
+    relations = http_endpoint_provider.charm.model.relations[http_endpoint_provider.relation_name]
+    topologies = list(http_endpoint_provider.get_topologies().values())
+    if not topologies or len(topologies) < len(relations):
+        return {}
+    if any(topology != topologies[0] for topology in topologies):
+        logger.warning("Related applications send different topologies, not adding them")
+        return {}
+    return {
+        "juju_model": topologies[0].model,
+        "juju_model_uuid": topologies[0].model_uuid,
+        "juju_application": topologies[0].application,
+        "juju_charm": topologies[0].charm_name,
+    }
+
+
 class CharmBaseWithState(ops.CharmBase, ABC):
     """Base class for charms that maintain state.
 
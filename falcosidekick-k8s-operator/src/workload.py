@@ -220,8 +220,9 @@ class Falcosidekick:
                 "only one of [certificates|ingress] relation is required but not both or none"
             )
 
-        # Set http output information idempotently
-        http_endpoint_provider.update_config(**charm_state.http_endpoint_config)
+        # Set http output information idempotently, with the CA verifying the TLS endpoint
+        ca = tls_certificate_requirer.get_ca() if charm_state.enable_tls else None
+        http_endpoint_provider.update_config(**charm_state.http_endpoint_config, ca=ca)
 
         # Configure ingress idempotently
         ingress_requirer.provide_ingress_requirements(
@@ -0,0 +1,105 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Fixtures for the reconcile benchmarks."""
+
+import json
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+
+def _bytes_written() -> int:
+    """Get the number of bytes written by the process so far.
+
+    Returns:
+        The `wchar` counter of the process.
+    """
+    for line in Path("/proc/self/io").read_text(encoding="utf-8").splitlines():
+        if line.startswith("wchar:"):
+            return int(line.split()[1])
+    return 0
+
+
+class Benchmark:
+    """Recorder of the benchmark scenario measurements."""
+
+    def __init__(self, rounds: int) -> None:
+        """Initialize the recorder.
+
+        Args:
+            rounds: The number of times each scenario is run.
+        """
+        self.rounds = rounds
+        self.samples: dict[str, dict[str, list[float]]] = {}
+
+    @contextmanager
+    def measure(self, scenario: str):
+        """Measure the wall time, subprocesses spawned and bytes written by a scenario.
+
+        Args:
+            scenario: The scenario name.
+
+        Yields:
+            The list of the commands spawned by the scenario.
+        """
+        commands: list = []
+        popen = subprocess.Popen
+
+        class CountingPopen(popen):  # type: ignore[valid-type, misc]
+            def __init__(self, args, *other_args, **kwargs):
+                commands.append(args)
+                super().__init__(args, *other_args, **kwargs)
+
+        with patch("subprocess.Popen", CountingPopen):
+            bytes_written = _bytes_written()
+            start = time.perf_counter()
+            yield commands
+            wall_time = time.perf_counter() - start
+            bytes_written = _bytes_written() - bytes_written
+
+        samples = self.samples.setdefault(scenario, {})
+        samples.setdefault("wall_time_seconds", []).append(wall_time)
+        samples.setdefault("subprocesses", []).append(len(commands))
+        samples.setdefault("bytes_written", []).append(bytes_written)
+
+    def report(self, charm: str) -> dict:
+        """Summarize the measurements.
+
+        Args:
+            charm: The benchmarked charm name.
+
+        Returns:
+            The minimum, median and maximum of each measurement, by scenario.
+        """
+        return {
+            "charm": charm,
+            "python": platform.python_version(),
+            "rounds": self.rounds,
+            "scenarios": {
+                scenario: {
+                    name: {
+                        "min": min(values),
+                        "median": statistics.median(values),
+                        "max": max(values),
+                    }
+                    for name, values in samples.items()
+                }
+                for scenario, samples in self.samples.items()
+            },
+        }
+
+
+@pytest.fixture(scope="session")
+def benchmark(request):
+    """Record the benchmark measurements, and write them to the benchmark output file."""
+    recorder = Benchmark(request.config.getoption("--benchmark-rounds"))
+    yield recorder
+    output = Path(request.config.getoption("--benchmark-output"))
+    output.write_text(json.dumps(recorder.report("falcosidekick"), indent=2), encoding="utf-8")
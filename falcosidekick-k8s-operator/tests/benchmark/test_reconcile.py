@@ -0,0 +1,69 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Reconcile latency benchmarks for the Falcosidekick charm."""
+
+import dataclasses
+
+import ops
+from ops import testing
+
+from charm import FalcosidekickCharm
+from workload import Falcosidekick
+
+
+def test_reconcile(benchmark, monkeypatch):
+    """Benchmark the Falcosidekick charm reconciliation.
+
+    The scenarios are a cold install, a reconcile without changes, a change of the configuration
+    and a change of the Loki endpoint.
+    """
+    # The output states are chained, and the health check thresholds set by Pebble are not in
+    # the plan of the next input state
+    monkeypatch.setenv("SCENARIO_SKIP_CONSISTENCY_CHECKS", "1")
+    for _ in range(benchmark.rounds):
+        ctx = testing.Context(FalcosidekickCharm)
+        # mypy thinks this can_connect argument does not exist.
+        container = testing.Container(Falcosidekick.container_name, can_connect=True)  # type: ignore
+        loki_relation = testing.Relation(
+            endpoint="send-loki-logs",
+            interface="loki_push_api",
+            remote_units_data={0: {"endpoint": '{"url": "http://loki:3100/loki/api/v1/push"}'}},
+        )
+        state = testing.State(
+            containers=[container],  # type: ignore[list-item]
+            relations=[
+                loki_relation,
+                testing.Relation(endpoint="certificates", interface="tls_certificates"),
+                testing.Relation(endpoint="metrics-endpoint", interface="prometheus_scrape"),
+            ],
+        )
+
+        with benchmark.measure("cold_install"):
+            state = ctx.run(ctx.on.install(), state)
+            state = ctx.run(ctx.on.pebble_ready(container), state)
+            state = ctx.run(ctx.on.config_changed(), state)
+        assert state.unit_status == ops.ActiveStatus()
+
+        with benchmark.measure("noop_reconcile"):
+            state = ctx.run(ctx.on.config_changed(), state)
+
+        state = dataclasses.replace(state, config={"port": 8080})
+        with benchmark.measure("config_change"):
+            state = ctx.run(ctx.on.config_changed(), state)
+        assert state.unit_status == ops.ActiveStatus()
+
+        loki_relation = dataclasses.replace(
+            loki_relation,
+            remote_units_data={0: {"endpoint": '{"url": "http://loki-2:3100/loki/api/v1/push"}'}},
+        )
+        state = dataclasses.replace(
+            state,
+            relations=[
+                loki_relation if relation.id == loki_relation.id else relation
+                for relation in state.relations
+            ],
+        )
+        with benchmark.measure("endpoint_change"):
+            state = ctx.run(ctx.on.relation_changed(loki_relation, remote_unit=0), state)
+        assert state.unit_status == ops.ActiveStatus()
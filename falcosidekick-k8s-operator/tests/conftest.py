@@ -11,6 +11,19 @@ def pytest_addoption(parser):
         parser: Pytest parser.
     """
     parser.addoption("--charm-file", action="store")
+    parser.addoption(
+        "--benchmark-output",
+        action="store",
+        default="benchmark.json",
+        help="File to write the benchmark results to",
+    )
+    parser.addoption(
+        "--benchmark-rounds",
+        action="store",
+        type=int,
+        default=5,
+        help="Number of times each benchmark scenario is run",
+    )
     parser.addoption("--falcosidekick-image", action="store")
     parser.addoption(
         "--keep-models",
@@ -130,3 +130,23 @@ class TestTlsCertificateRequirer:
         # Assert - certificate not updated
         assert result is False
         mock_container.push.assert_not_called()
+
+    def test_get_ca(self, mock_get_assigned_certificate):
+        """Test get_ca returns the CA of the assigned certificate.
+
+        Arrange: Set up mock TLS requirer with an assigned certificate, and then without.
+        Act: Get the CA certificate.
+        Assert: The CA is returned only when a certificate is assigned.
+        """
+        # Arrange
+        mock_charm = MagicMock()
+        mock_charm.model.relations.get.return_value = [Mock()]
+        mock_get_assigned_certificate.return_value[0].ca = "mock ca"
+
+        tls_requirer = TlsCertificateRequirer(mock_charm, "certificates")
+
+        # Act and assert
+        assert tls_requirer.get_ca() == "mock ca"
+
+        mock_get_assigned_certificate.return_value = (None, None)
+        assert tls_requirer.get_ca() is None
@@ -6,6 +6,7 @@
 from unittest.mock import MagicMock
 
 import pytest
+from pfe.interfaces.falcosidekick_http_endpoint import HttpEndpointTopology
 from pydantic import ValidationError
 
 from config import CharmConfig, InvalidCharmConfigError
@@ -57,8 +58,13 @@ class TestCharmState:
         mock_ingress_requirer = MagicMock()
         mock_ingress_requirer.is_ready.return_value = False
 
+        mock_http_endpoint_provider = MagicMock()
+        mock_http_endpoint_provider.get_topologies.return_value = {}
+
         # Act
-        state = CharmState.from_charm(mock_charm, mock_loki_relation, mock_ingress_requirer)
+        state = CharmState.from_charm(
+            mock_charm, mock_loki_relation, mock_ingress_requirer, mock_http_endpoint_provider
+        )
 
         # Assert
         assert state.falcosidekick_listenport == port
@@ -95,9 +101,14 @@ class TestCharmState:
         mock_ingress_requirer = MagicMock()
         mock_ingress_requirer.is_ready.return_value = False
 
+        mock_http_endpoint_provider = MagicMock()
+        mock_http_endpoint_provider.get_topologies.return_value = {}
+
         # Act
         with pytest.raises(InvalidCharmConfigError) as exc_info:
-            CharmState.from_charm(mock_charm, mock_loki_relation, mock_ingress_requirer)
+            CharmState.from_charm(
+                mock_charm, mock_loki_relation, mock_ingress_requirer, mock_http_endpoint_provider
+            )
 
         # Assert
         assert "Invalid charm configuration: port" in str(exc_info.value)
@@ -124,9 +135,14 @@ class TestCharmState:
         mock_ingress_requirer = MagicMock()
         mock_ingress_requirer.is_ready.return_value = False
 
+        mock_http_endpoint_provider = MagicMock()
+        mock_http_endpoint_provider.get_topologies.return_value = {}
+
         # Act
         with pytest.raises(InvalidCharmConfigError) as exc_info:
-            CharmState.from_charm(mock_charm, mock_loki_relation, mock_ingress_requirer)
+            CharmState.from_charm(
+                mock_charm, mock_loki_relation, mock_ingress_requirer, mock_http_endpoint_provider
+            )
 
         # Assert
         # Error message should contain the invalid configuration message
@@ -151,11 +167,67 @@ class TestCharmState:
         mock_ingress_requirer = MagicMock()
         mock_ingress_requirer.is_ready.return_value = False
 
+        mock_http_endpoint_provider = MagicMock()
+        mock_http_endpoint_provider.get_topologies.return_value = {}
+
         # Act
-        state = CharmState.from_charm(mock_charm, mock_loki_relation, mock_ingress_requirer)
+        state = CharmState.from_charm(
+            mock_charm, mock_loki_relation, mock_ingress_requirer, mock_http_endpoint_provider
+        )
 
         # Assert
         assert state.falcosidekick_loki_endpoint == "/loki/api/v1/push"
         assert state.falcosidekick_loki_hostport == ""
         assert state.falcosidekick_listenport == 2801
         assert state.enable_tls is True
+
+    @pytest.mark.parametrize(
+        "applications, relation_count, expected_application",
+        [
+            pytest.param(["falco"], 1, "falco", id="all related applications agree"),
+            pytest.param(["falco"], 2, None, id="an application sends no topology"),
+            pytest.param(["falco", "falco-edge"], 2, None, id="applications disagree"),
+        ],
+    )
+    def test_from_charm_with_topologies(self, applications, relation_count, expected_application):
+        """Test CharmState.from_charm adds the topology only when it applies to all the events.
+
+        Arrange: Set up mock http endpoint provider with the topologies of related applications.
+        Act: Create CharmState from charm.
+        Assert: The custom fields hold the topology only when all the applications agree.
+        """
+        # Arrange
+        mock_charm = MagicMock()
+        mock_charm.load_config.return_value = CharmConfig(port=2801)
+
+        mock_loki_relation = MagicMock()
+        mock_loki_relation.loki_endpoints = []
+
+        mock_ingress_requirer = MagicMock()
+        mock_ingress_requirer.is_ready.return_value = False
+
+        mock_http_endpoint_provider = MagicMock()
+        mock_http_endpoint_provider.charm.model.relations = {
+            mock_http_endpoint_provider.relation_name: [MagicMock()] * relation_count
+        }
+        mock_http_endpoint_provider.get_topologies.return_value = {
+            application: HttpEndpointTopology(
+                model="edge", model_uuid="uuid", application=application, charm_name="falco"
+            )
+            for application in applications
+        }
+
+        # Act
+        state = CharmState.from_charm(
+            mock_charm, mock_loki_relation, mock_ingress_requirer, mock_http_endpoint_provider
+        )
+
+        # Assert
+        assert state.falcosidekick_custom_fields.get("juju_application") == expected_application
+        if expected_application:
+            assert state.falcosidekick_custom_fields == {
+                "juju_model": "edge",
+                "juju_model_uuid": "uuid",
+                "juju_application": "falco",
+                "juju_charm": "falco",
+            }
@@ -30,7 +30,9 @@ class TestTemplate:
         mock_container.isdir.return_value = True
 
         template = Template("falcosidekick.yaml.j2", Path("/etc/test.yaml"), mock_container)
-        context = {"charm_state": Mock(falcosidekick_listenport=2801)}
+        context = {
+            "charm_state": Mock(falcosidekick_listenport=2801, falcosidekick_custom_fields={})
+        }
 
         # Act: Install the template
         result = template.install(context)
@@ -51,7 +53,9 @@ class TestTemplate:
         mock_container = Mock(spec=ops.Container)
 
         template = Template("falcosidekick.yaml.j2", Path("/etc/test.yaml"), mock_container)
-        context = {"charm_state": Mock(falcosidekick_listenport=2801)}
+        context = {
+            "charm_state": Mock(falcosidekick_listenport=2801, falcosidekick_custom_fields={})
+        }
 
         # Mock the template to render specific content
         rendered_content = 'listenport: 2801\nlistenaddress: "" # ip address to bind falcosidekick to (default: "" meaning all addresses)\n'
@@ -80,7 +84,9 @@ class TestTemplate:
         mock_container.isdir.return_value = False
 
         template = Template("falcosidekick.yaml.j2", Path("/etc/new/test.yaml"), mock_container)
-        context = {"charm_state": Mock(falcosidekick_listenport=2801)}
+        context = {
+            "charm_state": Mock(falcosidekick_listenport=2801, falcosidekick_custom_fields={})
+        }
 
         # Act: Install the template
         result = template.install(context)
@@ -103,7 +109,9 @@ class TestTemplate:
         mock_container.isdir.return_value = True
 
         template = Template("falcosidekick.yaml.j2", Path("/etc/test.yaml"), mock_container)
-        context = {"charm_state": Mock(falcosidekick_listenport=2801)}
+        context = {
+            "charm_state": Mock(falcosidekick_listenport=2801, falcosidekick_custom_fields={})
+        }
 
         # Act: Install the template
         result = template.install(context)
@@ -163,7 +171,7 @@ class TestFalcosidekick:
             mock_container.replan.assert_called_once()
             mock_container.restart.assert_called_once_with("falcosidekick")
             mock_http_output_provider.update_config.assert_called_once_with(
-                path="/", scheme="https"
+                path="/", scheme="https", ca=mock_tls_requirer.get_ca.return_value
             )
 
     def test_configure_without_changes(self):
@@ -212,7 +220,7 @@ class TestFalcosidekick:
             mock_container.restart.assert_not_called()
             # But http output info should still be set
             mock_http_output_provider.update_config.assert_called_once_with(
-                path="/", scheme="https"
+                path="/", scheme="https", ca=mock_tls_requirer.get_ca.return_value
             )
 
     def test_configure_container_not_ready(self):
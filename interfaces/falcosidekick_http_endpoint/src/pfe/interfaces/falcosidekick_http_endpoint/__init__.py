@@ -7,6 +7,7 @@ from ._falcosidekick_http_endpoint import (
     HttpEndpointInvalidDataError,
     HttpEndpointProvider,
     HttpEndpointRequirer,
+    HttpEndpointTopology,
 )
 from ._version import __version__ as __version__
 
@@ -14,4 +15,5 @@ __all__ = [
     "HttpEndpointInvalidDataError",
     "HttpEndpointProvider",
     "HttpEndpointRequirer",
+    "HttpEndpointTopology",
 ]
@@ -1,7 +1,7 @@
 # Copyright 2026 Canonical Ltd.
 # See LICENSE file for licensing details.
 
-"""Source code of `pfe.interfaces.falcosidekick_http_endpoint` v1.0.0."""
+"""Source code of `pfe.interfaces.falcosidekick_http_endpoint` v1.2.0."""
 
 import logging
 
@@ -15,6 +15,23 @@ class _HttpEndpointDataModel(BaseModel):
     """Data model for falcosidekick_http_endpoint interface."""
 
     url: HttpUrl
+    ca: str | None = None
+
+
+class HttpEndpointTopology(BaseModel):
+    """Juju topology of the requirer application, attached by the provider to its events.
+
+    Attributes:
+        model: The model name.
+        model_uuid: The model UUID.
+        application: The application name.
+        charm_name: The charm name.
+    """
+
+    model: str
+    model_uuid: str
+    application: str
+    charm_name: str
 
 
 class HttpEndpointInvalidDataError(Exception):
@@ -33,6 +50,7 @@ class HttpEndpointProvider(Object):
         listen_port: int = 80,
         set_ports: bool = False,
         hostname: str | None = None,
+        ca: str | None = None,
     ) -> None:
         """Initialize an instance of HttpEndpointProvider class.
 
@@ -44,6 +62,9 @@ class HttpEndpointProvider(Object):
         beginning or depend on other factors (e.g. config option or certificate relation), the
         provider can updated those parameters later via `update_config` method.
 
+        When the endpoint serves a certificate signed by a private CA, the provider can publish
+        the CA certificate so that the requirer verifies the endpoint with it.
+
         The provider can also optionally set the port on the unit if specified, but the charm
         author is responsible for ensuring that the related unit is able communicate over that
         port.
@@ -56,6 +77,7 @@ class HttpEndpointProvider(Object):
             listen_port: The listen port to open [1, 65535].
             set_ports: Whether to set the unit port on the charm.
             hostname: Use hostname instead of ingress address if available.
+            ca: The PEM encoded CA certificate of the endpoint, if not publicly trusted.
         """
         super().__init__(charm, relation_name)
 
@@ -66,6 +88,7 @@ class HttpEndpointProvider(Object):
         self.listen_port = listen_port
         self.set_ports = set_ports
         self.hostname = hostname
+        self.ca = ca
 
         self.framework.observe(charm.on[relation_name].relation_changed, self._configure)
         self.framework.observe(charm.on.config_changed, self._configure)
@@ -110,7 +133,7 @@ class HttpEndpointProvider(Object):
         hostname = self.hostname or hostname
         url = f"{self.scheme}://{hostname}:{self.listen_port}/{self.path.lstrip('/')}"
         try:
-            falcosidekick_http_endpoint = _HttpEndpointDataModel(url=HttpUrl(url))
+            falcosidekick_http_endpoint = _HttpEndpointDataModel(url=HttpUrl(url), ca=self.ca)
             for relation in relations:
                 relation.save(falcosidekick_http_endpoint, self.charm.app)
                 logger.info(
@@ -133,6 +156,7 @@ class HttpEndpointProvider(Object):
         listen_port: int,
         set_ports: bool = False,
         hostname: str | None = None,
+        ca: str | None = None,
     ) -> None:
         """Update http endpoint configuration.
 
@@ -142,6 +166,7 @@ class HttpEndpointProvider(Object):
             listen_port: The listen port to open [1, 65535].
             set_ports: Whether to set the unit ports on the charm.
             hostname: Use hostname instead of ingress address if available.
+            ca: The PEM encoded CA certificate of the endpoint, if not publicly trusted.
 
         Raises:
             HttpEndpointInvalidDataError if not valid scheme.
@@ -151,8 +176,26 @@ class HttpEndpointProvider(Object):
         self.listen_port = listen_port
         self.set_ports = set_ports
         self.hostname = hostname
+        self.ca = ca
         self._update_config()
 
+    def get_topologies(self) -> dict[str, HttpEndpointTopology]:
+        """Get the Juju topologies published by the related applications.
+
+        Returns:
+            A dictionary of app names to the Juju topologies they published, skipping the
+            applications publishing none.
+        """
+        topologies: dict[str, HttpEndpointTopology] = {}
+        for relation in self.charm.model.relations[self.relation_name]:
+            if relation.app is None or not relation.data[relation.app].get("model_uuid"):
+                continue
+            try:
+                topologies[relation.app.name] = relation.load(HttpEndpointTopology, relation.app)
+            except ValidationError as e:
+                logger.error("Invalid topology data in relation %s: %s", relation.id, e)
+        return topologies
+
 
 class HttpEndpointRequirer(Object):
     """The falcosidekick_http_endpoint interface requirer."""
@@ -196,3 +239,44 @@ class HttpEndpointRequirer(Object):
             except ValidationError as e:
                 logger.error("Invalid URL endpoint data in relation %s: %s", relation.id, e)
         return falcosidekick_http_endpoints
+
+    def get_app_cas(self) -> dict[str, str]:
+        """Get the CA certificates of the HTTP endpoints from all related applications.
+
+        Returns:
+            A dictionary of app names to the PEM encoded CA certificates of their HTTP endpoints,
+            for the applications publishing one.
+        """
+        cas: dict[str, str] = {}
+        for relation in self.charm.model.relations[self.relation_name]:
+            if relation.app is None or not relation.data[relation.app].get("ca"):
+                continue
+            try:
+                data = relation.load(_HttpEndpointDataModel, relation.app)
+            except ValidationError as e:
+                logger.error("Invalid CA endpoint data in relation %s: %s", relation.id, e)
+                continue
+            if data.ca:
+                cas[relation.app.name] = data.ca
+        return cas
+
+    def publish_topology(self, topology: HttpEndpointTopology | None) -> None:
+        """Publish the Juju topology of the application in all relations idempotently.
+
+        The provider attaches the published topology to the events it receives, so that the
+        requirer units do not need to send it with every event. Only the leader unit publishes.
+
+        Args:
+            topology: The Juju topology to publish, or None to withdraw it.
+        """
+        if not self.charm.unit.is_leader():
+            logger.debug("Only leader unit can set topology information")
+            return
+
+        for relation in self.charm.model.relations[self.relation_name]:
+            if topology is None:
+                for field in HttpEndpointTopology.model_fields:
+                    relation.data[self.charm.app].pop(field, None)
+                continue
+            relation.save(topology, self.charm.app)
+            logger.info("Published topology to relation %s: %s", relation.id, topology)
@@ -3,6 +3,7 @@
 
 """Tests for FalcosidekickHttpEndpointProvider and FalcosidekickHttpEndpointRequirer."""
 
+import json
 from typing import Any
 from unittest.mock import patch
 
@@ -13,9 +14,19 @@ from conftest import ProviderCharm, RequirerCharm
 
 from pfe.interfaces.falcosidekick_http_endpoint._falcosidekick_http_endpoint import (
     HttpEndpointInvalidDataError,
+    HttpEndpointTopology,
     _HttpEndpointDataModel,
 )
 
+CA_CERT = "-----BEGIN CERTIFICATE-----\nMIIB\n-----END CERTIFICATE-----\n"
+
+TOPOLOGY_DATA = {
+    "model": '"edge"',
+    "model_uuid": '"5e8c1a3f-62d4-4f8e-9c1b-3a2d7e6f9b10"',
+    "application": '"falco"',
+    "charm_name": '"falco"',
+}
+
 
 class TestFalcosidekickHttpEndpointProvider:
     """Tests for FalcosidekickHttpEndpointProvider."""
@@ -190,6 +201,61 @@ class TestFalcosidekickHttpEndpointProvider:
             relations = manager.charm.model.relations["falcosidekick-http-endpoint"]
             assert len(relations) == 0
 
+    def test_update_config_publishes_ca(
+        self,
+        provider_charm_meta: dict[str, Any],
+        provider_charm_relation_1: ops.testing.Relation,
+    ):
+        """Test that the provider publishes the CA certificate of the endpoint when given."""
+        ctx = ops.testing.Context(
+            ProviderCharm,
+            meta=provider_charm_meta,
+        )
+
+        state_in = ops.testing.State(leader=True, relations=[provider_charm_relation_1])
+
+        with ctx(ctx.on.relation_changed(provider_charm_relation_1), state_in) as manager:
+            manager.run()
+            manager.charm.provider.update_config(
+                path="/", scheme="https", listen_port=2801, ca=CA_CERT
+            )
+
+            relation = manager.charm.model.relations["falcosidekick-http-endpoint"][0]
+            data = relation.load(_HttpEndpointDataModel, manager.charm.app)
+            assert data.ca == CA_CERT
+
+    def test_get_topologies(
+        self,
+        provider_charm_meta: dict[str, Any],
+        provider_charm_relation_1: ops.testing.Relation,
+        provider_charm_relation_2: ops.testing.Relation,
+    ):
+        """Test that the provider returns the topologies of the applications publishing one."""
+        ctx = ops.testing.Context(
+            ProviderCharm,
+            meta=provider_charm_meta,
+        )
+
+        relation_1 = provider_charm_relation_1
+        relation_1.remote_app_data.update(TOPOLOGY_DATA)
+
+        state_in = ops.testing.State(
+            relations=[relation_1, provider_charm_relation_2],
+        )
+
+        with ctx(ctx.on.relation_changed(relation_1), state_in) as manager:
+            manager.run()
+
+            topologies = manager.charm.provider.get_topologies()
+            assert topologies == {
+                "remote": HttpEndpointTopology(
+                    model="edge",
+                    model_uuid="5e8c1a3f-62d4-4f8e-9c1b-3a2d7e6f9b10",
+                    application="falco",
+                    charm_name="falco",
+                )
+            }
+
 
 class TestFalcosidekickHttpEndpointRequirer:
     """Tests for FalcosidekickHttpEndpointRequirer."""
@@ -251,6 +317,31 @@ class TestFalcosidekickHttpEndpointRequirer:
             urls = manager.charm.requirer.get_app_urls()
             assert len(urls) == 0
 
+    def test_get_app_cas(
+        self,
+        requirer_charm_meta: dict[str, Any],
+        requirer_charm_relation_1: ops.testing.Relation,
+        requirer_charm_relation_2: ops.testing.Relation,
+    ):
+        """Test that the requirer returns the CA certificates of the endpoints publishing one."""
+        ctx = ops.testing.Context(
+            RequirerCharm,
+            meta=requirer_charm_meta,
+        )
+
+        relation_2 = requirer_charm_relation_2
+        relation_2.remote_app_data.update({"ca": json.dumps(CA_CERT)})
+
+        state_in = ops.testing.State(
+            relations=[requirer_charm_relation_1, relation_2],
+        )
+
+        with ctx(ctx.on.relation_changed(relation_2), state_in) as manager:
+            manager.run()
+
+            assert manager.charm.requirer.get_app_cas() == {"remote_2": CA_CERT}
+            assert manager.charm.requirer.get_app_urls()["remote_2"] == "https://10.0.1.1:8443/"
+
     def test_no_relations_returns_no_endpoint_data(self, requirer_charm_meta: dict[str, Any]):
         """Test that the requirer handles no relations gracefully."""
         ctx = ops.testing.Context(
@@ -267,3 +358,58 @@ class TestFalcosidekickHttpEndpointRequirer:
 
             # Should return an empty list when there are no relations
             assert len(manager.charm.requirer.get_app_urls()) == 0
+
+    def test_publish_topology(
+        self,
+        requirer_charm_meta: dict[str, Any],
+        requirer_charm_relation_1: ops.testing.Relation,
+    ):
+        """Test that the leader requirer publishes and withdraws its topology."""
+        ctx = ops.testing.Context(
+            RequirerCharm,
+            meta=requirer_charm_meta,
+        )
+        topology = HttpEndpointTopology(
+            model="edge",
+            model_uuid="5e8c1a3f-62d4-4f8e-9c1b-3a2d7e6f9b10",
+            application="falco",
+            charm_name="falco",
+        )
+
+        state_in = ops.testing.State(leader=True, relations=[requirer_charm_relation_1])
+
+        with ctx(ctx.on.relation_changed(requirer_charm_relation_1), state_in) as manager:
+            manager.run()
+            relation = manager.charm.model.relations["falcosidekick-http-endpoint"][0]
+
+            manager.charm.requirer.publish_topology(topology)
+            assert relation.load(HttpEndpointTopology, manager.charm.app) == topology
+
+            manager.charm.requirer.publish_topology(None)
+            assert not relation.data[manager.charm.app]
+
+    def test_non_leader_does_not_publish_topology(
+        self,
+        requirer_charm_meta: dict[str, Any],
+        requirer_charm_relation_1: ops.testing.Relation,
+    ):
+        """Test that non-leader requirer units do not publish their topology."""
+        ctx = ops.testing.Context(
+            RequirerCharm,
+            meta=requirer_charm_meta,
+        )
+
+        state_in = ops.testing.State(leader=False, relations=[requirer_charm_relation_1])
+
+        with (
+            patch("ops.Relation.save") as mock_save,
+            ctx(ctx.on.relation_changed(requirer_charm_relation_1), state_in) as manager,
+        ):
+            manager.run()
+            manager.charm.requirer.publish_topology(
+                HttpEndpointTopology(
+                    model="edge", model_uuid="uuid", application="falco", charm_name="falco"
+                )
+            )
+
+            mock_save.assert_not_called()